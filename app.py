@@ -1,362 +1,84 @@
 import os
-from pickle import TRUE
-from typing import Container
+import sys
+import time
+import shutil
+import tempfile
+import logging
+import functools
+import contextlib
+import statistics
+from collections import ChainMap, deque
 import streamlit as st
-
-# ReportLab imports
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.platypus import (
-    SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer,
-    KeepInFrame
-)
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-
-import io
-import fitz  # PyMuPDF
-import configparser
+from streamlit.errors import StreamlitAPIException
+
+# PDF generation lives in coa_pdf so it can be used without the UI. The
+# modules imported here are light: ReportLab (coa_pdf) and PyMuPDF
+# (coa_preview) are imported on first use, mostly on the render workers.
+from coa_cache import pdf_cache
+from coa_jobs import RenderQueue
+from coa_products import ProductMaster
+from coa_archive import COAArchive, fts_query
+from coa_record import COARecord
+from coa_timing import StageTimer
+from coa_config import (LAYOUTS, DEFAULT_LAYOUT, THUMB_DPI, DEFAULT_DPI, DEFAULT_FORMAT, FORMATS, WARM_UP,
+                        EXPORT_DIR, EXPORT_MAX_AGE)
+from coa_catalogue import load_catalogue, FIELDS
+from coa_compliance import evaluate
+
+_run_start = time.perf_counter()
+logger = logging.getLogger("coa.app")
+RENDER_HISTORY = 10
 
 # -----------------------------
 # INITIALIZE SESSION STATE
 # -----------------------------
-if "Physical_rows" not in st.session_state:
-    st.session_state["Physical_rows"] = []
-if "Others_rows" not in st.session_state:
-    st.session_state["Others_rows"] = []
-if "Assays_rows" not in st.session_state:
-    st.session_state["Assays_rows"] = []
-if "Pesticides_rows" not in st.session_state:
-    st.session_state["Pesticides_rows"] = []
-if "ResidualSolvent_rows" not in st.session_state:
-    st.session_state["ResidualSolvent_rows"] = []
-if "MicrobiologicalProfile_rows" not in st.session_state:
-    st.session_state["MicrobiologicalProfile_rows"] = []
+catalogue = load_catalogue()
+
+for section in catalogue.sections:
+    if section.state_key not in st.session_state:
+        st.session_state[section.state_key] = []
 if "Product_rows" not in st.session_state:
     st.session_state["Product_rows"] = []
 
-# Initialize the configparser
-config = configparser.ConfigParser()
-config.read('.streamlit/config.toml')
-theme = config.get('settings', 'theme', fallback='default')
-
 st.set_page_config(page_title="Tru Herb COA PDF Generator", layout="wide")
 
-
-def header_footer(canvas, doc):
-    canvas.saveState()
-    logo_path = os.path.join(os.getcwd(), "images", "tru_herb_logo.png")
-    footer_path = os.path.join(os.getcwd(), "images", "footer.png")
-
-    if os.path.exists(logo_path):
-        canvas.drawImage(logo_path, x=250, y=A4[1] - 55, width=100, height=50)
-    if os.path.exists(footer_path):
-        canvas.drawImage(footer_path, x=50, y=5, width=500, height=80)
-    canvas.restoreState()
-
-
-def generate_pdf(data):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        topMargin=50,
-        bottomMargin=80
-    )
-    styles = getSampleStyleSheet()
-
-    title_style = ParagraphStyle(
-        'title_style',
-        fontSize=12,
-        spaceAfter=1,
-        alignment=1,
-        fontName='Times-Bold'
+with st.sidebar:
+    st.subheader("Preview settings")
+    preview_dpi = st.slider("Preview DPI", min_value=50, max_value=200, value=DEFAULT_DPI, step=10)
+    preview_format = st.selectbox("Preview image format", options=FORMATS,
+                                  index=FORMATS.index(DEFAULT_FORMAT))
+    st.subheader("Layout")
+    pdf_layout = st.selectbox("Page layout", options=LAYOUTS, index=LAYOUTS.index(DEFAULT_LAYOUT),
+                              help="'shrink' shrinks the COA until it fits one page; 'fit' scales the page "
+                                   "in a single pass and switches to multiple pages when the text would "
+                                   "become too small; 'paged' never scales and repeats the table header "
+                                   "on every page.")
+    st.subheader("Input")
+    batch_input = st.toggle(
+        "Batch edits per section", value=os.environ.get("COA_BATCH_INPUT", "") == "1",
+        help="Group each section into a form that is applied with one button instead of "
+             "rerunning after every field. Unapplied edits are not included in Preview/Compile."
     )
-    title_style1 = ParagraphStyle(
-        'title_style1',
-        fontSize=10,
-        spaceAfter=0,
-        alignment=1,
-        fontName='Times-Bold'
-    )
-    normal_style = styles['BodyText']
-    normal_style.fontName = 'Times-Roman'
-    normal_style.alignment = 0  # left aligned
-
-    # NEW: Define a style for the Method column that center aligns the text.
-    method_style = ParagraphStyle('method_style', parent=normal_style, alignment=1)
-    
-    style_for_sections = styles["Normal"]
-
-    elements = []
-    elements.append(Spacer(1, 3))
-    elements.append(Paragraph("CERTIFICATE OF ANALYSIS", title_style))
-    elements.append(Paragraph(data.get('product_name', '').upper(), title_style))
-    elements.append(Spacer(1, 3))
-
-    # ----------------------------------------------------------------
-    # Build Product Info table, skipping truly empty fields
-    # ----------------------------------------------------------------
-    product_info = []
-
-    def maybe_add_product_row(label, value, italic=False, bold=False):
-        text_str = value.strip() if value else ""
-        if text_str:
-            if italic:
-                text_str = f"<i>{text_str}</i>"
-            if bold:
-                text_str = f"<b>{text_str}</b>"
-            product_info.append([Paragraph(f"<b>{label}</b>"), Paragraph(text_str, normal_style)])
-
-    maybe_add_product_row("Product Name", data.get('product_name', ''), bold=True)
-    maybe_add_product_row("Product Code", data.get('product_code', ''))
-    maybe_add_product_row("Batch No.", data.get('batch_no', ''))
-    maybe_add_product_row("Date of Manufacturing", data.get('manufacturing_date', ''))
-    maybe_add_product_row("Date of Reanalysis", data.get('reanalysis_date', ''))
-    maybe_add_product_row("Botanical Name", data.get('botanical_name', ''), italic=True)
-    maybe_add_product_row("Extraction Ratio", data.get('extraction_ratio', ''))
-    maybe_add_product_row("Extraction Solvents", data.get('solvent', ''))
-    maybe_add_product_row("Plant Parts", data.get('plant_part', ''))
-    maybe_add_product_row("CAS No.", data.get('cas_no', ''))
-    maybe_add_product_row("Chemical Name", data.get('chemical_name', ''))
-    maybe_add_product_row("Quantity", data.get('quantity', ''))
-    # Add dynamic additional product info rows (if any)
-    for row in data.get("product_additional_rows", []):
-        maybe_add_product_row(row[0], row[1])
-    maybe_add_product_row("Country of Origin", data.get('origin', ''))
-
-    if product_info:
-        product_table = Table(product_info, colWidths=[140, 360])
-        product_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ('FONTNAME', (0, 0), (-1, -1), 'Times-Roman'),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('WORDWRAP', (0, 0), (-1, -1), 'LTR'),
-        ]))
-        elements.append(product_table)
-        elements.append(Spacer(1, 0))
-
-    # ----------------------------------------------------------------
-    # SPECIFICATIONS TABLE
-    # ----------------------------------------------------------------
-    
-    header_style = ParagraphStyle(
-        'header_style',
-        parent=styles['Normal'],
-        alignment=1,  # center aligned
-        fontName='Helvetica-Bold',
-        fontSize=10
-    )
-    
-    spec_headers = [
-        Paragraph("Parameter", header_style),
-        Paragraph("Specification", header_style),
-        Paragraph("Result", header_style),
-        Paragraph("Method", header_style)
-    ]
-    spec_data = [spec_headers]
-    heading_rows = []
-    current_row_index = 1
-
-    def combine_section(section_key, base_rows):
-        extra_rows = data.get(section_key, [])
-        return [row for row in base_rows if row] + [r for r in extra_rows if r]
-
-    physical_base = [
-        ("Description", data['description_spec'], data['description_result'], data['description_method'])
-            if data['description_spec'] and data['description_result'] and data['description_method'] else None,
-        ("Identification", data['identification_spec'], data['identification_result'], data['identification_method'])
-            if data['identification_spec'] and data['identification_result'] and data['identification_method'] else None,
-        ("Loss on Drying", data['loss_on_drying_spec'], data['loss_on_drying_result'], data['loss_on_drying_method'])
-            if data['loss_on_drying_spec'] and data['loss_on_drying_result'] and data['loss_on_drying_method'] else None,
-        ("Moisture", data['moisture_spec'], data['moisture_result'], data['moisture_method'])
-            if data['moisture_spec'] and data['moisture_result'] and data['moisture_method'] else None,
-        ("Particle Size", data['particle_size_spec'], data['particle_size_result'], data['particle_size_method'])
-            if data['particle_size_spec'] and data['particle_size_result'] and data['particle_size_method'] else None,
-        ("Ash Contents", data['ash_contents_spec'], data['ash_contents_result'], data['ash_contents_method'])
-            if data['ash_contents_spec'] and data['ash_contents_result'] and data['ash_contents_method'] else None,
-        ("Residue on Ignition", data['residue_on_ignition_spec'], data['residue_on_ignition_result'],
-         data['residue_on_ignition_method'])
-            if data['residue_on_ignition_spec'] and data['residue_on_ignition_result'] and data['residue_on_ignition_method'] else None,
-        ("Bulk Density", data['bulk_density_spec'], data['bulk_density_result'], data['bulk_density_method'])
-            if data['bulk_density_spec'] and data['bulk_density_result'] and data['bulk_density_method'] else None,
-        ("Tapped Density", data['tapped_density_spec'], data['tapped_density_result'], data['tapped_density_method'])
-            if data['tapped_density_spec'] and data['tapped_density_result'] and data['tapped_density_method'] else None,
-        ("Solubility", data['solubility_spec'], data['solubility_result'], data['solubility_method'])
-            if data['solubility_spec'] and data['solubility_result'] and data['solubility_method'] else None,
-        ("pH", data['ph_spec'], data['ph_result'], data['ph_method'])
-            if data['ph_spec'] and data['ph_result'] and data['ph_method'] else None,
-        ("Chlorides of NaCl", data['chlorides_nacl_spec'], data['chlorides_nacl_result'], data['chlorides_nacl_method'])
-            if data['chlorides_nacl_spec'] and data['chlorides_nacl_result'] and data['chlorides_nacl_method'] else None,
-        ("Sulphates", data['sulphates_spec'], data['sulphates_result'], data['sulphates_method'])
-            if data['sulphates_spec'] and data['sulphates_result'] and data['sulphates_method'] else None,
-        ("Fats", data['fats_spec'], data['fats_result'], data['fats_method'])
-            if data['fats_spec'] and data['fats_result'] and data['fats_method'] else None,
-        ("Protein", data['protein_spec'], data['protein_result'], data['protein_method'])
-            if data['protein_spec'] and data['protein_result'] and data['protein_method'] else None,
-        ("Total IgG", data['total_ig_g_spec'], data['total_ig_g_result'], data['total_ig_g_method'])
-            if data['total_ig_g_spec'] and data['total_ig_g_result'] and data['total_ig_g_method'] else None,
-        ("Sodium", data['sodium_spec'], data['sodium_result'], data['sodium_method'])
-            if data['sodium_spec'] and data['sodium_result'] and data['sodium_method'] else None,
-        ("Gluten", data['gluten_spec'], data['gluten_result'], data['gluten_method'])
-            if data['gluten_spec'] and data['gluten_result'] and data['gluten_method'] else None,
-    ]
-    others_base = [
-        ("Lead", data['lead_spec'], data['lead_result'], data['lead_method'])
-            if data['lead_spec'] and data['lead_result'] and data['lead_method'] else None,
-        ("Cadmium", data['cadmium_spec'], data['cadmium_result'], data['cadmium_method'])
-            if data['cadmium_spec'] and data['cadmium_result'] and data['cadmium_method'] else None,
-        ("Arsenic", data['arsenic_spec'], data['arsenic_result'], data['arsenic_method'])
-            if data['arsenic_spec'] and data['arsenic_result'] and data['arsenic_method'] else None,
-        ("Mercury", data['mercury_spec'], data['mercury_result'], data['mercury_method'])
-            if data['mercury_spec'] and data['mercury_result'] and data['mercury_method'] else None,
-    ]
-    assays_base = [
-        ("Assays", data['assays_spec'], data['assays_result'], data['assays_method'])
-            if data['assays_spec'] and data['assays_result'] and data['assays_method'] else None,
-    ]
-    pesticides_base = [
-        ("Pesticide", data['pesticide_spec'], data['pesticide_result'], data['pesticide_method'])
-            if data['pesticide_spec'] and data['pesticide_result'] and data['pesticide_method'] else None,
-    ]
-    residual_solvent_base = [
-        ("Residual Solvent", data['residual_solvent_spec'], data['residual_solvent_result'], data['residual_solvent_method'])
-            if data['residual_solvent_spec'] and data['residual_solvent_result'] and data['residual_solvent_method'] else None,
-    ]
-    microbio_base = [
-        ("Total Plate Count", data['total_plate_count_spec'], data['total_plate_count_result'], data['total_plate_count_method'])
-            if data['total_plate_count_spec'] and data['total_plate_count_result'] and data['total_plate_count_method'] else None,
-        ("Yeasts & Mould Count", data['yeasts_mould_spec'], data['yeasts_mould_result'], data['yeasts_mould_method'])
-            if data['yeasts_mould_spec'] and data['yeasts_mould_result'] and data['yeasts_mould_method'] else None,
-        ("Salmonella", data['salmonella_spec'], data['salmonella_result'], data['salmonella_method'])
-            if data['salmonella_spec'] and data['salmonella_result'] and data['salmonella_method'] else None,
-        ("Escherichia coli", data['e_coli_spec'], data['e_coli_result'], data['e_coli_method'])
-            if data['e_coli_spec'] and data['e_coli_result'] and data['e_coli_method'] else None,
-        ("Coliforms", data['coliforms_spec'], data['coliforms_result'], data['coliforms_method'])
-            if data['coliforms_spec'] and data['coliforms_result'] and data['coliforms_method'] else None,
-    ]
-
-    sections = {
-        "Physical": combine_section("physical_extra_rows", physical_base),
-        "Others": combine_section("others_extra_rows", others_base),
-        "Assays": combine_section("assays_extra_rows", assays_base),
-        "Pesticides": combine_section("pesticides_extra_rows", pesticides_base),
-        "Residual Solvent": combine_section("residual_solvent_extra_rows", residual_solvent_base),
-        "Microbiological Profile": combine_section("microbio_extra_rows", microbio_base),
-    }
-
-    for section_name, rows in sections.items():
-        if rows:
-            spec_data.append([Paragraph(f"<b>{section_name}</b>", style_for_sections), "", "", ""])
-            heading_rows.append(len(spec_data) - 1)
-            for param_tuple in rows:
-                # Use method_style (center aligned) for column 3, normal_style for others
-                row_cells = [
-                    Paragraph(str(cell), method_style) if idx == 3 else Paragraph(str(cell), normal_style)
-                    for idx, cell in enumerate(param_tuple)
-                ]
-                spec_data.append(row_cells)
-
-    # Remarks
-    remarks_text = ("Since the product is derived from natural origin, there is likely to be minor color "
-                    "variation because of the geographical and seasonal variations of the raw material")
-    end_text = "REMARKS: COMPLIES WITH IN HOUSE SPECIFICATIONS"
-    spec_data.append([Paragraph(remarks_text, normal_style), "", "", ""])
-    last_remarks_row = len(spec_data) - 1
-    spec_data.append([Paragraph(end_text, ParagraphStyle('bold_center',
-                                                         parent=styles['Normal'],
-                                                         fontName='Helvetica-Bold',
-                                                         alignment=1)),
-                      "", "", ""])
-    final_remark_row = len(spec_data) - 1
-
-    total_width = 500
-    col_widths = [total_width * 0.23,
-                  total_width * 0.39,
-                  total_width * 0.18,
-                  total_width * 0.20]
-    
-    spec_table = Table(spec_data, colWidths=col_widths)
-
-    spec_table_style = [
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('FONTNAME', (0, 0), (-1, -1), 'Times-Roman'),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('WORDWRAP', (0, 0), (-1, -1), 'LTR'),
-    ]
-    # (The table style alignment for column 3 below is now optional since our Paragraph style takes precedence.)
-    spec_table_style.append(('ALIGN', (3, 0), (3, -1), 'CENTER'))
-    
-    for heading_row in heading_rows:
-        spec_table_style.append(('SPAN', (0, heading_row), (-1, heading_row)))
-    spec_table_style.append(('SPAN', (0, last_remarks_row), (-1, last_remarks_row)))
-    spec_table_style.append(('SPAN', (0, final_remark_row), (-1, final_remark_row)))
-
-    spec_table.setStyle(TableStyle(spec_table_style))
-    elements.append(spec_table)
-    elements.append(Spacer(1, 2))
-
-    # Declaration
-    elements.append(Paragraph("Declaration", title_style1))
-    declaration_data = [
-        [
-            "GMO Status:",
-            Paragraph("Free from GMO", normal_style),
-            "",
-            "Allergen statement:",
-            Paragraph(f"{data.get('allergen_statement','Free from allergen')}", normal_style)
-        ],
-        [
-            "Irradiation status:",
-            Paragraph("Non – Irradiated", normal_style),
-            "",
-            "Storage condition:",
-            Paragraph("At room temperature", normal_style)
-        ],
-        [
-            "Prepared by",
-            Paragraph("Executive – QC", normal_style),
-            "",
-            "Approved by",
-            Paragraph("Head-QC/QA", normal_style)
-        ]
-    ]
-    declaration_table = Table(declaration_data, colWidths=[80, 150, 75, 100, 95])
-    declaration_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('ALIGN', (0, 0), (1, -1), 'LEFT'),
-        ('ALIGN', (3, 0), (4, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('WORDWRAP', (0, 0), (-1, -1), 'LTR'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ('TOPPADDING', (0, 0), (-1, -1), 0),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ('SPAN', (2, 0), (2, 2)),
-    ]))
-    elements.append(declaration_table)
-    elements.append(Spacer(1, 3))
-
-    # Compute available dimensions from the page size and margins
-    available_width = A4[0] - doc.leftMargin - doc.rightMargin
-    available_height = A4[1] - doc.topMargin - doc.bottomMargin
-
-    # Use KeepInFrame with improved fakeWidth:
-    kiframe = KeepInFrame(
-        maxWidth=available_width,
-        maxHeight=available_height,
-        content=elements,
-        mode='shrink',            # or any mode you prefer
-        fakeWidth=available_width   # now dynamically computed instead of a fixed 1900
-    )
-    elements = [kiframe]
+    with st.expander("Rerun timings"):
+        timings = st.session_state.get("rerun_timings", ())
+        by_scope = {}
+        for scope, seconds in timings:
+            by_scope.setdefault(scope, []).append(seconds * 1000)
+        for scope, samples in by_scope.items():
+            st.caption(f"{scope}: last {samples[-1]:.0f} ms, median {statistics.median(samples):.0f} ms "
+                       f"({len(samples)} runs)")
+    if st.toggle("Show render timings", value=False,
+                 help=f"Per-stage breakdown (ms) of the last {RENDER_HISTORY} renders in this session."):
+        renders = st.session_state.get("render_timings", ())
+        if renders:
+            st.dataframe(
+                [{"job": r["job"], "layout": r["layout"], "total": r["total_ms"], **r["stages_ms"]}
+                 for r in reversed(renders)],
+                hide_index=True,
+            )
+        else:
+            st.caption("No renders yet.")
 
-    doc.build(elements, onFirstPage=header_footer, onLaterPages=header_footer)
-    buffer.seek(0)
-    return buffer
 
 # ----------------------------------------------------------------------------
 # HELPER to initialize a session_state key if not present
@@ -365,1099 +87,562 @@ def init_ss(key, default):
     if key not in st.session_state:
         st.session_state[key] = default
 
+
 # ----------------------------------------------------------------------------
-# STREAMLIT UI
+# RERUN TIMING
+# Each form section is an st.fragment, so an edit only re-executes that
+# section. Wall time of full runs and fragment runs is logged and kept for
+# the sidebar.
 # ----------------------------------------------------------------------------
+def record_rerun(scope, seconds):
+    if "rerun_timings" not in st.session_state:
+        st.session_state["rerun_timings"] = deque(maxlen=200)
+    st.session_state["rerun_timings"].append((scope, seconds))
+    logger.info("rerun scope=%r seconds=%.4f", scope, seconds)
 
-col1, col2 = st.columns(2)
-with col1:
-    st.title("Tru Herb COA PDF Generator")
-    st.header("Product Information")
-
-    # 2-col for Product Info
-    row1_col1, row1_col2 = st.columns(2)
-    product_name = row1_col1.text_input("Product Name", placeholder="X")
-    product_code = row1_col2.text_input("Product Code", placeholder="X")
-
-    row2_col1, row2_col2 = st.columns(2)
-    batch_no = row2_col1.text_input("Batch No.", placeholder="X")
-    manufacturing_date = row2_col2.text_input("Date of Manufacturing", placeholder="X")
-
-    row3_col1, row3_col2 = st.columns(2)
-    reanalysis_date = row3_col1.text_input("Date of Reanalysis", placeholder="X")
-    botanical_name = row3_col2.text_input("Botanical Name", placeholder="X")
-
-    row4_col1, row4_col2 = st.columns(2)
-    extraction_ratio = row4_col1.text_input("Extraction Ratio", placeholder="X")
-    solvent = row4_col2.text_input("Extraction Solvents", placeholder="X")
-
-    row5_col1, row5_col2 = st.columns(2)
-    plant_part = row5_col1.text_input("Plant Parts", placeholder="X")
-    cas_no = row5_col2.text_input("CAS No.", placeholder="X")
 
-    row6_col1, row6_col2 = st.columns(2)
-    chemical_name = row6_col1.text_input("Chemical Name", placeholder="X")
-    quantity = row6_col2.text_input("Quantity", placeholder="X")
-
-    st.markdown("#### Add Additional Product Info Rows")
-    for i, row_data in enumerate(st.session_state["Product_rows"]):
-        col_label, col_value, col_del = st.columns([3, 7, 2])
-        st.session_state["Product_rows"][i]["label"] = col_label.text_input(
-            f"Additional Label {i+1}",
-            row_data.get("label", ""),
-            key=f"ProductLabel_{i}"
-        )
-        st.session_state["Product_rows"][i]["value"] = col_value.text_input(
-            f"Additional Value {i+1}",
-            row_data.get("value", ""),
-            key=f"ProductValue_{i}"
-        )
-        if col_del.button("Delete", key=f"del_product_{i}"):
-            st.session_state["Product_rows"].pop(i)
-            st.rerun()
-
-    if st.button("Add New Additional Product Info Row"):
-        st.session_state["Product_rows"].append({"label": "", "value": ""})
+def rerun_fragment():
+    # Only valid while the fragment itself is rerunning; a click that arrives
+    # with a full app run (or under AppTest) falls back to a full rerun.
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
         st.rerun()
 
-    origin = st.text_input("Country of Origin", value="India")
 
-    # ---------- SPECIFICATIONS -----------
-    st.header("Specifications")
-
-    # -----------------------------------------------------------------
-    # PHYSICAL
-    # -----------------------------------------------------------------
-    st.subheader("Physical")
-
-    # For each "base" physical row, we'll store in session_state so we can clear it
-    init_ss("description_spec", "X with Characteristic taste and odour")
-    init_ss("description_result", "Compiles")
-    init_ss("description_method", "Physical")
-
-    phys1_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["description_spec"] = phys1_cols[0].text_area(
-    "Spec for Description",
-    value=st.session_state["description_spec"],
-    height = 68  # Adjust as needed
-    )
-    st.session_state["description_result"] = phys1_cols[1].text_input("Result for Description",
-        value=st.session_state["description_result"])
-    st.session_state["description_method"] = phys1_cols[2].text_input("Method for Description",
-        value=st.session_state["description_method"])
-    if phys1_cols[3].button("Delete", key="del_desc"):
-        st.session_state["description_spec"] = ""
-        st.session_state["description_result"] = ""
-        st.session_state["description_method"] = ""
-        st.rerun()
+def timed_fragment(fn):
+    @st.fragment
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # Sections share one function, so label them by the section name.
+            scope = args[0].name if args and hasattr(args[0], "name") else fn.__name__
+            record_rerun(f"fragment:{scope}", time.perf_counter() - start)
+    return wrapper
 
-    init_ss("identification_spec", "To comply by TLC")
-    init_ss("identification_result", "Compiles")
-    init_ss("identification_method", "TLC")
-
-    phys2_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["identification_spec"] = phys2_cols[0].text_input("Spec for Identification",
-        value=st.session_state["identification_spec"])
-    st.session_state["identification_result"] = phys2_cols[1].text_input("Result for Identification",
-        value=st.session_state["identification_result"])
-    st.session_state["identification_method"] = phys2_cols[2].text_input("Method for Identification",
-        value=st.session_state["identification_method"])
-    if phys2_cols[3].button("Delete", key="del_ident"):
-        st.session_state["identification_spec"] = ""
-        st.session_state["identification_result"] = ""
-        st.session_state["identification_method"] = ""
-        st.rerun()
-
-    init_ss("loss_on_drying_spec", "Not more than X")
-    init_ss("loss_on_drying_result", "")
-    init_ss("loss_on_drying_method", "USP<731>")
-
-    phys3_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["loss_on_drying_spec"] = phys3_cols[0].text_input("Spec for Loss on Drying",
-        value=st.session_state["loss_on_drying_spec"])
-    st.session_state["loss_on_drying_result"] = phys3_cols[1].text_input("Result for Loss on Drying",
-        value=st.session_state["loss_on_drying_result"], placeholder="X")
-    st.session_state["loss_on_drying_method"] = phys3_cols[2].text_input("Method for Loss on Drying",
-        value=st.session_state["loss_on_drying_method"])
-    if phys3_cols[3].button("Delete", key="del_lod"):
-        st.session_state["loss_on_drying_spec"] = ""
-        st.session_state["loss_on_drying_result"] = ""
-        st.session_state["loss_on_drying_method"] = ""
-        st.rerun()
 
-    init_ss("moisture_spec", "Not more than X")
-    init_ss("moisture_result", "")
-    init_ss("moisture_method", "USP<921>")
-
-    phys4_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["moisture_spec"] = phys4_cols[0].text_input("Spec for Moisture",
-        value=st.session_state["moisture_spec"])
-    st.session_state["moisture_result"] = phys4_cols[1].text_input("Result for Moisture",
-        value=st.session_state["moisture_result"], placeholder="X")
-    st.session_state["moisture_method"] = phys4_cols[2].text_input("Method for Moisture",
-        value=st.session_state["moisture_method"])
-    if phys4_cols[3].button("Delete", key="del_moist"):
-        st.session_state["moisture_spec"] = ""
-        st.session_state["moisture_result"] = ""
-        st.session_state["moisture_method"] = ""
-        st.rerun()
+# ----------------------------------------------------------------------------
+# FORM-BATCHED INPUT
+# With batched input each section is an st.form: edits are committed with
+# one submit instead of a rerun per field. Forms only allow submit buttons,
+# so the per-row Delete buttons become checkboxes applied on submit.
+# ----------------------------------------------------------------------------
+def section_container(form_key, batched):
+    return st.form(form_key, border=False) if batched else contextlib.nullcontext()
 
-    init_ss("particle_size_spec", "")
-    init_ss("particle_size_result", "")
-    init_ss("particle_size_method", "USP<786>")
-
-    phys5_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["particle_size_spec"] = phys5_cols[0].text_input("Spec for Particle Size",
-        value=st.session_state["particle_size_spec"], placeholder="X")
-    st.session_state["particle_size_result"] = phys5_cols[1].text_input("Result for Particle Size",
-        value=st.session_state["particle_size_result"], placeholder="X")
-    st.session_state["particle_size_method"] = phys5_cols[2].text_input("Method for Particle Size",
-        value=st.session_state["particle_size_method"])
-    if phys5_cols[3].button("Delete", key="del_partsize"):
-        st.session_state["particle_size_spec"] = ""
-        st.session_state["particle_size_result"] = ""
-        st.session_state["particle_size_method"] = ""
-        st.rerun()
 
-    init_ss("ash_contents_spec", "Not more than X")
-    init_ss("ash_contents_result", "")
-    init_ss("ash_contents_method", "USP<561>")
-
-    phys6_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["ash_contents_spec"] = phys6_cols[0].text_input("Spec for Ash Contents",
-        value=st.session_state["ash_contents_spec"])
-    st.session_state["ash_contents_result"] = phys6_cols[1].text_input("Result for Ash Contents",
-        value=st.session_state["ash_contents_result"], placeholder="X")
-    st.session_state["ash_contents_method"] = phys6_cols[2].text_input("Method for Ash Contents",
-        value=st.session_state["ash_contents_method"])
-    if phys6_cols[3].button("Delete", key="del_ash"):
-        st.session_state["ash_contents_spec"] = ""
-        st.session_state["ash_contents_result"] = ""
-        st.session_state["ash_contents_method"] = ""
-        st.rerun()
+def delete_control(container, key, help, batched):
+    if batched:
+        return container.checkbox("Delete", key=key, help=help)
+    return container.button("Delete", key=key, help=help)
 
-    init_ss("residue_on_ignition_spec", "Not more than X")
-    init_ss("residue_on_ignition_result", "")
-    init_ss("residue_on_ignition_method", "USP<281>")
-
-    phys7_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["residue_on_ignition_spec"] = phys7_cols[0].text_input("Spec for Residue on Ignition",
-        value=st.session_state["residue_on_ignition_spec"])
-    st.session_state["residue_on_ignition_result"] = phys7_cols[1].text_input("Result for Residue on Ignition",
-        value=st.session_state["residue_on_ignition_result"], placeholder="X")
-    st.session_state["residue_on_ignition_method"] = phys7_cols[2].text_input("Method for Residue on Ignition",
-        value=st.session_state["residue_on_ignition_method"])
-    if phys7_cols[3].button("Delete", key="del_resign"):
-        st.session_state["residue_on_ignition_spec"] = ""
-        st.session_state["residue_on_ignition_result"] = ""
-        st.session_state["residue_on_ignition_method"] = ""
-        st.rerun()
 
-    init_ss("bulk_density_spec", "Between 0.3g/ml to 0.6g/ml")
-    init_ss("bulk_density_result", "")
-    init_ss("bulk_density_method", "USP<616>")
-
-    phys8_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["bulk_density_spec"] = phys8_cols[0].text_input("Spec for Bulk Density",
-        value=st.session_state["bulk_density_spec"])
-    st.session_state["bulk_density_result"] = phys8_cols[1].text_input("Result for Bulk Density",
-        value=st.session_state["bulk_density_result"], placeholder="X")
-    st.session_state["bulk_density_method"] = phys8_cols[2].text_input("Method for Bulk Density",
-        value=st.session_state["bulk_density_method"])
-    if phys8_cols[3].button("Delete", key="del_bulk"):
-        st.session_state["bulk_density_spec"] = ""
-        st.session_state["bulk_density_result"] = ""
-        st.session_state["bulk_density_method"] = ""
-        st.rerun()
+def add_control(label, key, batched):
+    if batched:
+        return st.form_submit_button(label)
+    return st.button(label, key=key)
 
-    init_ss("tapped_density_spec", "Between 0.4g/ml to 0.8g/ml")
-    init_ss("tapped_density_result", "")
-    init_ss("tapped_density_method", "USP<616>")
-
-    phys9_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["tapped_density_spec"] = phys9_cols[0].text_input("Spec for Tapped Density",
-        value=st.session_state["tapped_density_spec"])
-    st.session_state["tapped_density_result"] = phys9_cols[1].text_input("Result for Tapped Density",
-        value=st.session_state["tapped_density_result"], placeholder="X")
-    st.session_state["tapped_density_method"] = phys9_cols[2].text_input("Method for Tapped Density",
-        value=st.session_state["tapped_density_method"])
-    if phys9_cols[3].button("Delete", key="del_tapped"):
-        st.session_state["tapped_density_spec"] = ""
-        st.session_state["tapped_density_result"] = ""
-        st.session_state["tapped_density_method"] = ""
-        st.rerun()
 
-    init_ss("solubility_spec", "")
-    init_ss("solubility_result", "")
-    init_ss("solubility_method", "USP<1236>")
-
-    phys10_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["solubility_spec"] = phys10_cols[0].text_input("Spec for Solubility",
-        value=st.session_state["solubility_spec"], placeholder="X")
-    st.session_state["solubility_result"] = phys10_cols[1].text_input("Result for Solubility",
-        value=st.session_state["solubility_result"], placeholder="X")
-    st.session_state["solubility_method"] = phys10_cols[2].text_input("Method for Solubility",
-        value=st.session_state["solubility_method"])
-    if phys10_cols[3].button("Delete", key="del_solub"):
-        st.session_state["solubility_spec"] = ""
-        st.session_state["solubility_result"] = ""
-        st.session_state["solubility_method"] = ""
-        st.rerun()
+def clear_delete_marks(keys):
+    for key in keys:
+        st.session_state.pop(key, None)
 
-    init_ss("ph_spec", "")
-    init_ss("ph_result", "")
-    init_ss("ph_method", "USP<791>")
-
-    phys11_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["ph_spec"] = phys11_cols[0].text_input("Spec for pH",
-        value=st.session_state["ph_spec"], placeholder="X")
-    st.session_state["ph_result"] = phys11_cols[1].text_input("Result for pH",
-        value=st.session_state["ph_result"], placeholder="X")
-    st.session_state["ph_method"] = phys11_cols[2].text_input("Method for pH",
-        value=st.session_state["ph_method"])
-    if phys11_cols[3].button("Delete", key="del_ph"):
-        st.session_state["ph_spec"] = ""
-        st.session_state["ph_result"] = ""
-        st.session_state["ph_method"] = ""
-        st.rerun()
 
-    init_ss("chlorides_nacl_spec", "")
-    init_ss("chlorides_nacl_result", "")
-    init_ss("chlorides_nacl_method", "USP<221>")
-
-    phys12_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["chlorides_nacl_spec"] = phys12_cols[0].text_input("Spec for Chlorides of NaCl",
-        value=st.session_state["chlorides_nacl_spec"], placeholder="X")
-    st.session_state["chlorides_nacl_result"] = phys12_cols[1].text_input("Result for Chlorides of NaCl",
-        value=st.session_state["chlorides_nacl_result"], placeholder="X")
-    st.session_state["chlorides_nacl_method"] = phys12_cols[2].text_input("Method for Chlorides of NaCl",
-        value=st.session_state["chlorides_nacl_method"])
-    if phys12_cols[3].button("Delete", key="del_chlorides"):
-        st.session_state["chlorides_nacl_spec"] = ""
-        st.session_state["chlorides_nacl_result"] = ""
-        st.session_state["chlorides_nacl_method"] = ""
-        st.rerun()
+def row_key(key):
+    # Row widgets echo their value back into session_state. Bumping the form
+    # revision (see load_product) gives them a new identity, so values written
+    # to session_state are shown even if they match an earlier widget value.
+    return f"{key}@{st.session_state.get('form_revision', 0)}"
 
-    init_ss("sulphates_spec", "")
-    init_ss("sulphates_result", "")
-    init_ss("sulphates_method", "USP<221>")
-
-    phys13_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["sulphates_spec"] = phys13_cols[0].text_input("Spec for Sulphates",
-        value=st.session_state["sulphates_spec"], placeholder="X")
-    st.session_state["sulphates_result"] = phys13_cols[1].text_input("Result for Sulphates",
-        value=st.session_state["sulphates_result"], placeholder="X")
-    st.session_state["sulphates_method"] = phys13_cols[2].text_input("Method for Sulphates",
-        value=st.session_state["sulphates_method"])
-    if phys13_cols[3].button("Delete", key="del_sulphates"):
-        st.session_state["sulphates_spec"] = ""
-        st.session_state["sulphates_result"] = ""
-        st.session_state["sulphates_method"] = ""
-        st.rerun()
 
-    init_ss("fats_spec", "")
-    init_ss("fats_result", "")
-    init_ss("fats_method", "USP<731>")
-
-    phys14_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["fats_spec"] = phys14_cols[0].text_input("Spec for Fats",
-        value=st.session_state["fats_spec"], placeholder="X")
-    st.session_state["fats_result"] = phys14_cols[1].text_input("Result for Fats",
-        value=st.session_state["fats_result"], placeholder="X")
-    st.session_state["fats_method"] = phys14_cols[2].text_input("Method for Fats",
-        value=st.session_state["fats_method"])
-    if phys14_cols[3].button("Delete", key="del_fats"):
-        st.session_state["fats_spec"] = ""
-        st.session_state["fats_result"] = ""
-        st.session_state["fats_method"] = ""
-        st.rerun()
+# ----------------------------------------------------------------------------
+# PRODUCT INFORMATION
+# ----------------------------------------------------------------------------
+PRODUCT_FIELDS = (
+    ("product_name", "Product Name"), ("product_code", "Product Code"),
+    ("batch_no", "Batch No."), ("manufacturing_date", "Date of Manufacturing"),
+    ("reanalysis_date", "Date of Reanalysis"), ("botanical_name", "Botanical Name"),
+    ("extraction_ratio", "Extraction Ratio"), ("solvent", "Extraction Solvents"),
+    ("plant_part", "Plant Parts"), ("cas_no", "CAS No."),
+    ("chemical_name", "Chemical Name"), ("quantity", "Quantity"),
+)
 
-    init_ss("protein_spec", "")
-    init_ss("protein_result", "")
-    init_ss("protein_method", "Kjeldahl")
-
-    phys15_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["protein_spec"] = phys15_cols[0].text_input("Spec for Protein",
-        value=st.session_state["protein_spec"], placeholder="X")
-    st.session_state["protein_result"] = phys15_cols[1].text_input("Result for Protein",
-        value=st.session_state["protein_result"], placeholder="X")
-    st.session_state["protein_method"] = phys15_cols[2].text_input("Method for Protein",
-        value=st.session_state["protein_method"])
-    if phys15_cols[3].button("Delete", key="del_protein"):
-        st.session_state["protein_spec"] = ""
-        st.session_state["protein_result"] = ""
-        st.session_state["protein_method"] = ""
-        st.rerun()
 
-    init_ss("total_ig_g_spec", "")
-    init_ss("total_ig_g_result", "")
-    init_ss("total_ig_g_method", "HPLC")
-
-    phys16_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["total_ig_g_spec"] = phys16_cols[0].text_input("Spec for Total IgG",
-        value=st.session_state["total_ig_g_spec"], placeholder="X")
-    st.session_state["total_ig_g_result"] = phys16_cols[1].text_input("Result for Total IgG",
-        value=st.session_state["total_ig_g_result"], placeholder="X")
-    st.session_state["total_ig_g_method"] = phys16_cols[2].text_input("Method for Total IgG",
-        value=st.session_state["total_ig_g_method"])
-    if phys16_cols[3].button("Delete", key="del_igg"):
-        st.session_state["total_ig_g_spec"] = ""
-        st.session_state["total_ig_g_result"] = ""
-        st.session_state["total_ig_g_method"] = ""
-        st.rerun()
+@timed_fragment
+def render_product_info(batched=False):
+    with section_container("form_product_info", batched):
+        _render_product_fields(batched)
 
-    init_ss("sodium_spec", "")
-    init_ss("sodium_result", "")
-    init_ss("sodium_method", "ICP-MS")
-
-    phys17_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["sodium_spec"] = phys17_cols[0].text_input("Spec for Sodium",
-        value=st.session_state["sodium_spec"], placeholder="X")
-    st.session_state["sodium_result"] = phys17_cols[1].text_input("Result for Sodium",
-        value=st.session_state["sodium_result"], placeholder="X")
-    st.session_state["sodium_method"] = phys17_cols[2].text_input("Method for Sodium",
-        value=st.session_state["sodium_method"])
-    if phys17_cols[3].button("Delete", key="del_sodium"):
-        st.session_state["sodium_spec"] = ""
-        st.session_state["sodium_result"] = ""
-        st.session_state["sodium_method"] = ""
-        st.rerun()
 
-    init_ss("gluten_spec", "NMT X")
-    init_ss("gluten_result", "")
-    init_ss("gluten_method", "ELISA")
-
-    phys18_cols = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["gluten_spec"] = phys18_cols[0].text_input("Spec for Gluten",
-        value=st.session_state["gluten_spec"])
-    st.session_state["gluten_result"] = phys18_cols[1].text_input("Result for Gluten",
-        value=st.session_state["gluten_result"], placeholder="X")
-    st.session_state["gluten_method"] = phys18_cols[2].text_input("Method for Gluten",
-        value=st.session_state["gluten_method"])
-    if phys18_cols[3].button("Delete", key="del_gluten"):
-        st.session_state["gluten_spec"] = ""
-        st.session_state["gluten_result"] = ""
-        st.session_state["gluten_method"] = ""
-        st.rerun()
+def _render_product_fields(batched):
+    # 2-col for Product Info
+    for pair in zip(PRODUCT_FIELDS[::2], PRODUCT_FIELDS[1::2]):
+        for col, (key, label) in zip(st.columns(2), pair):
+            col.text_input(label, placeholder="X", key=key)
 
-    st.markdown("#### Add Additional Physical Rows")
-    for i, row_data in enumerate(st.session_state["Physical_rows"]):
-        c1, c2, c3, c4, del_col = st.columns([3, 2.5, 2.5, 2.5, 2])
-        st.session_state["Physical_rows"][i]["param"] = c1.text_input(
-            f"Physical Parameter {i+1}", row_data["param"], key=f"PhysicalParam_{i}"
-        )
-        st.session_state["Physical_rows"][i]["spec"] = c2.text_input(
-            f"Physical Spec {i+1}", row_data["spec"], key=f"PhysicalSpec_{i}"
-        )
-        st.session_state["Physical_rows"][i]["result"] = c3.text_input(
-            f"Physical Result {i+1}", row_data["result"], key=f"PhysicalResult_{i}"
+    st.markdown("#### Add Additional Product Info Rows")
+    rows = st.session_state["Product_rows"]
+    delete_keys = [f"del_product_{i}" for i in range(len(rows))]
+    to_delete = []
+    for i, row_data in enumerate(rows):
+        col_label, col_value, col_del = st.columns([3, 7, 2])
+        rows[i]["label"] = col_label.text_input(
+            f"Additional Label {i+1}",
+            row_data.get("label", ""),
+            key=row_key(f"ProductLabel_{i}")
         )
-        st.session_state["Physical_rows"][i]["method"] = c4.text_input(
-            f"Physical Method {i+1}", row_data["method"], key=f"PhysicalMethod_{i}"
+        rows[i]["value"] = col_value.text_input(
+            f"Additional Value {i+1}",
+            row_data.get("value", ""),
+            key=row_key(f"ProductValue_{i}")
         )
-        if del_col.button("Delete", key=f"del_physical_{i}"):
-            st.session_state["Physical_rows"].pop(i)
-            st.rerun()
-
-    if st.button("Add New Physical Row"):
-        st.session_state["Physical_rows"].append({"param": "", "spec": "", "result": "", "method": ""})
-        st.rerun()
+        if delete_control(col_del, delete_keys[i], None, batched):
+            to_delete.append(i)
 
-    # ----------------------------------------------------------------------
-    # OTHERS
-    # ----------------------------------------------------------------------
-    st.subheader("Others")
-    init_ss("lead_spec", "Not more than X ppm")
-    init_ss("lead_result", "")
-    init_ss("lead_method", "ICP-MS")
-
-    others_1 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["lead_spec"] = others_1[0].text_input("Spec for Lead", value=st.session_state["lead_spec"])
-    st.session_state["lead_result"] = others_1[1].text_input("Result for Lead", value=st.session_state["lead_result"], placeholder="X ppm")
-    st.session_state["lead_method"] = others_1[2].text_input("Method for Lead", value=st.session_state["lead_method"])
-    if others_1[3].button("Delete", key="del_lead"):
-        st.session_state["lead_spec"] = ""
-        st.session_state["lead_result"] = ""
-        st.session_state["lead_method"] = ""
-        st.rerun()
+    add_row = add_control("Add New Additional Product Info Row", "add_product_row", batched)
 
-    init_ss("cadmium_spec", "Not more than X ppm")
-    init_ss("cadmium_result", "")
-    init_ss("cadmium_method", "ICP-MS")
-
-    others_2 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["cadmium_spec"] = others_2[0].text_input("Spec for Cadmium", value=st.session_state["cadmium_spec"])
-    st.session_state["cadmium_result"] = others_2[1].text_input("Result for Cadmium", value=st.session_state["cadmium_result"], placeholder="X ppm")
-    st.session_state["cadmium_method"] = others_2[2].text_input("Method for Cadmium", value=st.session_state["cadmium_method"])
-    if others_2[3].button("Delete", key="del_cadmium"):
-        st.session_state["cadmium_spec"] = ""
-        st.session_state["cadmium_result"] = ""
-        st.session_state["cadmium_method"] = ""
-        st.rerun()
+    init_ss("origin", "India")
+    st.text_input("Country of Origin", key="origin")
+    if batched:
+        st.form_submit_button("Apply Product Information", type="primary")
 
-    init_ss("arsenic_spec", "Not more than X ppm")
-    init_ss("arsenic_result", "")
-    init_ss("arsenic_method", "ICP-MS")
-
-    others_3 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["arsenic_spec"] = others_3[0].text_input("Spec for Arsenic", value=st.session_state["arsenic_spec"])
-    st.session_state["arsenic_result"] = others_3[1].text_input("Result for Arsenic", value=st.session_state["arsenic_result"], placeholder="X ppm")
-    st.session_state["arsenic_method"] = others_3[2].text_input("Method for Arsenic", value=st.session_state["arsenic_method"])
-    if others_3[3].button("Delete", key="del_arsenic"):
-        st.session_state["arsenic_spec"] = ""
-        st.session_state["arsenic_result"] = ""
-        st.session_state["arsenic_method"] = ""
-        st.rerun()
+    if to_delete or add_row:
+        for i in reversed(to_delete):
+            rows.pop(i)
+        if add_row:
+            rows.append({"label": "", "value": ""})
+        clear_delete_marks(delete_keys)
+        rerun_fragment()
 
-    init_ss("mercury_spec", "Not more than X ppm")
-    init_ss("mercury_result", "")
-    init_ss("mercury_method", "ICP-MS")
-
-    others_4 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["mercury_spec"] = others_4[0].text_input("Spec for Mercury", value=st.session_state["mercury_spec"])
-    st.session_state["mercury_result"] = others_4[1].text_input("Result for Mercury", value=st.session_state["mercury_result"], placeholder="X ppm")
-    st.session_state["mercury_method"] = others_4[2].text_input("Method for Mercury", value=st.session_state["mercury_method"])
-    if others_4[3].button("Delete", key="del_mercury"):
-        st.session_state["mercury_spec"] = ""
-        st.session_state["mercury_result"] = ""
-        st.session_state["mercury_method"] = ""
-        st.rerun()
 
-    st.markdown("#### Add Additional Others Rows")
-    for i, row_data in enumerate(st.session_state["Others_rows"]):
-        c1, c2, c3, c4, del_col = st.columns([3, 2.5, 2.5, 2.5, 2])
-        st.session_state["Others_rows"][i]["param"] = c1.text_input(
-            f"Others Parameter {i+1}", row_data.get("param",""), key=f"OthersParam_{i}"
-        )
-        st.session_state["Others_rows"][i]["spec"] = c2.text_input(
-            f"Others Spec {i+1}", row_data.get("spec",""), key=f"OthersSpec_{i}"
-        )
-        st.session_state["Others_rows"][i]["result"] = c3.text_input(
-            f"Others Result {i+1}", row_data.get("result",""), key=f"OthersResult_{i}"
-        )
-        st.session_state["Others_rows"][i]["method"] = c4.text_input(
-            f"Others Method {i+1}", row_data.get("method",""), key=f"OthersMethod_{i}"
-        )
-        if del_col.button("Delete", key=f"del_others_{i}"):
-            st.session_state["Others_rows"].pop(i)
-            st.rerun()
+# ----------------------------------------------------------------------------
+# SPECIFICATION SECTIONS (driven by coa_catalogue.json)
+# ----------------------------------------------------------------------------
+def render_base_row(section, param, batched=False):
+    field_keys = [param.field_key(f) for f in FIELDS]
+    for key, default in zip(field_keys, param.defaults):
+        init_ss(key, default)
+    if section.editable_param:
+        field_keys.insert(0, f"{param.key}_param")
+        init_ss(field_keys[0], "")
+
+    cols = st.columns(list(section.columns))
+    for col, key in zip(cols, field_keys):
+        field = key[len(param.key) + 1:]
+        if field == "param":
+            label = f"Parameter for {param.label}"
+        elif field == "spec":
+            label = f"{section.spec_label} {param.label}"
+        else:
+            label = f"{field.capitalize()} for {param.label}"
+        if field == "spec" and param.spec_widget == "text_area":
+            st.session_state[key] = col.text_area(label, value=st.session_state[key], height=68,
+                                                  key=row_key(key))
+        else:
+            st.session_state[key] = col.text_input(label, value=st.session_state[key],
+                                                   placeholder=section.placeholders.get(field),
+                                                   key=row_key(key))
+    # Returns the keys to clear when the row is deleted, else None.
+    if delete_control(cols[-1], f"del_{param.key}", f"Clear the {param.label} row", batched):
+        return field_keys
+    return None
+
+
+def render_extra_rows(section, batched=False):
+    rows = st.session_state[section.state_key]
+    prefix = section.label_prefix
+    delete_keys = [f"del_{section.id}_{i}" for i in range(len(rows))]
+    to_delete = []
+    st.markdown(f"#### Add Additional {section.name} Rows")
+    for i, row_data in enumerate(rows):
+        *cols, del_col = st.columns(list(section.extra_columns))
+        for col, field, title in zip(cols, ("param",) + FIELDS, ("Parameter", "Spec", "Result", "Method")):
+            rows[i][field] = col.text_input(
+                f"{prefix} {title} {i+1}", row_data.get(field, ""), key=row_key(f"{section.id}_{field}_{i}")
+            )
+        if delete_control(del_col, delete_keys[i], None, batched):
+            to_delete.append(i)
+
+    add_row = add_control(section.add_label, f"add_{section.id}_row", batched)
+    for i in reversed(to_delete):
+        rows.pop(i)
+    if add_row:
+        rows.append({"param": "", "spec": "", "result": "", "method": ""})
+    return bool(to_delete or add_row), delete_keys
+
+
+@timed_fragment
+def render_section(section, batched=False):
+    st.subheader(section.name)
+    marks = []
+    with section_container(f"form_{section.id}", batched):
+        for param in section.parameters:
+            cleared = render_base_row(section, param, batched)
+            if cleared:
+                for key in cleared:
+                    st.session_state[key] = ""
+                marks.append(f"del_{param.key}")
+        rows_changed, extra_marks = render_extra_rows(section, batched)
+        if batched:
+            st.form_submit_button(f"Apply {section.name}", type="primary")
+    if marks or rows_changed:
+        clear_delete_marks(marks + extra_marks)
+        rerun_fragment()
+
+
+def build_record(allergen_statement):
+    # The form widgets use the data-dict keys, so the record reads them
+    # straight from session state; only the row lists live under other keys.
+    overrides = {section.extra_key: st.session_state[section.state_key] for section in catalogue.sections}
+    overrides["product_additional_rows"] = st.session_state["Product_rows"]
+    overrides["allergen_statement"] = allergen_statement
+    return COARecord.from_data(ChainMap(overrides, st.session_state), catalogue)
 
-    if st.button("Add New Others Row"):
-        st.session_state["Others_rows"].append({"param": "", "spec": "", "result": "", "method": ""})
-        st.rerun()
 
-    # ASSAYS
-    st.subheader("Assays")
-    init_ss("assays_param", "")
-    init_ss("assays_spec", "")
-    init_ss("assays_result", "")
-    init_ss("assays_method", "")
-
-    # Create base row with 4 input fields and a delete button column
-    assays_1 = st.columns([3, 3, 2.5, 2.5, 2])
-    st.session_state["assays_param"] = assays_1[0].text_input(
-        "Parameter for Assays",
-        value=st.session_state["assays_param"],
-        placeholder="Enter parameter"
-    )
-    st.session_state["assays_spec"] = assays_1[1].text_input(
-        "Specification for Assays",
-        value=st.session_state["assays_spec"],
-        placeholder="Enter specification"
-    )
-    st.session_state["assays_result"] = assays_1[2].text_input(
-        "Result for Assays",
-        value=st.session_state["assays_result"],
-        placeholder="Enter result"
-    )
-    st.session_state["assays_method"] = assays_1[3].text_input(
-        "Method for Assays",
-        value=st.session_state["assays_method"],
-        placeholder="Enter method"
-    )
-    if assays_1[4].button("Delete", key="del_assays_base"):
-        st.session_state["assays_param"] = ""
-        st.session_state["assays_spec"] = ""
-        st.session_state["assays_result"] = ""
-        st.session_state["assays_method"] = ""
-        st.rerun()
+# ----------------------------------------------------------------------------
+# PRODUCT MASTER
+# Choosing a product code fills the product fields and every spec row from
+# one indexed SQLite read. The callback runs before the script, and the
+# form revision bump makes every row widget start from the loaded values.
+# ----------------------------------------------------------------------------
+@st.cache_resource
+def get_product_master():
+    return ProductMaster()
+
+
+product_master = get_product_master()
+
+
+def load_product():
+    code = st.session_state["master_product_code"]
+    record = product_master.get(code) if code else None
+    if record is None:
+        return
+    st.session_state["product_code"] = code
+    for key, _ in PRODUCT_FIELDS:
+        if key in record:
+            st.session_state[key] = record[key]
+    st.session_state["origin"] = record.get("origin", "India")
+    for section in catalogue.sections:
+        for param in section.parameters:
+            spec, result, method = param.defaults
+            st.session_state[param.field_key("spec")] = record.get(param.field_key("spec"), spec)
+            st.session_state[param.field_key("result")] = result
+            st.session_state[param.field_key("method")] = record.get(param.field_key("method"), method)
+            if section.editable_param:
+                st.session_state[f"{param.key}_param"] = record.get(f"{param.key}_param", "")
+        st.session_state[section.state_key] = [
+            dict(zip(("param",) + FIELDS, row)) for row in record.get(section.extra_key, [])
+        ]
+    st.session_state["Product_rows"] = [
+        {"label": label, "value": value} for label, value in record.get("product_additional_rows", [])
+    ]
+    st.session_state["form_revision"] = st.session_state.get("form_revision", 0) + 1
 
-    st.markdown("#### Add Additional Assays Rows")
-    for i, row_data in enumerate(st.session_state["Assays_rows"]):
-        c1, c2, c3, c4, del_col = st.columns([3, 3, 2.5, 2.5, 2])
-        st.session_state["Assays_rows"][i]["param"] = c1.text_input(
-            f"Assays Parameter {i+1}",
-            row_data.get("param", ""),
-            key=f"AssaysParam_{i}"
-        )
-        st.session_state["Assays_rows"][i]["spec"] = c2.text_input(
-            f"Assays Spec {i+1}",
-            row_data.get("spec", ""),
-            key=f"AssaysSpec_{i}"
-        )
-        st.session_state["Assays_rows"][i]["result"] = c3.text_input(
-            f"Assays Result {i+1}",
-            row_data.get("result", ""),
-            key=f"AssaysResult_{i}"
-        )
-        st.session_state["Assays_rows"][i]["method"] = c4.text_input(
-            f"Assays Method {i+1}",
-            row_data.get("method", ""),
-            key=f"AssaysMethod_{i}"
-        )
-        if del_col.button("Delete", key=f"del_assays_{i}"):
-            st.session_state["Assays_rows"].pop(i)
-            st.rerun()
 
-    if st.button("Add New Assays Row"):
-        st.session_state["Assays_rows"].append({"param": "", "spec": "", "result": "", "method": ""})
-        st.rerun()
+def render_product_master():
+    codes = product_master.codes()
+    names = dict(codes)
+    col_code, col_save = st.columns([3, 1])
+    col_code.selectbox(
+        "Load product from master", options=[""] + [code for code, _ in codes], key="master_product_code",
+        format_func=lambda code: f"{code} – {names[code]}" if code else "—", on_change=load_product,
+    )
+    if col_save.button("Save to master", help="Store this product's details and specs under its Product Code"):
+        code = st.session_state.get("product_code", "").strip()
+        if not code:
+            st.warning("Enter a Product Code before saving to the product master.")
+        else:
+            product_master.upsert(code, build_record(""))
+            st.success(f"Saved {code} to the product master.")
 
-    # PESTICIDES
-    st.subheader("Pesticides")
-    init_ss("pesticide_spec", "Meet USP<561>")
-    init_ss("pesticide_result", "Compiles")
-    init_ss("pesticide_method", "USP<561>")
-
-    pest_1 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["pesticide_spec"] = pest_1[0].text_input("Specification for Pesticide",
-        value=st.session_state["pesticide_spec"])
-    st.session_state["pesticide_result"] = pest_1[1].text_input("Result for Pesticide",
-        value=st.session_state["pesticide_result"])
-    st.session_state["pesticide_method"] = pest_1[2].text_input("Method for Pesticide",
-        value=st.session_state["pesticide_method"])
-    if pest_1[3].button("Delete", key="del_pesticide_base"):
-        st.session_state["pesticide_spec"] = ""
-        st.session_state["pesticide_result"] = ""
-        st.session_state["pesticide_method"] = ""
-        st.rerun()
 
-    st.markdown("#### Add Additional Pesticides Rows")
-    for i, row_data in enumerate(st.session_state["Pesticides_rows"]):
-        c1, c2, c3, c4, del_col = st.columns([3, 2.5, 2.5, 2.5, 2])
-        st.session_state["Pesticides_rows"][i]["param"] = c1.text_input(
-            f"Pesticides Parameter {i+1}", row_data.get("param",""), key=f"PesticidesParam_{i}"
-        )
-        st.session_state["Pesticides_rows"][i]["spec"] = c2.text_input(
-            f"Pesticides Spec {i+1}", row_data.get("spec",""), key=f"PesticidesSpec_{i}"
-        )
-        st.session_state["Pesticides_rows"][i]["result"] = c3.text_input(
-            f"Pesticides Result {i+1}", row_data.get("result",""), key=f"PesticidesResult_{i}"
-        )
-        st.session_state["Pesticides_rows"][i]["method"] = c4.text_input(
-            f"Pesticides Method {i+1}", row_data.get("method",""), key=f"PesticidesMethod_{i}"
-        )
-        if del_col.button("Delete", key=f"del_pesticides_{i}"):
-            st.session_state["Pesticides_rows"].pop(i)
-            st.rerun()
+# ----------------------------------------------------------------------------
+# BACKGROUND RENDERING
+# One queue (and worker pool) per server process, shared by all sessions.
+# ----------------------------------------------------------------------------
+@st.cache_resource
+def get_coa_archive():
+    return COAArchive()
 
-    if st.button("Add New Pesticides Row"):
-        st.session_state["Pesticides_rows"].append({"param": "", "spec": "", "result": "", "method": ""})
-        st.rerun()
 
-    # RESIDUAL SOLVENT
-    st.subheader("Residual Solvent")
-    init_ss("residual_solvent_spec", "")
-    init_ss("residual_solvent_result", "Compiles")
-    init_ss("residual_solvent_method", "")
-
-    rs_1 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["residual_solvent_spec"] = rs_1[0].text_input("Specification for Residual Solvent",
-        value=st.session_state["residual_solvent_spec"], placeholder="X")
-    st.session_state["residual_solvent_result"] = rs_1[1].text_input("Result for Residual Solvent",
-        value=st.session_state["residual_solvent_result"])
-    st.session_state["residual_solvent_method"] = rs_1[2].text_input("Method for Residual Solvent",
-        value=st.session_state["residual_solvent_method"], placeholder="X")
-    if rs_1[3].button("Delete", key="del_resid_base"):
-        st.session_state["residual_solvent_spec"] = ""
-        st.session_state["residual_solvent_result"] = ""
-        st.session_state["residual_solvent_method"] = ""
-        st.rerun()
+@st.cache_resource
+def get_render_queue():
+    # Compiled COAs are archived on the worker thread once their PDF is built.
+    queue = RenderQueue(archive=get_coa_archive())
+    if WARM_UP:
+        # Streamlit runs no code before the first session, so the first script
+        # run of the process starts the warm-up, in the background, while the
+        # form is filled in.
+        queue.warm_up()
+    return queue
 
-    st.markdown("#### Add Additional Residual Solvent Rows")
-    for i, row_data in enumerate(st.session_state["ResidualSolvent_rows"]):
-        c1, c2, c3, c4, del_col = st.columns([3, 2.5, 2.5, 2.5, 2])
-        st.session_state["ResidualSolvent_rows"][i]["param"] = c1.text_input(
-            f"Residual Solvent Parameter {i+1}", row_data.get("param",""), key=f"ResidualSolventParam_{i}"
-        )
-        st.session_state["ResidualSolvent_rows"][i]["spec"] = c2.text_input(
-            f"Residual Solvent Spec {i+1}", row_data.get("spec",""), key=f"ResidualSolventSpec_{i}"
-        )
-        st.session_state["ResidualSolvent_rows"][i]["result"] = c3.text_input(
-            f"Residual Solvent Result {i+1}", row_data.get("result",""), key=f"ResidualSolventResult_{i}"
-        )
-        st.session_state["ResidualSolvent_rows"][i]["method"] = c4.text_input(
-            f"Residual Solvent Method {i+1}", row_data.get("method",""), key=f"ResidualSolventMethod_{i}"
-        )
-        if del_col.button("Delete", key=f"del_residual_{i}"):
-            st.session_state["ResidualSolvent_rows"].pop(i)
-            st.rerun()
 
-    if st.button("Add New Residual Solvent Row"):
-        st.session_state["ResidualSolvent_rows"].append({"param": "", "spec": "", "result": "", "method": ""})
-        st.rerun()
+render_queue = get_render_queue()
 
-    # MICROBIOLOGICAL
-    st.subheader("Microbiological Profile")
-    init_ss("total_plate_count_spec", "Not more than X cfu/g")
-    init_ss("total_plate_count_result", "X cfu/g")
-    init_ss("total_plate_count_method", "USP<61>")
-
-    micro_1 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["total_plate_count_spec"] = micro_1[0].text_input("Spec for Total Plate Count",
-        value=st.session_state["total_plate_count_spec"])
-    st.session_state["total_plate_count_result"] = micro_1[1].text_input("Result for Total Plate Count",
-        value=st.session_state["total_plate_count_result"])
-    st.session_state["total_plate_count_method"] = micro_1[2].text_input("Method for Total Plate Count",
-        value=st.session_state["total_plate_count_method"])
-    if micro_1[3].button("Delete", key="del_tpc"):
-        st.session_state["total_plate_count_spec"] = ""
-        st.session_state["total_plate_count_result"] = ""
-        st.session_state["total_plate_count_method"] = ""
-        st.rerun()
 
-    init_ss("yeasts_mould_spec", "Not more than X cfu/g")
-    init_ss("yeasts_mould_result", "X cfu/g")
-    init_ss("yeasts_mould_method", "USP<61>")
-
-    micro_2 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["yeasts_mould_spec"] = micro_2[0].text_input("Spec for Yeasts & Mould Count",
-        value=st.session_state["yeasts_mould_spec"])
-    st.session_state["yeasts_mould_result"] = micro_2[1].text_input("Result for Yeasts & Mould Count",
-        value=st.session_state["yeasts_mould_result"])
-    st.session_state["yeasts_mould_method"] = micro_2[2].text_input("Method for Yeasts & Mould Count",
-        value=st.session_state["yeasts_mould_method"])
-    if micro_2[3].button("Delete", key="del_ym"):
-        st.session_state["yeasts_mould_spec"] = ""
-        st.session_state["yeasts_mould_result"] = ""
-        st.session_state["yeasts_mould_method"] = ""
-        st.rerun()
+# ----------------------------------------------------------------------------
+# EXPORT FILES
+# Each bulk export is written to its own directory, which the session's next
+# export replaces. A closed session never comes back for its export, so
+# anything older than EXPORT_MAX_AGE is swept at startup and before every
+# export.
+# ----------------------------------------------------------------------------
+def sweep_exports(max_age=EXPORT_MAX_AGE):
+    cutoff = time.time() - max_age
+    with contextlib.suppress(FileNotFoundError):
+        for entry in os.scandir(EXPORT_DIR):
+            with contextlib.suppress(OSError):
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.remove(entry.path)
+
+
+@st.cache_resource
+def get_export_dir():
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    sweep_exports()
+    return EXPORT_DIR
+
+
+get_export_dir()
+
+
+def show_preview(pdf_bytes, fmt, dpi):
+    from coa_preview import PreviewRasterizer
+    with PreviewRasterizer(pdf_bytes, fmt=fmt) as rasterizer:
+        for page_no in range(rasterizer.page_count):
+            st.image(rasterizer.page(page_no, dpi), caption=f"Page {page_no + 1}",
+                     use_container_width=True)
+
+
+@st.fragment(run_every=0.5)
+def watch_job(job_key, ready_key, label):
+    # Polls without blocking the session; a full rerun is only triggered once,
+    # when the job has finished and the result can be shown.
+    status = render_queue.status(st.session_state.get(job_key))
+    if status is None:
+        st.session_state.pop(job_key, None)
+        st.warning(f"{label} job expired, please try again.")
+        return
+    if status["stage"] == "failed":
+        st.session_state.pop(job_key, None)
+        st.error(f"{label} failed: {status['error']}")
+        return
+    if status["stage"] == "done":
+        st.session_state[ready_key] = st.session_state.pop(job_key)
+        if "render_timings" not in st.session_state:
+            st.session_state["render_timings"] = deque(maxlen=RENDER_HISTORY)
+        st.session_state["render_timings"].append(render_queue.get(status["id"]).timings)
+        st.rerun()
+    if status["position"] is not None:
+        text = f"{label} queued (position {status['position']})"
+    else:
+        text = f"{label}: {status['stage']} ({status['elapsed']:.1f}s)"
+    st.progress(status["progress"], text=text)
+    job = render_queue.get(status["id"])
+    if status["stage"] == "rasterizing" and job is not None and job.preview:
+        # Thumbnails are already cached; show them while full-size pages render.
+        show_preview(job.pdf, job.preview[0], THUMB_DPI)
 
-    init_ss("salmonella_spec", "Absent/25g")
-    init_ss("salmonella_result", "Absent")
-    init_ss("salmonella_method", "USP<62>")
-
-    micro_3 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["salmonella_spec"] = micro_3[0].text_input("Spec for Salmonella",
-        value=st.session_state["salmonella_spec"])
-    st.session_state["salmonella_result"] = micro_3[1].text_input("Result for Salmonella",
-        value=st.session_state["salmonella_result"])
-    st.session_state["salmonella_method"] = micro_3[2].text_input("Method for Salmonella",
-        value=st.session_state["salmonella_method"])
-    if micro_3[3].button("Delete", key="del_salmonella"):
-        st.session_state["salmonella_spec"] = ""
-        st.session_state["salmonella_result"] = ""
-        st.session_state["salmonella_method"] = ""
-        st.rerun()
+# ----------------------------------------------------------------------------
+# STREAMLIT UI
+# ----------------------------------------------------------------------------
 
-    init_ss("e_coli_spec", "Absent/10g")
-    init_ss("e_coli_result", "Absent")
-    init_ss("e_coli_method", "USP<62>")
-
-    micro_4 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["e_coli_spec"] = micro_4[0].text_input("Spec for Escherichia coli",
-        value=st.session_state["e_coli_spec"])
-    st.session_state["e_coli_result"] = micro_4[1].text_input("Result for Escherichia coli",
-        value=st.session_state["e_coli_result"])
-    st.session_state["e_coli_method"] = micro_4[2].text_input("Method for Escherichia coli",
-        value=st.session_state["e_coli_method"])
-    if micro_4[3].button("Delete", key="del_ecoli"):
-        st.session_state["e_coli_spec"] = ""
-        st.session_state["e_coli_result"] = ""
-        st.session_state["e_coli_method"] = ""
-        st.rerun()
+col1, col2 = st.columns(2)
+with col1:
+    st.title("Tru Herb COA PDF Generator")
+    st.header("Product Information")
 
-    init_ss("coliforms_spec", "NMT X cfu/g")
-    init_ss("coliforms_result", "")
-    init_ss("coliforms_method", "USP<62>")
-
-    micro_5 = st.columns([3, 2.5, 2.5, 2])
-    st.session_state["coliforms_spec"] = micro_5[0].text_input("Spec for Coliforms",
-        value=st.session_state["coliforms_spec"])
-    st.session_state["coliforms_result"] = micro_5[1].text_input("Result for Coliforms",
-        value=st.session_state["coliforms_result"], placeholder="X")
-    st.session_state["coliforms_method"] = micro_5[2].text_input("Method for Coliforms",
-        value=st.session_state["coliforms_method"])
-    if micro_5[3].button("Delete", key="del_coliforms"):
-        st.session_state["coliforms_spec"] = ""
-        st.session_state["coliforms_result"] = ""
-        st.session_state["coliforms_method"] = ""
-        st.rerun()
+    render_product_master()
+    render_product_info(batch_input)
 
-    st.markdown("#### Add Additional Microbiological Profile Rows")
-    for i, row_data in enumerate(st.session_state["MicrobiologicalProfile_rows"]):
-        c1, c2, c3, c4, del_col = st.columns([3, 2.5, 2.5, 2.5, 2])
-        st.session_state["MicrobiologicalProfile_rows"][i]["param"] = c1.text_input(
-            f"Microbio Parameter {i+1}", row_data.get("param",""), key=f"MicrobioParam_{i}"
-        )
-        st.session_state["MicrobiologicalProfile_rows"][i]["spec"] = c2.text_input(
-            f"Microbio Spec {i+1}", row_data.get("spec",""), key=f"MicrobioSpec_{i}"
-        )
-        st.session_state["MicrobiologicalProfile_rows"][i]["result"] = c3.text_input(
-            f"Microbio Result {i+1}", row_data.get("result",""), key=f"MicrobioResult_{i}"
-        )
-        st.session_state["MicrobiologicalProfile_rows"][i]["method"] = c4.text_input(
-            f"Microbio Method {i+1}", row_data.get("method",""), key=f"MicrobioMethod_{i}"
-        )
-        if del_col.button("Delete", key=f"del_micro_{i}"):
-            st.session_state["MicrobiologicalProfile_rows"].pop(i)
-            st.rerun()
+    # ---------- SPECIFICATIONS -----------
+    st.header("Specifications")
 
-    if st.button("Add New Microbiological Row"):
-        st.session_state["MicrobiologicalProfile_rows"].append({"param": "", "spec": "", "result": "", "method": ""})
-        st.rerun()
+    for section in catalogue.sections:
+        render_section(section, batch_input)
 
     # Declaration
     st.subheader("Declaration - Allergen Statement")
     allergen_statement = st.selectbox("Allergen Statement", options=["Free from allergen", "Contains Allergen"])
 
     # ----------- PREVIEW & COMPILE BUTTONS -----------
+    # Rendering runs on the shared render queue; the button only submits a
+    # job and a polling fragment reports progress until the PDF is ready.
     st.write("---")
     if st.button("Preview"):
-        data = {
-            "product_name": product_name,
-            "botanical_name": botanical_name,
-            "chemical_name": chemical_name,
-            "cas_no": cas_no,
-            "product_code": product_code,
-            "batch_no": batch_no,
-            "manufacturing_date": manufacturing_date,
-            "reanalysis_date": reanalysis_date,
-            "quantity": quantity,
-            "origin": origin,
-
-            "description_spec": st.session_state["description_spec"],
-            "description_result": st.session_state["description_result"],
-            "description_method": st.session_state["description_method"],
-
-            "identification_spec": st.session_state["identification_spec"],
-            "identification_result": st.session_state["identification_result"],
-            "identification_method": st.session_state["identification_method"],
-
-            "loss_on_drying_spec": st.session_state["loss_on_drying_spec"],
-            "loss_on_drying_result": st.session_state["loss_on_drying_result"],
-            "loss_on_drying_method": st.session_state["loss_on_drying_method"],
-
-            "moisture_spec": st.session_state["moisture_spec"],
-            "moisture_result": st.session_state["moisture_result"],
-            "moisture_method": st.session_state["moisture_method"],
-
-            "particle_size_spec": st.session_state["particle_size_spec"],
-            "particle_size_result": st.session_state["particle_size_result"],
-            "particle_size_method": st.session_state["particle_size_method"],
-
-            "ash_contents_spec": st.session_state["ash_contents_spec"],
-            "ash_contents_result": st.session_state["ash_contents_result"],
-            "ash_contents_method": st.session_state["ash_contents_method"],
-
-            "residue_on_ignition_spec": st.session_state["residue_on_ignition_spec"],
-            "residue_on_ignition_result": st.session_state["residue_on_ignition_result"],
-            "residue_on_ignition_method": st.session_state["residue_on_ignition_method"],
-
-            "bulk_density_spec": st.session_state["bulk_density_spec"],
-            "bulk_density_result": st.session_state["bulk_density_result"],
-            "bulk_density_method": st.session_state["bulk_density_method"],
-
-            "tapped_density_spec": st.session_state["tapped_density_spec"],
-            "tapped_density_result": st.session_state["tapped_density_result"],
-            "tapped_density_method": st.session_state["tapped_density_method"],
-
-            "solubility_spec": st.session_state["solubility_spec"],
-            "solubility_result": st.session_state["solubility_result"],
-            "solubility_method": st.session_state["solubility_method"],
-
-            "ph_spec": st.session_state["ph_spec"],
-            "ph_result": st.session_state["ph_result"],
-            "ph_method": st.session_state["ph_method"],
-
-            "chlorides_nacl_spec": st.session_state["chlorides_nacl_spec"],
-            "chlorides_nacl_result": st.session_state["chlorides_nacl_result"],
-            "chlorides_nacl_method": st.session_state["chlorides_nacl_method"],
-
-            "sulphates_spec": st.session_state["sulphates_spec"],
-            "sulphates_result": st.session_state["sulphates_result"],
-            "sulphates_method": st.session_state["sulphates_method"],
-
-            "fats_spec": st.session_state["fats_spec"],
-            "fats_result": st.session_state["fats_result"],
-            "fats_method": st.session_state["fats_method"],
-
-            "protein_spec": st.session_state["protein_spec"],
-            "protein_result": st.session_state["protein_result"],
-            "protein_method": st.session_state["protein_method"],
-
-            "total_ig_g_spec": st.session_state["total_ig_g_spec"],
-            "total_ig_g_result": st.session_state["total_ig_g_result"],
-            "total_ig_g_method": st.session_state["total_ig_g_method"],
-
-            "sodium_spec": st.session_state["sodium_spec"],
-            "sodium_result": st.session_state["sodium_result"],
-            "sodium_method": st.session_state["sodium_method"],
-
-            "gluten_spec": st.session_state["gluten_spec"],
-            "gluten_result": st.session_state["gluten_result"],
-            "gluten_method": st.session_state["gluten_method"],
-
-            "lead_spec": st.session_state["lead_spec"],
-            "lead_result": st.session_state["lead_result"],
-            "lead_method": st.session_state["lead_method"],
-
-            "cadmium_spec": st.session_state["cadmium_spec"],
-            "cadmium_result": st.session_state["cadmium_result"],
-            "cadmium_method": st.session_state["cadmium_method"],
-
-            "arsenic_spec": st.session_state["arsenic_spec"],
-            "arsenic_result": st.session_state["arsenic_result"],
-            "arsenic_method": st.session_state["arsenic_method"],
-
-            "mercury_spec": st.session_state["mercury_spec"],
-            "mercury_result": st.session_state["mercury_result"],
-            "mercury_method": st.session_state["mercury_method"],
-
-            "assays_spec": st.session_state["assays_spec"],
-            "assays_result": st.session_state["assays_result"],
-            "assays_method": st.session_state["assays_method"],
-
-            "pesticide_spec": st.session_state["pesticide_spec"],
-            "pesticide_result": st.session_state["pesticide_result"],
-            "pesticide_method": st.session_state["pesticide_method"],
-
-            "residual_solvent_spec": st.session_state["residual_solvent_spec"],
-            "residual_solvent_result": st.session_state["residual_solvent_result"],
-            "residual_solvent_method": st.session_state["residual_solvent_method"],
-
-            "total_plate_count_spec": st.session_state["total_plate_count_spec"],
-            "total_plate_count_result": st.session_state["total_plate_count_result"],
-            "total_plate_count_method": st.session_state["total_plate_count_method"],
-
-            "yeasts_mould_spec": st.session_state["yeasts_mould_spec"],
-            "yeasts_mould_result": st.session_state["yeasts_mould_result"],
-            "yeasts_mould_method": st.session_state["yeasts_mould_method"],
-
-            "salmonella_spec": st.session_state["salmonella_spec"],
-            "salmonella_result": st.session_state["salmonella_result"],
-            "salmonella_method": st.session_state["salmonella_method"],
-
-            "e_coli_spec": st.session_state["e_coli_spec"],
-            "e_coli_result": st.session_state["e_coli_result"],
-            "e_coli_method": st.session_state["e_coli_method"],
-
-            "coliforms_spec": st.session_state["coliforms_spec"],
-            "coliforms_result": st.session_state["coliforms_result"],
-            "coliforms_method": st.session_state["coliforms_method"],
-
-            "allergen_statement": allergen_statement,
-
-            "physical_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["Physical_rows"]
-            ],
-            "others_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["Others_rows"]
-            ],
-            "assays_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["Assays_rows"]
-            ],
-            "pesticides_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["Pesticides_rows"]
-            ],
-            "residual_solvent_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["ResidualSolvent_rows"]
-            ],
-            "microbio_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["MicrobiologicalProfile_rows"]
-            ],
-            "product_additional_rows": [
-                (row["label"], row["value"])
-                for row in st.session_state["Product_rows"]
-            ],
-        }
-
-        pdf_buffer = generate_pdf(data)
-        if pdf_buffer:
-            doc_preview = fitz.open(stream=pdf_buffer, filetype="pdf")
-            with col2:
-                for page in doc_preview:
-                    pix = page.get_pixmap()
-                    st.image(pix.tobytes(), caption=f"Page {page.number + 1}", use_container_width=True)
-            st.success("Preview generated successfully!")
+        timer = StageTimer(source="preview")
+        with timer.stage("build_record"):
+            record = build_record(allergen_statement)
+        st.session_state["out_of_spec"] = evaluate(record, catalogue).failed
+        st.session_state["preview_job"] = render_queue.submit(
+            record, layout=pdf_layout, preview=(preview_format, preview_dpi), timer=timer)
+        st.session_state.pop("preview_ready", None)
 
     if st.button("Compile and Generate PDF"):
-        data = {
-            "product_name": product_name,
-            "botanical_name": botanical_name,
-            "chemical_name": chemical_name,
-            "cas_no": cas_no,
-            "product_code": product_code,
-            "batch_no": batch_no,
-            "manufacturing_date": manufacturing_date,
-            "reanalysis_date": reanalysis_date,
-            "quantity": quantity,
-            "origin": origin,
-
-            "description_spec": st.session_state["description_spec"],
-            "description_result": st.session_state["description_result"],
-            "description_method": st.session_state["description_method"],
-
-            "identification_spec": st.session_state["identification_spec"],
-            "identification_result": st.session_state["identification_result"],
-            "identification_method": st.session_state["identification_method"],
-
-            "loss_on_drying_spec": st.session_state["loss_on_drying_spec"],
-            "loss_on_drying_result": st.session_state["loss_on_drying_result"],
-            "loss_on_drying_method": st.session_state["loss_on_drying_method"],
-
-            "moisture_spec": st.session_state["moisture_spec"],
-            "moisture_result": st.session_state["moisture_result"],
-            "moisture_method": st.session_state["moisture_method"],
-
-            "particle_size_spec": st.session_state["particle_size_spec"],
-            "particle_size_result": st.session_state["particle_size_result"],
-            "particle_size_method": st.session_state["particle_size_method"],
-
-            "ash_contents_spec": st.session_state["ash_contents_spec"],
-            "ash_contents_result": st.session_state["ash_contents_result"],
-            "ash_contents_method": st.session_state["ash_contents_method"],
-
-            "residue_on_ignition_spec": st.session_state["residue_on_ignition_spec"],
-            "residue_on_ignition_result": st.session_state["residue_on_ignition_result"],
-            "residue_on_ignition_method": st.session_state["residue_on_ignition_method"],
-
-            "bulk_density_spec": st.session_state["bulk_density_spec"],
-            "bulk_density_result": st.session_state["bulk_density_result"],
-            "bulk_density_method": st.session_state["bulk_density_method"],
-
-            "tapped_density_spec": st.session_state["tapped_density_spec"],
-            "tapped_density_result": st.session_state["tapped_density_result"],
-            "tapped_density_method": st.session_state["tapped_density_method"],
-
-            "solubility_spec": st.session_state["solubility_spec"],
-            "solubility_result": st.session_state["solubility_result"],
-            "solubility_method": st.session_state["solubility_method"],
-
-            "ph_spec": st.session_state["ph_spec"],
-            "ph_result": st.session_state["ph_result"],
-            "ph_method": st.session_state["ph_method"],
-
-            "chlorides_nacl_spec": st.session_state["chlorides_nacl_spec"],
-            "chlorides_nacl_result": st.session_state["chlorides_nacl_result"],
-            "chlorides_nacl_method": st.session_state["chlorides_nacl_method"],
-
-            "sulphates_spec": st.session_state["sulphates_spec"],
-            "sulphates_result": st.session_state["sulphates_result"],
-            "sulphates_method": st.session_state["sulphates_method"],
-
-            "fats_spec": st.session_state["fats_spec"],
-            "fats_result": st.session_state["fats_result"],
-            "fats_method": st.session_state["fats_method"],
-
-            "protein_spec": st.session_state["protein_spec"],
-            "protein_result": st.session_state["protein_result"],
-            "protein_method": st.session_state["protein_method"],
-
-            "total_ig_g_spec": st.session_state["total_ig_g_spec"],
-            "total_ig_g_result": st.session_state["total_ig_g_result"],
-            "total_ig_g_method": st.session_state["total_ig_g_method"],
-
-            "sodium_spec": st.session_state["sodium_spec"],
-            "sodium_result": st.session_state["sodium_result"],
-            "sodium_method": st.session_state["sodium_method"],
-
-            "gluten_spec": st.session_state["gluten_spec"],
-            "gluten_result": st.session_state["gluten_result"],
-            "gluten_method": st.session_state["gluten_method"],
-
-            "lead_spec": st.session_state["lead_spec"],
-            "lead_result": st.session_state["lead_result"],
-            "lead_method": st.session_state["lead_method"],
-
-            "cadmium_spec": st.session_state["cadmium_spec"],
-            "cadmium_result": st.session_state["cadmium_result"],
-            "cadmium_method": st.session_state["cadmium_method"],
-
-            "arsenic_spec": st.session_state["arsenic_spec"],
-            "arsenic_result": st.session_state["arsenic_result"],
-            "arsenic_method": st.session_state["arsenic_method"],
-
-            "mercury_spec": st.session_state["mercury_spec"],
-            "mercury_result": st.session_state["mercury_result"],
-            "mercury_method": st.session_state["mercury_method"],
-
-            "assays_spec": st.session_state["assays_spec"],
-            "assays_result": st.session_state["assays_result"],
-            "assays_method": st.session_state["assays_method"],
-
-            "pesticide_spec": st.session_state["pesticide_spec"],
-            "pesticide_result": st.session_state["pesticide_result"],
-            "pesticide_method": st.session_state["pesticide_method"],
-
-            "residual_solvent_spec": st.session_state["residual_solvent_spec"],
-            "residual_solvent_result": st.session_state["residual_solvent_result"],
-            "residual_solvent_method": st.session_state["residual_solvent_method"],
-
-            "total_plate_count_spec": st.session_state["total_plate_count_spec"],
-            "total_plate_count_result": st.session_state["total_plate_count_result"],
-            "total_plate_count_method": st.session_state["total_plate_count_method"],
-
-            "yeasts_mould_spec": st.session_state["yeasts_mould_spec"],
-            "yeasts_mould_result": st.session_state["yeasts_mould_result"],
-            "yeasts_mould_method": st.session_state["yeasts_mould_method"],
-
-            "salmonella_spec": st.session_state["salmonella_spec"],
-            "salmonella_result": st.session_state["salmonella_result"],
-            "salmonella_method": st.session_state["salmonella_method"],
-
-            "e_coli_spec": st.session_state["e_coli_spec"],
-            "e_coli_result": st.session_state["e_coli_result"],
-            "e_coli_method": st.session_state["e_coli_method"],
-
-            "coliforms_spec": st.session_state["coliforms_spec"],
-            "coliforms_result": st.session_state["coliforms_result"],
-            "coliforms_method": st.session_state["coliforms_method"],
-
-            "allergen_statement": allergen_statement,
-
-            "physical_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["Physical_rows"]
-            ],
-            "others_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["Others_rows"]
-            ],
-            "assays_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["Assays_rows"]
-            ],
-            "pesticides_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["Pesticides_rows"]
-            ],
-            "residual_solvent_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["ResidualSolvent_rows"]
-            ],
-            "microbio_extra_rows": [
-                (row["param"], row["spec"], row["result"], row["method"])
-                for row in st.session_state["MicrobiologicalProfile_rows"]
-            ],
-            "product_additional_rows": [
-                (row["label"], row["value"])
-                for row in st.session_state["Product_rows"]
-            ],
-        }
-
-        pdf_buffer = generate_pdf(data)
-        if pdf_buffer:
-            st.download_button(
-                label="Download COA PDF",
-                data=pdf_buffer,
-                file_name=(product_name or "COA") + ".pdf",
-                mime="application/pdf"
+        timer = StageTimer(source="compile")
+        with timer.stage("build_record"):
+            record = build_record(allergen_statement)
+        st.session_state["out_of_spec"] = evaluate(record, catalogue).failed
+        st.session_state["compile_job"] = render_queue.submit(record, layout=pdf_layout, timer=timer,
+                                                              archive=True)
+        st.session_state["compile_name"] = (record.product_name or "COA") + ".pdf"
+        st.session_state.pop("compile_ready", None)
+
+    if st.session_state.get("out_of_spec"):
+        st.warning("Out of specification: " + "; ".join(
+            f"{param} {result} ({spec})" for _, param, spec, result in st.session_state["out_of_spec"]))
+
+    if "compile_job" in st.session_state:
+        watch_job("compile_job", "compile_ready", "PDF")
+    compile_job = render_queue.get(st.session_state.get("compile_ready"))
+    if compile_job is not None:
+        st.download_button(
+            label="Download COA PDF",
+            data=compile_job.pdf,
+            file_name=st.session_state["compile_name"],
+            mime="application/pdf"
+        )
+        st.success("COA PDF generated and ready for download!")
+
+    # ----------- BULK EXPORT -----------
+    # A ZIP gets each COA written into it on disk as soon as it is rendered,
+    # so the export never holds more than one PDF in memory. A merged PDF is
+    # one build that stores the letterhead and fonts once for all batches.
+    with st.expander("Bulk export"):
+        uploaded = st.file_uploader("Batch records (CSV or JSONL, same keys as the form)",
+                                    type=["csv", "jsonl", "json"])
+        result_files = st.file_uploader("Instrument results (ICP-MS/LIMS CSV exports, optional)", type=["csv"],
+                                        accept_multiple_files=True)
+        export_kind = st.radio("Output", options=("ZIP of PDFs", "One merged PDF"), horizontal=True)
+        if uploaded is not None and st.button("Export"):
+            from coa_batch import iter_records, export_zip, export_merged
+            try:
+                records = list(iter_records(uploaded, uploaded.name, errors="report"))
+            except ValueError as exc:
+                records = None
+                st.error(f"Could not read {uploaded.name}: {exc}")
+            if records is not None and result_files:
+                # Results for all batches, matched on the batch number.
+                from coa_import import read_results, apply_results
+                imported = []
+                for result_file in result_files:
+                    try:
+                        imported.append(read_results(result_file))
+                    except ValueError as exc:
+                        st.error(f"Could not read {result_file.name}: {exc}")
+                        records = None
+                if records is not None:
+                    records, missing = apply_results(records, imported)
+                    unmapped = sorted({name for result in imported for name in result.unmapped})
+                    st.caption(f"Imported {sum(len(result.rows) for result in imported)} results"
+                               + (f"; no batch record for {', '.join(missing)}" if missing else "")
+                               + (f"; not mapped: {', '.join(unmapped)}" if unmapped else ""))
+            if records is not None:
+                old_export = st.session_state.pop("export_file", None)
+                if old_export:
+                    shutil.rmtree(os.path.dirname(old_export[0]), ignore_errors=True)
+                sweep_exports()
+                merged = export_kind == "One merged PDF"
+                suffix = ".pdf" if merged else ".zip"
+                export_path = os.path.join(tempfile.mkdtemp(prefix="coa_export_", dir=get_export_dir()),
+                                           "COAs" + suffix)
+                with open(export_path, "wb") as fh:
+                    if merged:
+                        with st.spinner(f"Rendering {len(records)} COAs into one PDF"):
+                            try:
+                                results = export_merged(records, fh, layout=pdf_layout)
+                            except Exception as exc:
+                                results = None
+                                st.error(f"Merged export failed: {type(exc).__name__}: {exc}")
+                    else:
+                        progress = st.progress(0.0, text=f"0/{len(records)} COAs")
+
+                        def report_progress(done, result):
+                            progress.progress(done / len(records), text=f"{done}/{len(records)} COAs")
+
+                        results = export_zip(records, fh, layout=pdf_layout, progress=report_progress)
+                if results is None or (merged and not any(r["ok"] for r in results)):
+                    # Nothing was written to offer for download.
+                    shutil.rmtree(os.path.dirname(export_path), ignore_errors=True)
+                else:
+                    st.session_state["export_file"] = (export_path, suffix)
+                if results is not None:
+                    failed = [r for r in results if not r["ok"]]
+                    if failed and merged:
+                        st.warning(f"{len(failed)} of {len(results)} records left out of the PDF: "
+                                   + "; ".join(f"record {r['index'] + 1}: {r['error']}" for r in failed[:5])
+                                   + ("; ..." if len(failed) > 5 else ""))
+                    elif failed:
+                        st.warning(f"{len(failed)} of {len(results)} records failed; "
+                                   "see summary.json in the ZIP.")
+        export_file = st.session_state.get("export_file")
+        if export_file and os.path.exists(export_file[0]):
+            path, suffix = export_file
+            with open(path, "rb") as fh:
+                st.download_button(f"Download {suffix[1:].upper()}", data=fh, file_name="COAs" + suffix,
+                                   mime="application/pdf" if suffix == ".pdf" else "application/zip")
+
+    # ----------- ARCHIVE SEARCH -----------
+    with st.expander("Search issued COAs"):
+        coa_archive = get_coa_archive()
+        search_text = st.text_input("Text (product, batch, parameter, result...)", key="archive_text")
+        col_code, col_batch = st.columns(2)
+        search_code = col_code.text_input("Product code", key="archive_code")
+        search_batch = col_batch.text_input("Batch no.", key="archive_batch")
+        col_param, col_min = st.columns(2)
+        search_param = col_param.text_input("Parameter", key="archive_param", placeholder="e.g. Lead")
+        search_min = col_min.number_input("Result above", value=None, key="archive_min", format="%g")
+        if any((search_text, search_code, search_batch, search_param)):
+            matches = coa_archive.search(
+                fts_query(search_text) if search_text else None,
+                product_code=search_code or None, batch_no=search_batch or None,
+                parameter=search_param or None, min_value=search_min if search_param else None,
             )
-            st.success("COA PDF generated and ready for download!")
+            for row in matches:
+                row["issued_at"] = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["issued_at"]))
+            st.caption(f"{len(matches)} COAs (newest first, up to 100)")
+            if matches:
+                st.dataframe(matches, hide_index=True)
+                chosen = st.selectbox("COA", options=[row["id"] for row in matches], key="archive_choice",
+                                      format_func=lambda i: next(f"#{r['id']} {r['batch_no']} {r['product_name']}"
+                                                                 for r in matches if r["id"] == i))
+                st.download_button("Download archived PDF", data=coa_archive.get_pdf(chosen),
+                                   file_name=f"COA_{chosen}.pdf", mime="application/pdf")
+
+    cache_stats = pdf_cache.stats()
+    st.caption(
+        f"PDF cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1024:.0f} KiB)"
+    )
+    if "coa_pdf" in sys.modules:  # only once a worker has loaded ReportLab
+        # A worker may still be importing it; the import waits until it is done.
+        from coa_pdf import paragraph_memo
+        memo_stats = paragraph_memo.stats()
+        st.caption(
+            f"Paragraph memo: {memo_stats['hits']} reused / {memo_stats['misses']} parsed rows, "
+            f"~{memo_stats['parse_ms_saved']:.0f} ms of parsing saved"
+        )
+    if "coa_optimize" in sys.modules:  # only once a PDF has been post-processed
+        from coa_optimize import optimize_stats
+        optimized = optimize_stats.stats()
+        st.caption(
+            f"PDF optimization: {optimized['documents']} PDFs, {optimized['saved']:.0%} smaller, "
+            f"{optimized['ms_per_document']:.0f} ms each"
+        )
+
+with col2:
+    if "preview_job" in st.session_state:
+        watch_job("preview_job", "preview_ready", "Preview")
+    preview_job = render_queue.get(st.session_state.get("preview_ready"))
+    if preview_job is not None:
+        show_preview(preview_job.pdf, preview_job.preview[0], preview_job.preview[1])
+        st.success("Preview generated successfully!")
+
+record_rerun("full", time.perf_counter() - _run_start)
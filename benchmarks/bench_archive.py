@@ -0,0 +1,75 @@
+"""
+Fill a scratch COA archive with synthetic records and time typical queries.
+
+    python benchmarks/bench_archive.py --records 100000
+
+PDFs are replaced by a small placeholder blob; only the index layout matters here.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_generate import all_base_data  # noqa: E402
+from coa_archive import COAArchive  # noqa: E402
+
+PRODUCTS = [("ASH", "Ashwagandha Extract"), ("TUR", "Turmeric Extract"), ("BAC", "Bacopa Extract"),
+            ("GIN", "Ginger Extract"), ("MOR", "Moringa Leaf Powder")]
+
+
+def synthetic(i, rng):
+    code, name = PRODUCTS[i % len(PRODUCTS)]
+    data = all_base_data()
+    data.update({
+        "product_code": f"{code}-{i % 500:03d}",
+        "product_name": name,
+        "batch_no": f"{code}{i:07d}",
+        "manufacturing_date": f"{rng.randint(1, 12):02d}/{rng.randint(2020, 2026)}",
+        "lead_result": f"{rng.uniform(0, 1):.2f} ppm",
+        "cadmium_result": f"{rng.uniform(0, 0.5):.2f} ppm",
+    })
+    return data
+
+
+def timed(label, fn, repeat=5):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = fn()
+    print(f"{label:<44} {(time.perf_counter() - start) / repeat * 1000:>8.2f} ms  ({len(rows)} rows)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--db", default=None, help="archive path (default: a temporary file)")
+    args = parser.parse_args(argv)
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_archive.db")
+    archive = COAArchive(path)
+    rng = random.Random(0)
+    pdf = b"%PDF-1.4 placeholder" * 50
+    start = time.perf_counter()
+    for i in range(archive.count(), args.records):
+        archive.add(synthetic(i, rng), pdf, issued_at=1.7e9 + i * 60)
+    print(f"{args.records} COAs in {path} (filled in {time.perf_counter() - start:.1f}s)")
+
+    last = f"ASH{(args.records - 1) // 5 * 5:07d}"
+    timed("batch no.", lambda: archive.search(batch_no=last))
+    timed("product code, newest 100", lambda: archive.search(product_code="TUR-001"))
+    timed("full text 'bacopa'", lambda: archive.search("bacopa"))
+    timed("full text 'moringa AND lead'", lambda: archive.search("moringa AND lead", limit=20))
+    timed("lead > 0.99 ppm", lambda: archive.search(parameter="Lead", min_value=0.99))
+    timed("manufactured 03/2024", lambda: archive.search(manufacturing_date="03/2024"))
+    timed("issued in one day", lambda: archive.search(issued_from=1.7e9 + 86400, issued_to=1.7e9 + 2 * 86400,
+                                                      limit=10000))
+    timed("load data + pdf", lambda: [archive.get_record(1), archive.get_pdf(1)])
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Time spec evaluation: per COA (the PDF remark) and over a whole archive.
+
+    python benchmarks/bench_compliance.py --records 20000
+    python benchmarks/bench_compliance.py --db coa_archive.db --records 0
+
+The scratch archive holds bench_archive's synthetic records with lead up
+to 1.2 ppm against "Not more than 1 ppm" and cadmium up to 0.5 ppm against
+"NMT 0.3 ppm", so about half the COAs are out of spec. "row by row" reads
+every result row and checks it in Python, for comparison with
+review_archive.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_archive import synthetic  # noqa: E402
+from bench_generate import CASES  # noqa: E402
+from coa_archive import COAArchive  # noqa: E402
+from coa_compliance import check, compile_spec, parse_result, evaluate, review_archive  # noqa: E402
+from coa_record import COARecord  # noqa: E402
+
+
+def per_record(repeat=200):
+    print(f"{'case':<12} {'rows':>6} {'cold ms':>8} {'warm ms':>8}")
+    for name in ("all_base", "extra_100", "extra_1000"):
+        record = COARecord.from_data(CASES[name]())
+        compile_spec.cache_clear()
+        parse_result.cache_clear()
+        t0 = time.perf_counter()
+        compliance = evaluate(record)
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            evaluate(record)
+        warm = (time.perf_counter() - t0) / repeat
+        print(f"{name:<12} {compliance.checked:>6} {cold * 1000:>8.2f} {warm * 1000:>8.2f}")
+
+
+def row_by_row(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT coa_id, spec, result FROM coa_results").fetchall()
+    conn.close()
+    return [row for row in rows if check(row[1], row[2]) is False]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--db", default=None, help="archive path (default: a temporary file)")
+    args = parser.parse_args(argv)
+
+    per_record()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_compliance.db")
+    archive = COAArchive(path)
+    rng = random.Random(0)
+    pdf = b"%PDF-1.4 placeholder"
+    start = time.perf_counter()
+    for i in range(archive.count(), args.records):
+        data = synthetic(i, rng)
+        data.update(lead_spec="Not more than 1 ppm", lead_result=f"{rng.uniform(0, 1.2):.2f} ppm",
+                    cadmium_spec="NMT 0.3 ppm", bulk_density_spec="Between 0.3g/ml to 0.6g/ml")
+        archive.add(data, pdf, issued_at=1.7e9 + i * 60)
+    print(f"\n{archive.count()} COAs in {path} (filled in {time.perf_counter() - start:.1f}s)")
+
+    compile_spec.cache_clear()
+    parse_result.cache_clear()
+    t0 = time.perf_counter()
+    review = review_archive(archive)
+    elapsed = time.perf_counter() - t0
+    print(f"{'review_archive':<16} {elapsed:>7.2f} s  {review.rows} rows, {review.checked} evaluated, "
+          f"{len(review.failures)} out of spec in {len({row[0] for row in review.failures})} COAs")
+    t0 = time.perf_counter()
+    failures = row_by_row(path)
+    print(f"{'row by row':<16} {time.perf_counter() - t0:>7.2f} s  {len(failures)} out of spec")
+    archive.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
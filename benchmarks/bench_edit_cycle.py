@@ -0,0 +1,55 @@
+"""
+Time the edit-and-preview cycle: change one result, render again.
+
+    python benchmarks/bench_edit_cycle.py
+    python benchmarks/bench_edit_cycle.py --case extra_100 --layout paged
+
+Every cycle renders the COA with a different lead result, once with the
+paragraph memo disabled and once with it enabled, and reports the time saved.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import coa_pdf  # noqa: E402
+from bench_generate import CASES  # noqa: E402
+from coa_pdf import generate_pdf, ParagraphMemo, LAYOUTS, DEFAULT_LAYOUT  # noqa: E402
+
+
+def run_cycles(data, layout, cycles, memo):
+    coa_pdf.paragraph_memo = memo
+    samples = []
+    for i in range(cycles + 1):
+        data["lead_result"] = f"{0.1 + i / 1000:.3f} ppm"
+        t0 = time.perf_counter()
+        generate_pdf(data, layout=layout)
+        samples.append(time.perf_counter() - t0)
+    # The first render fills the memo; the cycles after it are the edits.
+    return samples[1:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--case", choices=sorted(CASES), default="all_base")
+    parser.add_argument("--layout", choices=LAYOUTS, nargs="+", default=[DEFAULT_LAYOUT])
+    parser.add_argument("--cycles", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    generate_pdf(CASES["defaults"](), layout=args.layout[0])
+    print(f"{'layout/case':<24} {'cold ms':>9} {'memo ms':>9} {'saved':>7}  memo")
+    for layout in args.layout:
+        cold = statistics.median(run_cycles(CASES[args.case](), layout, args.cycles, ParagraphMemo(0)))
+        memo = ParagraphMemo()
+        warm = statistics.median(run_cycles(CASES[args.case](), layout, args.cycles, memo))
+        stats = memo.stats()
+        print(f"{layout + '/' + args.case:<24} {cold * 1000:>9.1f} {warm * 1000:>9.1f} {1 - warm / cold:>7.0%}"
+              f"  {stats['hits']} hits / {stats['misses']} misses")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
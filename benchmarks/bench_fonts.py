@@ -0,0 +1,99 @@
+"""
+Compare base-14 fonts with embedded TrueType fonts: PDF size and render time.
+
+    python benchmarks/bench_fonts.py
+    python benchmarks/bench_fonts.py --font-dir /path/to/fonts --family Corporate
+
+Without --font-dir, ReportLab's bundled Vera family is used. Each
+configuration runs in its own process, because the font settings are read
+once per process. "register ms" is the one-off cost of parsing the font
+files; "full TTF" is what embedding the whole files would add to every PDF.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+VERA = {"Regular": "Vera.ttf", "Bold": "VeraBd.ttf", "Italic": "VeraIt.ttf", "BoldItalic": "VeraBI.ttf"}
+
+
+def child(cases, layout, repeat):
+    # Runs inside the configured process; prints one JSON line.
+    from coa_fonts import font_map
+    t0 = time.perf_counter()
+    font_map()
+    register = time.perf_counter() - t0
+
+    from bench_generate import CASES
+    from coa_pdf import generate_pdf, paragraph_memo
+    results = {"register_ms": register * 1000, "cases": {}}
+    for name in cases:
+        samples = []
+        for _ in range(repeat):
+            paragraph_memo.clear()
+            t0 = time.perf_counter()
+            size = len(generate_pdf(CASES[name](), layout=layout).getvalue())
+            samples.append(time.perf_counter() - t0)
+        results["cases"][name] = {"cold_ms": samples[0] * 1000,
+                                  "median_ms": statistics.median(samples[1:] or samples) * 1000,
+                                  "bytes": size}
+    print(json.dumps(results))
+
+
+def run(env, args):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--layout", args.layout,
+               "--repeat", str(args.repeat), "--case", *args.case]
+    out = subprocess.run(command, env={**os.environ, **env}, cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def vera_dir(target):
+    import reportlab
+    source = os.path.join(os.path.dirname(reportlab.__file__), "fonts")
+    for face, name in VERA.items():
+        shutil.copy(os.path.join(source, name), os.path.join(target, f"Vera-{face}.ttf"))
+    return target, "Vera"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--font-dir")
+    parser.add_argument("--family")
+    parser.add_argument("--case", nargs="+", default=["defaults", "all_base", "extra_100"])
+    parser.add_argument("--layout", default="paged")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child(args.case, args.layout, args.repeat)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        font_dir, family = (args.font_dir, args.family) if args.font_dir else vera_dir(tmp)
+        full = sum(os.path.getsize(os.path.join(font_dir, name)) for name in os.listdir(font_dir)
+                   if name.startswith(f"{family}-") and name.endswith(".ttf"))
+        configs = {
+            "base-14": run({"COA_FONT_DIR": "", "COA_FONT_FAMILY": ""}, args),
+            family: run({"COA_FONT_DIR": font_dir, "COA_FONT_FAMILY": family}, args),
+        }
+
+    print(f"full TTF files for {family}: {full / 1024:.1f} KiB")
+    print(f"{'fonts/case':<22} {'register ms':>11} {'cold ms':>9} {'median ms':>10} {'KiB':>8}")
+    for config, results in configs.items():
+        for name, case in results["cases"].items():
+            print(f"{config + '/' + name:<22} {results['register_ms']:>11.1f} {case['cold_ms']:>9.1f}"
+                  f" {case['median_ms']:>10.1f} {case['bytes'] / 1024:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Micro-benchmarks for generate_pdf across data shapes, checked against JSON baselines.
+
+    python benchmarks/bench_generate.py                   # compare with the baseline
+    python benchmarks/bench_generate.py --save-baseline   # record a new baseline
+    python benchmarks/bench_generate.py --only extra_10 --no-letterhead
+
+Each case is run with and without the letterhead images. A run fails (exit
+code 1) when a case is slower than its baseline by more than --time-threshold
+or larger by more than --size-threshold. Timings are machine-specific, so
+record the baseline on the machine that runs the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from coa_catalogue import load_catalogue, FIELDS  # noqa: E402
+from coa_pdf import generate_pdf, paragraph_memo, LAYOUTS, DEFAULT_LAYOUT  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "generate_pdf.json")
+LONG_SPEC = ("Not more than 10 ppm when tested as per the in-house method after drying at 105 degrees "
+             "for three hours, calculated on the dried basis and reported to one decimal place. ") * 4
+
+PRODUCT_INFO = {
+    "product_name": "Benchmark Extract",
+    "product_code": "BE-001",
+    "batch_no": "BENCH-001",
+    "manufacturing_date": "01/2026",
+    "reanalysis_date": "12/2028",
+    "botanical_name": "Withania somnifera",
+    "extraction_ratio": "10:1",
+    "solvent": "Water",
+    "plant_part": "Root",
+    "quantity": "500 kg",
+    "origin": "India",
+}
+
+
+# ----------------------------------------------------------------------------
+# DATA SHAPES
+# ----------------------------------------------------------------------------
+def defaults_data():
+    # What an untouched form submits: the catalogue defaults and nothing else.
+    catalogue = load_catalogue()
+    data = defaultdict(str)
+    for p in catalogue.parameters:
+        for field, value in zip(FIELDS, p.defaults):
+            data[p.field_key(field)] = value
+    for key in catalogue.extra_keys:
+        data[key] = []
+    data["product_additional_rows"] = []
+    return data
+
+
+def all_base_data(spec=None):
+    data = defaults_data()
+    data.update(PRODUCT_INFO)
+    for p in load_catalogue().parameters:
+        data[p.field_key("spec")] = spec or data[p.field_key("spec")] or "Not more than 1 ppm"
+        data[p.field_key("result")] = data[p.field_key("result")] or "Complies"
+        data[p.field_key("method")] = data[p.field_key("method")] or "In-house"
+    return data
+
+
+def extra_rows_data(n):
+    data = all_base_data()
+    for key in load_catalogue().extra_keys:
+        data[key] = [(f"Analyte {i}", f"Not more than {i} ppm", f"{i / 10:.1f} ppm", "ICP-MS")
+                     for i in range(n)]
+    return data
+
+
+CASES = {
+    "defaults": defaults_data,
+    "all_base": all_base_data,
+    "extra_10": lambda: extra_rows_data(10),
+    "extra_100": lambda: extra_rows_data(100),
+    "extra_1000": lambda: extra_rows_data(1000),
+    "long_specs": lambda: all_base_data(spec=LONG_SPEC),
+}
+
+
+# ----------------------------------------------------------------------------
+# RUNNING
+# ----------------------------------------------------------------------------
+def page_count(pdf_bytes):
+    return pdf_bytes.count(b"/Type /Page\n") or pdf_bytes.count(b"/Type /Page ")
+
+
+def run_case(data, layout, letterhead, repeat, budget):
+    samples = []
+    start = time.perf_counter()
+    # Large cases stop early once the time budget is spent (at least one sample).
+    while len(samples) < repeat and (not samples or time.perf_counter() - start < budget):
+        # Cold renders: repeated identical data would otherwise be served
+        # from the paragraph memo (see bench_edit_cycle.py for that case).
+        paragraph_memo.clear()
+        t0 = time.perf_counter()
+        pdf_bytes = generate_pdf(data, layout=layout, letterhead=letterhead).getvalue()
+        samples.append(time.perf_counter() - t0)
+    return {
+        "ms": round(min(samples) * 1000, 2),
+        "bytes": len(pdf_bytes),
+        "pages": page_count(pdf_bytes),
+        "samples": len(samples),
+    }
+
+
+def compare(results, baseline, time_threshold, size_threshold):
+    failures = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["ms"] > base["ms"] * (1 + time_threshold):
+            failures.append(f"{name}: {result['ms']:.1f} ms vs baseline {base['ms']:.1f} ms "
+                            f"(+{result['ms'] / base['ms'] - 1:.0%})")
+        if result["bytes"] > base["bytes"] * (1 + size_threshold):
+            failures.append(f"{name}: {result['bytes']} bytes vs baseline {base['bytes']} bytes "
+                            f"(+{result['bytes'] / base['bytes'] - 1:.0%})")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=sorted(CASES), help="run only these cases")
+    parser.add_argument("--layout", choices=LAYOUTS, default=DEFAULT_LAYOUT)
+    parser.add_argument("--no-letterhead", action="store_true", help="skip the with-letterhead runs")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case (the minimum is kept)")
+    parser.add_argument("--budget", type=float, default=10.0, help="max seconds of timed runs per case")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--time-threshold", type=float, default=0.25, help="allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--size-threshold", type=float, default=0.05, help="allowed size growth (0.05 = 5%%)")
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT)
+    letterheads = (False,) if args.no_letterhead else (True, False)
+    results = {}
+    # One small warm-up render pays for imports, fonts and the letterhead images.
+    generate_pdf(defaults_data(), layout=args.layout)
+    print(f"{'case':<28} {'ms':>10} {'bytes':>10} {'pages':>5}")
+    for case in args.only or CASES:
+        data = CASES[case]()
+        for letterhead in letterheads:
+            name = f"{args.layout}/{case}/{'letterhead' if letterhead else 'plain'}"
+            result = results[name] = run_case(data, args.layout, letterhead, args.repeat, args.budget)
+            print(f"{name:<28} {result['ms']:>10.1f} {result['bytes']:>10} {result['pages']:>5}")
+
+    if args.save_baseline:
+        baseline = {"machine": platform.platform(), "python": platform.python_version(), "cases": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as fh:
+                baseline = json.load(fh)
+        baseline["cases"].update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+        return 0
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)["cases"]
+    failures = compare(results, baseline, args.time_threshold, args.size_threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Time the instrument-result import on a synthetic ICP-MS/LIMS export.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --rows 1000000 --chunksize 50000 100000
+
+The export has 16 analytes per batch (metals in ppb, microbiology counts,
+pathogens and solvents), a third of them censored ("<0.5") or "ND".
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coa_import import read_results, records_from_results, CHUNK_ROWS  # noqa: E402
+
+ANALYTES = (
+    ("208Pb", "ppb"), ("111Cd", "ppb"), ("75As", "ppb"), ("202Hg", "ppb"), ("66Zn", "ppb"), ("63Cu", "ppb"),
+    ("60Ni", "ppb"), ("52Cr", "ppb"), ("TAMC", "cfu/g"), ("TYMC", "cfu/g"), ("Salmonella", ""),
+    ("E. coli", ""), ("Ethanol", "ppm"), ("Hexane", "ppm"), ("Acetone", "ppm"), ("Methanol", "ppm"),
+)
+
+
+def write_export(path, rows, seed=1):
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["Sample ID", "Analyte", "Result", "Units", "Method"])
+        for i in range(rows):
+            analyte, unit = ANALYTES[i % len(ANALYTES)]
+            if not unit:
+                result = "Absent"
+            elif unit == "cfu/g":
+                result = str(rng.randint(10, 50000))
+            else:
+                result = rng.choice((f"{rng.random() * 200:.3f}", f"{rng.random() * 20:.2f}", "<0.5", "ND"))
+            writer.writerow([f"BATCH-{i // len(ANALYTES):06d}", analyte, result, unit, ""])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunksize", type=int, nargs="+", default=[CHUNK_ROWS])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.csv")
+        write_export(path, args.rows)
+        print(f"{args.rows} rows, {os.path.getsize(path) / 1e6:.1f} MB")
+        print(f"{'chunk rows':>10} {'read s':>8} {'rows/s':>10} {'peak MB':>8} {'apply s':>8} {'batches':>8}")
+        for chunksize in args.chunksize:
+            t0 = time.perf_counter()
+            imported = read_results(path, chunksize=chunksize)
+            read = time.perf_counter() - t0
+            # A second pass for memory: tracing allocations slows the read down.
+            tracemalloc.start()
+            read_results(path, chunksize=chunksize)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            t0 = time.perf_counter()
+            records = records_from_results(imported)
+            apply = time.perf_counter() - t0
+            print(f"{chunksize:>10} {read:>8.2f} {args.rows / read:>10.0f} {peak / 1e6:>8.1f} {apply:>8.2f}"
+                  f" {len(records):>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
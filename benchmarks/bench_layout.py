@@ -0,0 +1,72 @@
+"""
+Compare the KeepInFrame "shrink" layout with the single-pass "fit" layout.
+
+    python benchmarks/bench_layout.py --rows 0 10 25 50 100 --repeat 5
+
+Every sample is a cold render: the paragraph memo is cleared first, as
+identical data would otherwise skip the parsing and line breaking the
+layouts are compared on. --memo keeps it (an unchanged re-render).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coa_pdf import generate_pdf, paragraph_memo, LAYOUTS  # noqa: E402
+
+
+def make_data(extra_rows):
+    data = defaultdict(str, {
+        "product_name": "Benchmark Extract",
+        "batch_no": "BENCH-001",
+        "description_spec": "Brown powder with characteristic taste and odour",
+        "description_result": "Complies",
+        "description_method": "Physical",
+        "lead_spec": "Not more than 1 ppm",
+        "lead_result": "0.2 ppm",
+        "lead_method": "ICP-MS",
+    })
+    data["others_extra_rows"] = [
+        (f"Analyte {i}", f"Not more than {i} ppm", f"{i / 10:.1f} ppm", "ICP-MS")
+        for i in range(extra_rows)
+    ]
+    return data
+
+
+def time_render(data, layout, repeat, memo=False):
+    generate_pdf(data, layout=layout)  # warm-up
+    samples = []
+    for _ in range(repeat):
+        if not memo:
+            paragraph_memo.clear()
+        start = time.perf_counter()
+        pdf_bytes = generate_pdf(data, layout=layout).getvalue()
+        samples.append(time.perf_counter() - start)
+    return min(samples), pdf_bytes
+
+
+def page_count(pdf_bytes):
+    return pdf_bytes.count(b"/Type /Page\n") or pdf_bytes.count(b"/Type /Page ")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[0, 10, 25, 50, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--memo", action="store_true", help="keep the paragraph memo between samples")
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>5}  " + "  ".join(f"{layout + ' ms':>10} {'pages':>5}" for layout in LAYOUTS) + "  speedup")
+    for rows in args.rows:
+        data = make_data(rows)
+        results = {layout: time_render(data, layout, args.repeat, args.memo) for layout in LAYOUTS}
+        cells = "  ".join(f"{t * 1000:>10.1f} {page_count(b):>5}" for t, b in results.values())
+        speedup = results["shrink"][0] / results["fit"][0]
+        print(f"{rows:>5}  {cells}  {speedup:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Measure the PDF post-processing stage: size before/after and time taken.
+
+    python benchmarks/bench_optimize.py
+    python benchmarks/bench_optimize.py --dpi 96 --quality 75 --linearize
+
+Each case is rendered once without post-processing, then optimized
+--repeat times; the median optimize time is reported. "merged_50" is one
+merged PDF of 50 all_base COAs with different batch numbers.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_generate import CASES  # noqa: E402
+from coa_config import PRINT_DPI, IMAGE_QUALITY  # noqa: E402
+from coa_optimize import optimize_pdf  # noqa: E402
+from coa_pdf import generate_pdf, generate_merged_pdf, LAYOUTS, DEFAULT_LAYOUT  # noqa: E402
+
+
+def render(name, layout):
+    t0 = time.perf_counter()
+    if name == "merged_50":
+        records = [{**CASES["all_base"](), "batch_no": f"BENCH-{i:03d}"} for i in range(50)]
+        pdf_bytes = generate_merged_pdf(records, layout=layout, optimize=False).getvalue()
+    else:
+        pdf_bytes = generate_pdf(CASES[name](), layout=layout, optimize=False).getvalue()
+    return pdf_bytes, time.perf_counter() - t0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--case", nargs="+", default=["defaults", "all_base", "extra_100", "merged_50"],
+                        choices=sorted(CASES) + ["merged_50"])
+    parser.add_argument("--layout", choices=LAYOUTS, default=DEFAULT_LAYOUT)
+    parser.add_argument("--dpi", type=int, default=PRINT_DPI)
+    parser.add_argument("--quality", type=int, default=IMAGE_QUALITY)
+    parser.add_argument("--linearize", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<12} {'render ms':>10} {'optimize ms':>12} {'before KiB':>11} {'after KiB':>10} {'saved':>7}")
+    for name in args.case:
+        pdf_bytes, render_seconds = render(name, args.layout)
+        samples = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            out = optimize_pdf(pdf_bytes, dpi=args.dpi, quality=args.quality, linearize=args.linearize)
+            samples.append(time.perf_counter() - t0)
+        print(f"{name:<12} {render_seconds * 1000:>10.1f} {statistics.median(samples) * 1000:>12.1f}"
+              f" {len(pdf_bytes) / 1024:>11.1f} {len(out) / 1024:>10.1f} {1 - len(out) / len(pdf_bytes):>7.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
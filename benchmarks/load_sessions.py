@@ -0,0 +1,204 @@
+"""
+Simulate concurrent QC sessions against app.py and report latency percentiles.
+
+    python benchmarks/load_sessions.py --sessions 8 --iterations 3 --json load.json
+
+Every session is an AppTest instance driven from its own thread, so all
+sessions share this process's caches and render queue like sessions on one
+server do. Each iteration fills the form, clicks Preview and clicks Compile.
+
+AppTest swaps process-global runtime state for every script run, so script
+runs are serialized here; renders still overlap on the shared job queue.
+Rerun latency therefore includes waiting for other sessions' runs, much as
+script threads on a real server wait for the GIL.
+
+Compiled COAs are archived, so the app's archive and product databases are
+pointed at --db-dir (default: a temporary directory removed afterwards)
+rather than the real ones next to app.py.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+try:
+    import psutil
+except ImportError:  # optional, only used for the current RSS
+    psutil = None
+
+APP_PATH = os.path.join(ROOT, "app.py")
+POLL_INTERVAL = 0.1
+_run_lock = threading.Lock()
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = []
+
+    def add(self, kind, seconds):
+        with self._lock:
+            self.samples.setdefault(kind, []).append(seconds)
+
+    def error(self, session, exc):
+        with self._lock:
+            self.errors.append(f"session {session}: {type(exc).__name__}: {exc}")
+
+
+def _run(element):
+    with _run_lock:
+        return element.run()
+
+
+def _timed_run(recorder, kind, element):
+    start = time.perf_counter()
+    at = _run(element)
+    recorder.add(kind, time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+def _wait_for(recorder, kind, at, message, start, timeout):
+    # The render itself runs on the job queue; poll like the fragment does.
+    while not any(s.value == message for s in at.success):
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"{kind} not ready after {timeout:.0f}s")
+        time.sleep(POLL_INTERVAL)
+        at = _run(at)
+    recorder.add(kind, time.perf_counter() - start)
+    return at
+
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def _text_input(at, label):
+    return next(t for t in at.text_input if t.label == label)
+
+
+def run_session(session, iterations, recorder, timeout):
+    try:
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        _timed_run(recorder, "rerun:initial", at)
+        for i in range(iterations):
+            # Distinct values per session/iteration so renders are not all cache hits.
+            at = _timed_run(recorder, "rerun:edit",
+                            _text_input(at, "Product Name").set_value(f"Load Test {session}"))
+            at = _timed_run(recorder, "rerun:edit",
+                            _text_input(at, "Batch No.").set_value(f"LT-{session:03d}-{i:03d}"))
+            at = _timed_run(recorder, "rerun:edit",
+                            _text_input(at, "Result for Lead").set_value(f"0.{i + 1} ppm"))
+            at = _timed_run(recorder, "rerun:add_row", _button(at, "Add New Others Row").click())
+            at = _timed_run(recorder, "rerun:edit",
+                            _text_input(at, f"Others Parameter {i + 1}").set_value(f"Analyte {i}"))
+
+            start = time.perf_counter()
+            at = _timed_run(recorder, "rerun:submit", _button(at, "Preview").click())
+            at = _wait_for(recorder, "render:preview", at, "Preview generated successfully!", start, timeout)
+
+            start = time.perf_counter()
+            at = _timed_run(recorder, "rerun:submit", _button(at, "Compile and Generate PDF").click())
+            at = _wait_for(recorder, "render:compile", at, "COA PDF generated and ready for download!",
+                           start, timeout)
+    except Exception as exc:
+        recorder.error(session, exc)
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+def current_rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent simulated sessions")
+    parser.add_argument("--iterations", type=int, default=3, help="fill/preview/compile rounds per session")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for one run or render")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    parser.add_argument("--db-dir", default=None,
+                        help="directory for the archive and product databases (default: a temporary one)")
+    args = parser.parse_args(argv)
+
+    if args.db_dir is None:
+        with tempfile.TemporaryDirectory(prefix="coa_load_") as db_dir:
+            return run(args, db_dir)
+    os.makedirs(args.db_dir, exist_ok=True)
+    return run(args, args.db_dir)
+
+
+def run(args, db_dir):
+    # Read when app.py first imports coa_archive and coa_products.
+    os.environ["COA_ARCHIVE_DB"] = os.path.join(os.path.abspath(db_dir), "coa_archive.db")
+    os.environ["COA_PRODUCTS_DB"] = os.path.join(os.path.abspath(db_dir), "coa_products.db")
+    os.chdir(ROOT)  # the app loads its letterhead images relative to the repo
+    recorder = Recorder()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        for session in range(args.sessions):
+            pool.submit(run_session, session, args.iterations, recorder, args.timeout)
+    elapsed = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime)
+    rss = current_rss_mb()
+
+    report = {
+        "sessions": args.sessions,
+        "iterations": args.iterations,
+        "seconds": round(elapsed, 3),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_utilization": round(cpu / elapsed, 3) if elapsed else 0.0,
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "rss_mb": None if rss is None else round(rss, 1),
+        "latency_ms": {},
+        "errors": recorder.errors,
+    }
+    print(f"{args.sessions} sessions x {args.iterations} iterations in {elapsed:.1f}s, "
+          f"CPU {cpu:.1f}s ({report['cpu_utilization']:.0%}), peak RSS {report['peak_rss_mb']} MiB")
+    print(f"{'kind':<16} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, samples in sorted(recorder.samples.items()):
+        p50, p95, p99 = percentiles(samples)
+        report["latency_ms"][kind] = {
+            "n": len(samples), "p50": round(p50 * 1000, 1),
+            "p95": round(p95 * 1000, 1), "p99": round(p99 * 1000, 1),
+        }
+        print(f"{kind:<16} {len(samples):>5} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f} {p99 * 1000:>9.1f}")
+    for error in recorder.errors:
+        print(f"  {error}", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 1 if recorder.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
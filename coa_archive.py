@@ -0,0 +1,363 @@
+"""
+Archive of issued COAs.
+
+Every compiled COA is stored with its record and PDF in a local
+SQLite database. Lookups by product code, batch no. and dates use B-tree
+indexes, free text goes through an FTS5 index, and numeric results are
+kept per parameter, converted to one unit per kind (ppm for mass
+fractions, cfu/g for counts), so questions like "lead above 0.5 ppm" are
+an index range scan whatever unit each COA printed.
+
+    python coa_archive.py search "ashwagandha root"
+    python coa_archive.py search --batch-no TH-2401 --pdf-dir out/
+    python coa_archive.py search --parameter Lead --min 0.5
+    python coa_archive.py search --parameter Lead --min 500 --unit ppb
+    python coa_archive.py search --manufactured 03/2025 --issued-from 2025-04-01
+    python coa_archive.py review --product-code ASH-001 --csv out_of_spec.csv
+"""
+import argparse
+import csv
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from coa_catalogue import load_catalogue
+from coa_compliance import NUMBER, UNITS, parse_result, unit_scale
+from coa_record import as_record, loads
+
+DB_PATH = os.environ.get(
+    "COA_ARCHIVE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "coa_archive.db"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS coas (
+    id                 INTEGER PRIMARY KEY,
+    product_code       TEXT NOT NULL DEFAULT '',
+    product_name       TEXT NOT NULL DEFAULT '',
+    batch_no           TEXT NOT NULL DEFAULT '',
+    manufacturing_date TEXT NOT NULL DEFAULT '',
+    reanalysis_date    TEXT NOT NULL DEFAULT '',
+    issued_at          REAL NOT NULL,
+    data               TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coas_product_code ON coas (product_code);
+CREATE INDEX IF NOT EXISTS coas_batch_no ON coas (batch_no);
+CREATE INDEX IF NOT EXISTS coas_manufacturing_date ON coas (manufacturing_date);
+CREATE INDEX IF NOT EXISTS coas_issued_at ON coas (issued_at);
+
+-- PDFs live in their own table so scans of coas never page through blobs.
+CREATE TABLE IF NOT EXISTS coa_pdfs (
+    coa_id INTEGER PRIMARY KEY REFERENCES coas (id),
+    pdf    BLOB NOT NULL
+);
+
+-- One row per printed parameter. value is the numeric result in the unit
+-- of its kind, unit that kind ('ppm', 'cfu/g', 'g/ml'; '' for a plain
+-- number); both are NULL for qualitative results and value is NULL for a
+-- unit that cannot be converted (see result_value).
+CREATE TABLE IF NOT EXISTS coa_results (
+    coa_id    INTEGER NOT NULL REFERENCES coas (id),
+    section   TEXT NOT NULL,
+    parameter TEXT NOT NULL,
+    spec      TEXT NOT NULL,
+    result    TEXT NOT NULL,
+    method    TEXT NOT NULL,
+    value     REAL,
+    unit      TEXT
+);
+CREATE INDEX IF NOT EXISTS coa_results_parameter_value ON coa_results (parameter COLLATE NOCASE, value);
+CREATE INDEX IF NOT EXISTS coa_results_coa_id ON coa_results (coa_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS coa_fts USING fts5 (
+    product_name, product_code, batch_no, body, tokenize = 'unicode61'
+);
+"""
+
+SUMMARY_COLUMNS = ("id", "product_code", "product_name", "batch_no", "manufacturing_date",
+                   "reanalysis_date", "issued_at")
+UNIT_FAMILIES = frozenset(family for family, _ in UNITS.values())
+
+
+def fts_query(text):
+    """Quote every word so free text from a form never hits FTS5 syntax errors."""
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+def result_value(result):
+    """(value, unit) of a result as indexed: "250 ppb" -> (0.25, "ppm"), "1,500 cfu/g" -> (1500.0, "cfu/g").
+
+    A censored result counts at its limit ("< 0.5 ppm" -> 0.5). Qualitative
+    results ("Absent", "Complies") give (None, None), and a unit that
+    cannot be converted gives (None, unit).
+    """
+    parsed = parse_result(str(result))
+    if parsed is None or parsed.kind != NUMBER:
+        return None, None
+    family = parsed.family or ""
+    if family and family not in UNIT_FAMILIES:
+        return None, family
+    value = parsed.high if parsed.low == -math.inf else parsed.low
+    return value * (parsed.factor or 1.0), family
+
+
+def _result_rows(record):
+    for section in load_catalogue().sections:
+        for param, spec, result, method in record.printed_rows(section):
+            yield (section.name, str(param), str(spec), str(result), str(method)) + result_value(result)
+
+
+class COAArchive:
+    # One connection shared by all sessions and render threads, guarded by a lock.
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(coa_results)")}
+            if "unit" not in columns:
+                self._reindex_values()
+
+    def _reindex_values(self):
+        # Archives written when value was the first number in the result
+        # ("Absent/25g" -> 25, "250 ppb" -> 250): add unit, recompute both.
+        conn = self._conn
+        conn.create_function("coa_result_value", 1, lambda result: result_value(result)[0], deterministic=True)
+        conn.create_function("coa_result_unit", 1, lambda result: result_value(result)[1], deterministic=True)
+        conn.execute("BEGIN")
+        try:
+            conn.execute("ALTER TABLE coa_results ADD COLUMN unit TEXT")
+            conn.execute("UPDATE coa_results SET value = coa_result_value(result), unit = coa_result_unit(result)")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def add(self, record, pdf_bytes, issued_at=None):
+        """Store one issued COA (a COARecord or data dict) and return its archive id."""
+        record = as_record(record)
+        results = list(_result_rows(record))
+        body = " ".join(" ".join(row[1:5]) for row in results)
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                coa_id = conn.execute(
+                    "INSERT INTO coas (product_code, product_name, batch_no, manufacturing_date, "
+                    "reanalysis_date, issued_at, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (record.product_code, record.product_name, record.batch_no, record.manufacturing_date,
+                     record.reanalysis_date, issued_at or time.time(), record.to_json().decode("utf-8")),
+                ).lastrowid
+                conn.execute("INSERT INTO coa_pdfs (coa_id, pdf) VALUES (?, ?)", (coa_id, pdf_bytes))
+                conn.executemany(
+                    "INSERT INTO coa_results (coa_id, section, parameter, spec, result, method, value, unit) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(coa_id,) + row for row in results],
+                )
+                conn.execute(
+                    "INSERT INTO coa_fts (rowid, product_name, product_code, batch_no, body) VALUES (?, ?, ?, ?, ?)",
+                    (coa_id, record.product_name, record.product_code, record.batch_no, body),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return coa_id
+
+    def search(self, text=None, product_code=None, batch_no=None, parameter=None, min_value=None,
+               max_value=None, unit=None, manufacturing_date=None, issued_from=None, issued_to=None, limit=100):
+        """Most recently archived COAs first, as dicts of the SUMMARY_COLUMNS.
+
+        text is an FTS5 query (e.g. 'ashwagandha AND lead'); parameter with
+        min_value/max_value filters on the numeric result of that parameter,
+        in ppm for mass fractions and cfu/g for counts, or in unit (e.g.
+        "ppb") when given. manufacturing_date matches the date as printed.
+        """
+        # Ids grow with every COA archived, so newest-first is a reverse rowid
+        # walk; with text the walk is driven by the FTS index and stops at limit.
+        where, args = [], []
+        if text:
+            source, order = "coa_fts f JOIN coas c ON c.id = f.rowid", "f.rowid DESC"
+            where.append("coa_fts MATCH ?")
+            args.append(text)
+        else:
+            source, order = "coas c", "c.id DESC"
+        if product_code:
+            where.append("c.product_code = ?")
+            args.append(product_code)
+        if batch_no:
+            where.append("c.batch_no = ?")
+            args.append(batch_no)
+        if manufacturing_date:
+            where.append("c.manufacturing_date = ?")
+            args.append(manufacturing_date)
+        if parameter:
+            cond = ["r.parameter = ? COLLATE NOCASE"]
+            args.append(parameter)
+            scale = 1.0
+            if unit:
+                family, scale = unit_scale(unit)
+                cond.append("r.unit = ?")
+                args.append(family)
+            if min_value is not None:
+                cond.append("r.value > ?")
+                args.append(min_value * scale)
+            if max_value is not None:
+                cond.append("r.value < ?")
+                args.append(max_value * scale)
+            where.append(f"c.id IN (SELECT r.coa_id FROM coa_results r WHERE {' AND '.join(cond)})")
+        if issued_from is not None:
+            where.append("c.issued_at >= ?")
+            args.append(issued_from)
+        if issued_to is not None:
+            where.append("c.issued_at < ?")
+            args.append(issued_to)
+        sql = (f"SELECT {', '.join('c.' + col for col in SUMMARY_COLUMNS)} FROM {source}"
+               + (f" WHERE {' AND '.join(where)}" if where else "")
+               + f" ORDER BY {order} LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(sql, args + [limit]).fetchall()
+        return [dict(zip(SUMMARY_COLUMNS, row)) for row in rows]
+
+    def get_record(self, coa_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM coas WHERE id = ?", (coa_id,)).fetchone()
+        return loads(row[0]) if row else None
+
+    def get_pdf(self, coa_id):
+        with self._lock:
+            row = self._conn.execute("SELECT pdf FROM coa_pdfs WHERE coa_id = ?", (coa_id,)).fetchone()
+        return row[0] if row else None
+
+    def result_pairs(self, product_code=None, issued_from=None, issued_to=None):
+        """(spec, result, rows) for every distinct spec and result archived, optionally of one product or period."""
+        # Grouped in SQLite: an archive repeats a few hundred specs and results
+        # over millions of rows, and each pair then only needs checking once.
+        source, where, args = self._results_source(product_code, issued_from, issued_to)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT r.spec, r.result, count(*) FROM {source}{where} GROUP BY r.spec, r.result", args,
+            ).fetchall()
+
+    def results_matching(self, pairs, product_code=None, issued_from=None, issued_to=None):
+        """(coa_id, product_code, batch_no, section, parameter, spec, result) of the rows with one of the
+        (spec, result) pairs, in archive order."""
+        _, where, args = self._results_source(product_code, issued_from, issued_to)
+        with self._lock:
+            conn = self._conn
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_pairs (spec TEXT, result TEXT)")
+            conn.execute("DELETE FROM wanted_pairs")
+            try:
+                conn.executemany("INSERT INTO wanted_pairs VALUES (?, ?)", pairs)
+                return conn.execute(
+                    "SELECT r.coa_id, c.product_code, c.batch_no, r.section, r.parameter, r.spec, r.result "
+                    "FROM coa_results r JOIN wanted_pairs w ON w.spec = r.spec AND w.result = r.result "
+                    f"JOIN coas c ON c.id = r.coa_id{where} ORDER BY r.rowid", args,
+                ).fetchall()
+            finally:
+                conn.execute("DELETE FROM wanted_pairs")
+
+    @staticmethod
+    def _results_source(product_code, issued_from, issued_to):
+        # coa_results joined with coas only when a filter needs it.
+        where, args = [], []
+        if product_code:
+            where.append("c.product_code = ?")
+            args.append(product_code)
+        if issued_from is not None:
+            where.append("c.issued_at >= ?")
+            args.append(issued_from)
+        if issued_to is not None:
+            where.append("c.issued_at < ?")
+            args.append(issued_to)
+        source = "coa_results r JOIN coas c ON c.id = r.coa_id" if where else "coa_results r"
+        return source, (f" WHERE {' AND '.join(where)}" if where else ""), args
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM coas").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ----------------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------------
+def iso_date(text):
+    # Local midnight, as the app shows issue times in local time.
+    return time.mktime(time.strptime(text, "%Y-%m-%d"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the archive of issued COAs.")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search = commands.add_parser("search", help="find archived COAs")
+    search.add_argument("text", nargs="?", help="full-text query (FTS5 syntax)")
+    search.add_argument("--product-code")
+    search.add_argument("--batch-no")
+    search.add_argument("--parameter", help="parameter name for --min/--max, e.g. Lead")
+    search.add_argument("--min", type=float, dest="min_value", help="result greater than")
+    search.add_argument("--max", type=float, dest="max_value", help="result less than")
+    search.add_argument("--unit", help="unit of --min/--max (default: ppm for mass fractions, cfu/g for counts)")
+    search.add_argument("--manufactured", help="date of manufacturing as printed, e.g. 03/2025")
+    search.add_argument("--issued-from", type=iso_date, help="issued on or after YYYY-MM-DD")
+    search.add_argument("--issued-to", type=iso_date, help="issued before YYYY-MM-DD")
+    search.add_argument("--limit", type=int, default=100)
+    search.add_argument("--pdf-dir", help="also write the matching PDFs to this directory")
+    review = commands.add_parser("review", help="check archived results against their specs")
+    review.add_argument("--product-code")
+    review.add_argument("--csv", help="write the out-of-spec rows to this CSV file")
+    args = parser.parse_args(argv)
+
+    archive = COAArchive(args.db)
+    if args.command == "review":
+        return _review(archive, args)
+    start = time.perf_counter()
+    rows = archive.search(args.text, product_code=args.product_code, batch_no=args.batch_no,
+                          parameter=args.parameter, min_value=args.min_value, max_value=args.max_value,
+                          unit=args.unit, manufacturing_date=args.manufactured, issued_from=args.issued_from,
+                          issued_to=args.issued_to, limit=args.limit)
+    elapsed = time.perf_counter() - start
+    for row in rows:
+        issued = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["issued_at"]))
+        print(f"{row['id']}\t{issued}\t{row['product_code']}\t{row['batch_no']}\t{row['product_name']}")
+        if args.pdf_dir:
+            os.makedirs(args.pdf_dir, exist_ok=True)
+            with open(os.path.join(args.pdf_dir, f"COA_{row['id']}.pdf"), "wb") as fh:
+                fh.write(archive.get_pdf(row["id"]))
+    print(f"{len(rows)} COAs in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    archive.close()
+    return 0
+
+
+def _review(archive, args):
+    from coa_compliance import review_archive, REVIEW_COLUMNS
+
+    start = time.perf_counter()
+    review = review_archive(archive, product_code=args.product_code)
+    elapsed = time.perf_counter() - start
+    for coa_id, product_code, batch_no, _, parameter, spec, result in review.failures:
+        print(f"{coa_id}\t{product_code}\t{batch_no}\t{parameter}\t{result}\t{spec}")
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(REVIEW_COLUMNS)
+            writer.writerows(review.failures)
+    failed_coas = len({row[0] for row in review.failures})
+    print(f"{review.rows} result rows, {review.checked} evaluated: {len(review.failures)} out of spec "
+          f"in {failed_coas} COAs ({elapsed:.1f} s)", file=sys.stderr)
+    archive.close()
+    return 1 if review.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+Headless bulk COA generation.
+
+Reads batch records from a CSV or JSONL file (the flat ``data`` keys that
+COARecord.from_data reads) and renders one PDF per record over a process pool.
+
+    python coa_batch.py batches.jsonl --out-dir coa_out --workers 8
+    python coa_batch.py batches.jsonl --zip audit.zip
+    python coa_batch.py shipment.jsonl --merge shipment.pdf
+    python coa_batch.py batches.jsonl --zip mail.zip --optimize
+
+In CSV files the list-valued keys (``*_extra_rows`` and
+``product_additional_rows``) are given as JSON arrays inside the cell.
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import deque
+from typing import NamedTuple
+
+from coa_catalogue import load_catalogue
+from coa_pdf import generate_pdf, generate_merged_pdf, LAYOUTS, DEFAULT_LAYOUT
+from coa_record import COARecord
+
+LIST_KEYS = load_catalogue().extra_keys + ("product_additional_rows",)
+
+
+# ----------------------------------------------------------------------------
+# READING RECORDS
+# ----------------------------------------------------------------------------
+class UnreadableRecord(NamedTuple):
+    # Stands in for a row/line that could not be decoded (errors="report").
+    line: int
+    error: str
+
+
+def read_records(path, errors="raise"):
+    with open(path, "rb") as fh:
+        yield from iter_records(fh, path, errors)
+
+
+def iter_records(fh, name, errors="raise"):
+    """Records of a binary file (an open file or an uploaded file); name decides the format.
+
+    With errors="report" a row or line that is not valid JSON is yielded as
+    an UnreadableRecord instead of stopping the whole file.
+    """
+    text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+    try:
+        if name.lower().endswith(".csv"):
+            reader = csv.DictReader(text)
+            for row in reader:
+                try:
+                    for key in LIST_KEYS:
+                        cell = (row.get(key) or "").strip()
+                        row[key] = json.loads(cell) if cell else []
+                except ValueError as exc:
+                    if errors != "report":
+                        raise ValueError(f"line {reader.line_num}: {key}: {exc}") from exc
+                    row = UnreadableRecord(reader.line_num, f"{key}: {exc}")
+                yield row
+        else:
+            for line_no, line in enumerate(text, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record, dict):
+                        raise ValueError(f"expected a JSON object, got {type(record).__name__}")
+                except ValueError as exc:
+                    if errors != "report":
+                        raise ValueError(f"line {line_no}: {exc}") from exc
+                    record = UnreadableRecord(line_no, str(exc))
+                yield record
+    finally:
+        # Leave fh open for the caller; the wrapper would close it on collection.
+        text.detach()
+
+
+def output_name(record, index, used):
+    stem = record.get("batch_no") or record.get("product_name") or f"COA_{index + 1}"
+    stem = re.sub(r"[^\w.-]+", "_", str(stem)).strip("._") or f"COA_{index + 1}"
+    name = stem
+    n = 2
+    while name in used:
+        name = f"{stem}_{n}"
+        n += 1
+    used.add(name)
+    return name + ".pdf"
+
+
+# ----------------------------------------------------------------------------
+# WORKER
+# ----------------------------------------------------------------------------
+def _result(index, name, record, error, start):
+    return {
+        "index": index,
+        "batch_no": record.get("batch_no", ""),
+        "file": name if error is None else None,
+        "ok": error is None,
+        "error": error,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def _unreadable(index, record):
+    return {
+        "index": index,
+        "batch_no": "",
+        "file": None,
+        "ok": False,
+        "error": f"line {record.line}: {record.error}",
+        "seconds": 0.0,
+    }
+
+
+def _render_one(task):
+    index, name, record, out_dir, layout, optimize = task
+    start = time.perf_counter()
+    try:
+        # Written under a temporary name and renamed once complete.
+        generate_pdf(COARecord.from_data(record), layout=layout, output=os.path.join(out_dir, name),
+                     optimize=optimize)
+        error = None
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    return _result(index, name, record, error, start)
+
+
+def _render_bytes(task):
+    index, name, record, layout, optimize = task
+    start = time.perf_counter()
+    try:
+        pdf_bytes = generate_pdf(COARecord.from_data(record), layout=layout, optimize=optimize).getvalue()
+        error = None
+    except Exception as exc:
+        pdf_bytes = None
+        error = f"{type(exc).__name__}: {exc}"
+    return _result(index, name, record, error, start), pdf_bytes
+
+
+def run_batch(records, out_dir, workers=None, chunksize=4, layout=DEFAULT_LAYOUT, optimize=None):
+    os.makedirs(out_dir, exist_ok=True)
+    used = set()
+    results, tasks = [], []
+    for i, record in enumerate(records):
+        if isinstance(record, UnreadableRecord):
+            results.append(_unreadable(i, record))
+        else:
+            tasks.append((i, output_name(record, i, used), record, out_dir, layout, optimize))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results += [_render_one(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes=workers) as pool:
+            results += pool.imap_unordered(_render_one, tasks, chunksize=chunksize)
+    results.sort(key=lambda r: r["index"])
+    return results
+
+
+# ----------------------------------------------------------------------------
+# ZIP EXPORT
+# PDFs are written into the archive as they are rendered. At most `window`
+# rendered PDFs wait to be written, so memory stays near one PDF per worker
+# however many records there are.
+# ----------------------------------------------------------------------------
+def _bounded_imap(pool, fn, tasks, window):
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(fn, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def export_zip(records, target, workers=1, layout=DEFAULT_LAYOUT, progress=None,
+               compression=zipfile.ZIP_STORED, optimize=None):
+    """Render records straight into a ZIP archive and return the per-record results.
+
+    target is a path or a writable binary file (it need not be seekable, so an
+    HTTP response works). progress(done, result) is called after each record.
+    A summary.json with the results is added at the end of the archive.
+    PDFs are already compressed internally, so entries are stored by default.
+    """
+    used = set()
+    results = []
+    with zipfile.ZipFile(target, "w", compression=compression) as archive:
+        def write(result, pdf_bytes):
+            if pdf_bytes is not None:
+                archive.writestr(result["file"], pdf_bytes)
+            results.append(result)
+            if progress is not None:
+                progress(len(results), result)
+
+        def iter_tasks():
+            for i, record in enumerate(records):
+                if isinstance(record, UnreadableRecord):
+                    write(_unreadable(i, record), None)
+                else:
+                    yield i, output_name(record, i, used), record, layout, optimize
+
+        tasks = iter_tasks()
+        if workers == 1:
+            for task in tasks:
+                write(*_render_bytes(task))
+        else:
+            with multiprocessing.Pool(processes=workers) as pool:
+                for result, pdf_bytes in _bounded_imap(pool, _render_bytes, tasks, window=2 * workers):
+                    write(result, pdf_bytes)
+        archive.writestr("summary.json", json.dumps(results, indent=2))
+    return results
+
+
+# ----------------------------------------------------------------------------
+# MERGED PDF
+# ----------------------------------------------------------------------------
+def export_merged(records, target, layout=DEFAULT_LAYOUT, optimize=None):
+    """Write all records as one PDF (one build, shared letterhead and fonts).
+
+    Records that could not be read or converted are reported as failed and
+    left out; the rest are merged.
+    """
+    start = time.perf_counter()
+    results, converted = [], []
+    for i, record in enumerate(records):
+        if isinstance(record, UnreadableRecord):
+            results.append(_unreadable(i, record))
+            continue
+        try:
+            converted.append((i, record, COARecord.from_data(record)))
+        except Exception as exc:
+            results.append(_result(i, None, record, f"{type(exc).__name__}: {exc}", start))
+    if converted:
+        generate_merged_pdf([coa for _, _, coa in converted], layout=layout, output=target, optimize=optimize)
+    name = os.path.basename(target) if isinstance(target, str) else "merged.pdf"
+    merged = [_result(i, name, record, None, start) for i, record, _ in converted]
+    for result in merged:
+        # One build for all records; report the average time per record.
+        result["seconds"] = round(result["seconds"] / len(merged), 4)
+    results += merged
+    results.sort(key=lambda r: r["index"])
+    return results
+
+
+# ----------------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate COA PDFs in bulk from CSV/JSONL batch records.")
+    parser.add_argument("input", help="CSV or JSONL file with one batch record per row/line")
+    parser.add_argument("--out-dir", default="coa_out", help="directory for the generated PDFs")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=4, help="records handed to a worker at a time")
+    parser.add_argument("--layout", choices=LAYOUTS, default=DEFAULT_LAYOUT, help="how each COA is fitted to the page")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--zip", default=None, help="write all PDFs into this ZIP file instead of --out-dir")
+    output.add_argument("--merge", default=None, help="write all COAs into this single PDF instead of --out-dir")
+    parser.add_argument("--report", default=None, help="summary report path (default: <out-dir>/summary.json)")
+    parser.add_argument("--optimize", action="store_true", default=None,
+                        help="compress images and streams with PyMuPDF (default: COA_OPTIMIZE_PDF)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        records = list(read_records(args.input, errors="report"))
+    except (OSError, ValueError) as exc:
+        parser.error(f"could not read {args.input}: {exc}")
+
+    if args.zip:
+        results = export_zip(records, args.zip, workers=args.workers or os.cpu_count() or 1,
+                             layout=args.layout, optimize=args.optimize)
+    elif args.merge:
+        try:
+            results = export_merged(records, args.merge, layout=args.layout, optimize=args.optimize)
+        except Exception as exc:
+            # Bad records are left out; anything else fails the whole file.
+            print(f"could not write {args.merge}: {type(exc).__name__}: {exc}", file=sys.stderr)
+            return 1
+    else:
+        results = run_batch(records, args.out_dir, workers=args.workers, chunksize=args.chunksize,
+                            layout=args.layout, optimize=args.optimize)
+    elapsed = time.perf_counter() - start
+    destination = args.zip or args.merge or args.out_dir
+
+    failed = [r for r in results if not r["ok"]]
+    summary = {
+        "input": args.input,
+        "total": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "seconds": round(elapsed, 3),
+        "results": results,
+    }
+    # A ZIP export carries its own summary.json and a merged PDF's failures
+    # are printed below; only write a report when asked.
+    report_path = args.report or (None if args.zip or args.merge else os.path.join(args.out_dir, "summary.json"))
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+
+    print(f"{summary['succeeded']}/{summary['total']} COAs written to {destination} "
+          f"in {elapsed:.1f}s ({summary['failed']} failed, report: {report_path or destination})")
+    for r in failed:
+        print(f"  record {r['index'] + 1} ({r['batch_no'] or 'no batch no.'}): {r['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
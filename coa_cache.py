@@ -0,0 +1,94 @@
+"""
+Content-addressed, in-process LRU cache for rendered COA PDFs.
+
+Entries are keyed on the content digest of the COARecord, the layout and
+the catalogue fingerprint, so identical inputs return the stored bytes
+without any ReportLab work, and a catalogue edit (a relabelled parameter)
+is rendered afresh.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from coa_catalogue import load_catalogue
+from coa_config import DEFAULT_LAYOUT
+from coa_record import as_record
+from coa_timing import NULL_TIMER
+
+DEFAULT_MAX_BYTES = int(os.environ.get("COA_PDF_CACHE_BYTES", 64 * 1024 * 1024))
+
+
+class PDFCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            pdf_bytes = self._entries.get(key)
+            if pdf_bytes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf_bytes
+
+    def put(self, key, pdf_bytes):
+        if len(pdf_bytes) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = pdf_bytes
+            self._size += len(pdf_bytes)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+pdf_cache = PDFCache()
+
+
+def render_pdf(record, layout=None, cache=pdf_cache, render=None, timer=NULL_TIMER):
+    # render(record, layout) -> bytes lets callers run generate_pdf elsewhere,
+    # e.g. in a worker process, while the cache stays in this process.
+    layout = layout or DEFAULT_LAYOUT
+    with timer.stage("cache_lookup"):
+        record = as_record(record)
+        key = f"{layout}:{load_catalogue().fingerprint}:{record.digest()}"
+        pdf_bytes = cache.get(key)
+    if pdf_bytes is None:
+        if render is not None:
+            with timer.stage("render_elsewhere"):
+                pdf_bytes = render(record, layout)
+        else:
+            # Imported on first use: ReportLab is only loaded once something renders.
+            from coa_pdf import generate_pdf
+            pdf_bytes = generate_pdf(record, layout=layout, timer=timer).getvalue()
+        cache.put(key, pdf_bytes)
+    return pdf_bytes
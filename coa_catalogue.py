@@ -0,0 +1,114 @@
+"""
+Test-parameter catalogue.
+
+The specification sections and their base parameters are defined once in
+coa_catalogue.json and drive both the Streamlit form and the PDF table.
+The file is re-read only when its modification time changes, so new
+parameters show up on the next rerun without a redeploy.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import NamedTuple
+
+CATALOGUE_PATH = os.environ.get(
+    "COA_CATALOGUE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "coa_catalogue.json"),
+)
+FIELDS = ("spec", "result", "method")
+DEFAULT_PLACEHOLDERS = {"spec": "X", "result": "X", "method": "X"}
+
+
+class Parameter(NamedTuple):
+    key: str
+    label: str
+    defaults: tuple  # (spec, result, method)
+    spec_widget: str
+
+    def field_key(self, field):
+        return f"{self.key}_{field}"
+
+
+class Section(NamedTuple):
+    id: str
+    name: str
+    state_key: str
+    label_prefix: str
+    spec_label: str
+    add_label: str
+    columns: tuple
+    extra_columns: tuple
+    placeholders: dict
+    editable_param: bool
+    parameters: tuple
+
+    @property
+    def extra_key(self):
+        return f"{self.id}_extra_rows"
+
+
+class Catalogue(NamedTuple):
+    sections: tuple
+    parameters: tuple
+    by_key: dict
+    fingerprint: str = ""  # content hash of the catalogue file
+
+    @property
+    def extra_keys(self):
+        return tuple(section.extra_key for section in self.sections)
+
+    @property
+    def field_keys(self):
+        return tuple(p.field_key(f) for p in self.parameters for f in FIELDS)
+
+
+def _parse(raw, fingerprint=""):
+    sections = []
+    for s in raw["sections"]:
+        parameters = tuple(
+            Parameter(
+                key=p["key"],
+                label=p["label"],
+                defaults=tuple(p.get(f, "") for f in FIELDS),
+                spec_widget=p.get("spec_widget", "text_input"),
+            )
+            for p in s["parameters"]
+        )
+        sections.append(Section(
+            id=s["id"],
+            name=s["name"],
+            state_key=s["state_key"],
+            label_prefix=s.get("label_prefix", s["name"]),
+            spec_label=s.get("spec_label", "Spec for"),
+            add_label=s.get("add_label", f"Add New {s.get('label_prefix', s['name'])} Row"),
+            columns=tuple(s.get("columns", (3, 2.5, 2.5, 2))),
+            extra_columns=tuple(s.get("extra_columns", (3, 2.5, 2.5, 2.5, 2))),
+            placeholders={**DEFAULT_PLACEHOLDERS, **s.get("placeholders", {})},
+            editable_param=bool(s.get("editable_param", False)),
+            parameters=parameters,
+        ))
+    parameters = tuple(p for s in sections for p in s.parameters)
+    by_key = {p.key: p for p in parameters}
+    if len(by_key) != len(parameters):
+        raise ValueError("Duplicate parameter keys in the COA catalogue")
+    return Catalogue(sections=tuple(sections), parameters=parameters, by_key=by_key, fingerprint=fingerprint)
+
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def load_catalogue(path=CATALOGUE_PATH):
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _loaded.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path, "rb") as fh:
+        content = fh.read()
+    catalogue = _parse(json.loads(content.decode("utf-8")), hashlib.sha256(content).hexdigest()[:16])
+    with _lock:
+        _loaded[path] = (mtime, catalogue)
+    return catalogue
+
@@ -0,0 +1,256 @@
+"""
+Evaluate results against their specifications.
+
+A spec string is compiled once into ``Limits``:
+
+- "Not more than 10 ppm", "NMT 100 cfu/g", "Max 5%", "Less than 2": an upper limit;
+- "Not less than 98%", "NLT 2.5%", "Min 10", "More than 5": a lower limit;
+- "Between 0.3g/ml to 0.6g/ml", "5.0 - 7.0": a range;
+- "Absent/25g", "Absent in 10 g": the organism is not found;
+- "To comply by TLC", "Complies", "Meet USP<561>": a qualitative test.
+
+Template placeholders ("Not more than X ppm") and free text are not
+evaluated. Results are read the same way: "0.23 ppm", "< 0.01 ppm", "ND",
+"Absent", "Complies". Mass fractions (ppb, ppm, %, mg/kg ...) are compared
+across units, and a result without a unit is taken in the unit of its spec.
+
+``check`` returns True (in spec), False (out of spec) or None (not
+evaluated). ``evaluate`` checks the printed rows of one record, and
+``review_archive`` every result in the COA archive for a retrospective
+review, once per distinct spec and result.
+"""
+import functools
+import math
+import re
+from typing import NamedTuple
+
+from coa_catalogue import load_catalogue
+
+# Mass fractions as multiples of one ppm (mg/kg). Solution concentrations
+# such as µg/L depend on the dilution and are not converted.
+PPM_FACTORS = {
+    "ppm": 1.0, "mg/kg": 1.0, "µg/g": 1.0, "ug/g": 1.0, "mcg/g": 1.0,
+    "ppb": 1e-3, "µg/kg": 1e-3, "ug/kg": 1e-3, "mcg/kg": 1e-3, "ng/g": 1e-3,
+    "ppt": 1e-6, "ng/kg": 1e-6,
+    "%": 1e4, "% w/w": 1e4, "g/100g": 1e4,
+}
+COUNT_UNITS = {"cfu/g": 1.0}
+DENSITY_FACTORS = {"g/ml": 1.0, "g/cc": 1.0, "g/cm3": 1.0, "kg/l": 1.0, "mg/ml": 1e-3}
+# Normalized unit -> (family, factor to the family's unit). Units not listed
+# are only compared with themselves.
+UNITS = {
+    **{unit.replace(" ", ""): ("ppm", factor) for unit, factor in PPM_FACTORS.items()},
+    **{unit: ("cfu/g", factor) for unit, factor in COUNT_UNITS.items()},
+    **{unit: ("g/ml", factor) for unit, factor in DENSITY_FACTORS.items()},
+}
+
+# "< 0.5 ppb", "12", "1.5e3 cfu/g"; shared with coa_import.
+RESULT_PATTERN = r"^(?P<qual>[<>≤≥]=?)?\s*(?P<num>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(?P<unit>.*)$"
+# The comma in "1,500"; removed before either pattern is applied.
+THOUSANDS_SEPARATOR = r"(?<=\d),(?=\d{3}\b)"
+
+_NUM = r"[-+]?(?:\d+\.?\d*|\.\d+)"
+_UNIT = r"(?:[^\d\s\-–][^\d]*?)?"
+_UPPER = re.compile(rf"^(?:(?P<inclusive>nmt|not more than|max(?:imum)?\.?|up to|≤|<=)|(?:less than|below|<))"
+                    rf"\s*:?\s*(?P<num>{_NUM})\s*(?P<unit>{_UNIT})$")
+_LOWER = re.compile(rf"^(?:(?P<inclusive>nlt|not less than|min(?:imum)?\.?|at least|≥|>=)|(?:more than|greater than"
+                    rf"|above|>))\s*:?\s*(?P<num>{_NUM})\s*(?P<unit>{_UNIT})$")
+_RANGE = re.compile(rf"^(?:between|from)?\s*(?P<low>{_NUM})\s*(?P<low_unit>{_UNIT})\s*(?:to|-|–|and)\s*"
+                    rf"(?P<high>{_NUM})\s*(?P<unit>{_UNIT})$")
+_THOUSANDS = re.compile(THOUSANDS_SEPARATOR)
+_ABSENT_SPEC = re.compile(r"^(?:should be |must be )?(?:absent|negative|not detected)\b")
+_COMPLY_SPEC = re.compile(r"^(?:to |should |must )?(?:compl(?:y|ies)|meets?|conforms?)\b")
+
+_RESULT = re.compile(RESULT_PATTERN)
+_PASS = re.compile(r"^(?:compl(?:y|ies)|compiles|conforms?|meets?|pass(?:es|ed)?)\b")
+_FAIL = re.compile(r"^(?:(?:does not|doesn't|do not|not) (?:compl|conform|meet)|fail|non[- ]?complian)")
+_ABSENT = re.compile(r"^(?:absent|not detected|n\.?d\.?|negative|bdl|below detection)(?:\b|$)")
+_PRESENT = re.compile(r"^(?:present|detected|positive)\b")
+
+# Limits.kind and Result.kind
+LIMIT, ABSENT, COMPLY = "limit", "absent", "comply"
+NUMBER, PRESENT, PASS, FAIL = "number", "present", "pass", "fail"
+
+
+class Limits(NamedTuple):
+    kind: str
+    low: float = -math.inf
+    high: float = math.inf
+    low_strict: bool = False
+    high_strict: bool = False
+    family: str = None        # None: no unit given
+    factor: float = 1.0
+
+
+class Result(NamedTuple):
+    kind: str
+    low: float = 0.0
+    high: float = 0.0
+    low_open: bool = False    # "> 5": the value is above, not at, 5
+    high_open: bool = False   # "< 5"
+    family: str = None
+    factor: float = None      # None: no unit given
+
+
+class Compliance(NamedTuple):
+    checked: int   # printed rows whose spec and result could be evaluated
+    failed: tuple  # (section name, param, spec, result) of every row out of spec
+
+
+def unit_scale(text):
+    """(family, factor to the family's unit) of a unit string; (None, None) when empty."""
+    key = text.strip().lower().replace("μ", "µ").replace(" ", "").rstrip(".")
+    if not key:
+        return None, None
+    return UNITS.get(key, (key, 1.0))
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_spec(spec):
+    """Limits for a spec string, or None when it cannot be evaluated."""
+    text = _THOUSANDS.sub("", " ".join(str(spec).lower().split()))
+    if _ABSENT_SPEC.match(text):
+        return Limits(ABSENT)
+    if _COMPLY_SPEC.match(text):
+        return Limits(COMPLY)
+    for pattern, upper in ((_UPPER, True), (_LOWER, False)):
+        match = pattern.match(text)
+        if match:
+            family, factor = unit_scale(match["unit"])
+            bound, strict = float(match["num"]), not match["inclusive"]
+            if upper:
+                return Limits(LIMIT, high=bound, high_strict=strict, family=family, factor=factor or 1.0)
+            return Limits(LIMIT, low=bound, low_strict=strict, family=family, factor=factor or 1.0)
+    match = _RANGE.match(text)
+    if match:
+        # "0.3 to 0.6 g/ml" or "0.3g/ml to 0.6g/ml"
+        family, factor = unit_scale(match["unit"])
+        low_family, low_factor = unit_scale(match["low_unit"])
+        if low_family is not None and (low_family, low_factor) != (family, factor):
+            return None
+        low, high = float(match["low"]), float(match["high"])
+        if low > high:
+            return None
+        return Limits(LIMIT, low=low, high=high, family=family, factor=factor or 1.0)
+    return None
+
+
+@functools.lru_cache(maxsize=16384)
+def parse_result(result):
+    """Result for a result string, or None when it cannot be evaluated."""
+    text = " ".join(str(result).lower().split())
+    if _FAIL.match(text):
+        return Result(FAIL)
+    if _PASS.match(text):
+        return Result(PASS)
+    if _ABSENT.match(text):
+        # Not detected: zero, for a limit.
+        return Result(ABSENT)
+    if _PRESENT.match(text):
+        return Result(PRESENT)
+    match = _RESULT.match(_THOUSANDS.sub("", text))
+    if not match:
+        return None
+    value = float(match["num"])
+    family, factor = unit_scale(match["unit"])
+    qualifier = match["qual"] or ""
+    if qualifier.startswith(("<", "≤")):
+        return Result(NUMBER, -math.inf, value, high_open=qualifier == "<", family=family, factor=factor)
+    if qualifier.startswith((">", "≥")):
+        return Result(NUMBER, value, math.inf, low_open=qualifier == ">", family=family, factor=factor)
+    return Result(NUMBER, value, value, family=family, factor=factor)
+
+
+def _close(a, b):
+    # Unit conversions (0.1 % vs 1000 ppm) must not decide a result at the limit.
+    return a == b or (math.isfinite(a) and math.isfinite(b) and abs(a - b) <= 1e-9 * max(abs(a), abs(b)))
+
+
+def _within(limits, result):
+    if result.kind == ABSENT:
+        result = Result(NUMBER)
+    if limits.family is not None and result.family is not None and limits.family != result.family:
+        return None
+    factor = limits.factor if result.factor is None else result.factor
+    low, high = result.low * factor, result.high * factor
+    bound_low, bound_high = limits.low * limits.factor, limits.high * limits.factor
+    # Equal values pass an inclusive limit, and an open result ("< 1") a strict one.
+    low_ok = low > bound_low or (_close(low, bound_low) and not (limits.low_strict and not result.low_open))
+    high_ok = high < bound_high or (_close(high, bound_high) and not (limits.high_strict and not result.high_open))
+    if low_ok and high_ok:
+        return True
+    below = high < bound_low and not _close(high, bound_low)
+    above = low > bound_high and not _close(low, bound_high)
+    at_low = _close(high, bound_low) and (limits.low_strict or result.high_open)
+    at_high = _close(low, bound_high) and (limits.high_strict or result.low_open)
+    if below or above or at_low or at_high:
+        return False
+    return None
+
+
+def check(spec, result):
+    """True when result meets spec, False when it does not, None when either cannot be evaluated."""
+    limits = compile_spec(spec)
+    if limits is None:
+        return None
+    value = parse_result(result)
+    if value is None:
+        return None
+    if value.kind == PASS:
+        return True
+    if value.kind == FAIL:
+        return False
+    if limits.kind == COMPLY:
+        return None
+    if limits.kind == ABSENT:
+        if value.kind in (ABSENT, PRESENT):
+            return value.kind == ABSENT
+        if value.low > 0 or (value.low == 0 and value.low_open):
+            return False
+        return True if value.high == 0 else None
+    if value.kind == PRESENT:
+        return None
+    return _within(limits, value)
+
+
+def evaluate(record, catalogue=None):
+    """Compliance of the rows printed on a COARecord's PDF."""
+    catalogue = catalogue or load_catalogue()
+    checked, failed = 0, []
+    for section in catalogue.sections:
+        for param, spec, result, _ in record.printed_rows(section):
+            status = check(spec, result)
+            if status is not None:
+                checked += 1
+                if not status:
+                    failed.append((section.name, param, spec, result))
+    return Compliance(checked, tuple(failed))
+
+
+# ----------------------------------------------------------------------------
+# RETROSPECTIVE REVIEW
+# ----------------------------------------------------------------------------
+REVIEW_COLUMNS = ("coa_id", "product_code", "batch_no", "section", "parameter", "spec", "result")
+
+
+class Review(NamedTuple):
+    failures: list  # REVIEW_COLUMNS tuples of every out-of-spec row, in archive order
+    rows: int       # result rows reviewed
+    checked: int    # rows whose spec and result could be evaluated
+
+
+def review_archive(archive, product_code=None, issued_from=None, issued_to=None):
+    """Check every result archived in a COAArchive (of one product, or issued in [issued_from, issued_to))."""
+    # One pass over the distinct (spec, result) pairs, however many rows
+    # share them; only the rows of failing pairs are read back.
+    rows = checked = 0
+    failing = []
+    for spec, result, count in archive.result_pairs(product_code, issued_from, issued_to):
+        status = check(spec, result)
+        rows += count
+        if status is not None:
+            checked += count
+            if not status:
+                failing.append((spec, result))
+    failures = archive.results_matching(failing, product_code, issued_from, issued_to) if failing else []
+    return Review(failures, rows, checked)
@@ -0,0 +1,48 @@
+"""
+Process-wide settings.
+
+Environment variables are read once, when this module is first imported;
+Streamlit re-executes app.py on every rerun but never re-imports modules.
+Nothing heavy is imported here, so the UI can lay out its widgets before
+ReportLab or PyMuPDF are loaded. (The app's own .streamlit/config.toml is
+applied by Streamlit itself.)
+"""
+import os
+import tempfile
+
+# Page layout, see coa_pdf.
+LAYOUTS = ("shrink", "fit", "paged")
+DEFAULT_LAYOUT = os.environ.get("COA_LAYOUT", "shrink")
+# Below this scale the text becomes hard to read; paginate instead.
+READABILITY_FLOOR = float(os.environ.get("COA_READABILITY_FLOOR", 0.7))
+
+# Preview rasterization, see coa_preview.
+THUMB_DPI = 36
+DEFAULT_DPI = int(os.environ.get("COA_PREVIEW_DPI", 110))
+DEFAULT_FORMAT = os.environ.get("COA_PREVIEW_FORMAT", "jpeg")
+DEFAULT_QUALITY = 80
+FORMATS = ("jpeg", "webp", "png")
+
+# Embedded TrueType fonts, see coa_fonts. Unset: the base-14 fonts.
+FONT_DIR = os.environ.get("COA_FONT_DIR", "")
+FONT_FAMILY = os.environ.get("COA_FONT_FAMILY", "")
+HEADING_FONT_FAMILY = os.environ.get("COA_HEADING_FONT_FAMILY", FONT_FAMILY)
+
+# PDF post-processing, see coa_optimize. Off by default.
+OPTIMIZE_PDF = os.environ.get("COA_OPTIMIZE_PDF", "0") == "1"
+PRINT_DPI = int(os.environ.get("COA_PRINT_DPI", 150))
+IMAGE_QUALITY = int(os.environ.get("COA_IMAGE_QUALITY", 85))
+LINEARIZE = os.environ.get("COA_LINEARIZE", "0") == "1"
+
+# Flag results that do not meet their spec in the table and the remark, see
+# coa_compliance (COA_CHECK_SPECS=0 always prints the complying remark).
+CHECK_SPECS = os.environ.get("COA_CHECK_SPECS", "1") == "1"
+
+# Load the PDF and preview stack, fonts, styles and letterhead images on
+# the render workers as soon as the app starts (COA_WARM_UP=0 to skip).
+WARM_UP = os.environ.get("COA_WARM_UP", "1") == "1"
+
+# Bulk exports are written under EXPORT_DIR, one directory per export, and
+# removed once older than COA_EXPORT_MAX_AGE seconds (see app.py).
+EXPORT_DIR = os.environ.get("COA_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "coa_exports"))
+EXPORT_MAX_AGE = float(os.environ.get("COA_EXPORT_MAX_AGE", 3600))
@@ -0,0 +1,76 @@
+"""
+Embedded TrueType fonts.
+
+By default COAs use the base-14 Times/Helvetica fonts, which PDF viewers
+supply, so nothing is embedded. With COA_FONT_DIR and COA_FONT_FAMILY set,
+a corporate TTF family replaces Times (COA_HEADING_FONT_FAMILY, by default
+the same family, replaces Helvetica). The directory holds
+``<family>-Regular.ttf`` and, optionally, ``-Bold``, ``-Italic`` and
+``-BoldItalic``; a missing face falls back to Regular.
+
+Each font file is parsed and registered once per process. ReportLab then
+embeds only a subset per PDF, holding the glyphs that document uses, so a
+COA grows by a few KiB rather than by the size of the font files.
+"""
+import os
+import threading
+
+from reportlab.lib.fonts import addMapping
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from coa_config import FONT_DIR, FONT_FAMILY, HEADING_FONT_FAMILY
+
+FACES = ("Regular", "Bold", "Italic", "BoldItalic")
+# (bold, italic) for each face, as used by <b>/<i> markup.
+FACE_STYLES = {"Regular": (0, 0), "Bold": (1, 0), "Italic": (0, 1), "BoldItalic": (1, 1)}
+BASE14 = {
+    "Times": ("Times-Roman", "Times-Bold", "Times-Italic", "Times-BoldItalic"),
+    "Helvetica": ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Helvetica-BoldOblique"),
+}
+
+_lock = threading.Lock()
+_registered = {}
+
+
+def register_family(font_dir, family):
+    """Register a TTF family once per process; returns its font names in FACES order."""
+    key = (os.path.abspath(font_dir), family)
+    with _lock:
+        names = _registered.get(key)
+        if names is None:
+            names = _registered[key] = _register(font_dir, family)
+    return names
+
+
+def _register(font_dir, family):
+    regular = os.path.join(font_dir, f"{family}-Regular.ttf")
+    if not os.path.exists(regular):
+        raise FileNotFoundError(f"No {family}-Regular.ttf in {font_dir}")
+    names = {}
+    for face in FACES:
+        path = os.path.join(font_dir, f"{family}-{face}.ttf")
+        if face == "Regular" or os.path.exists(path):
+            name = f"{family}-{face}"
+            # asciiReadable=False: embed only the characters used, not all of ASCII as well.
+            pdfmetrics.registerFont(TTFont(name, path, asciiReadable=False))
+            names[face] = name
+        else:
+            names[face] = names["Regular"]
+    # <b> and <i> inside a paragraph pick the matching face of the family.
+    # Regular goes last: faces that fall back to it must not take over its
+    # reverse (font name -> family, bold, italic) mapping.
+    for face in reversed(FACES):
+        bold, italic = FACE_STYLES[face]
+        addMapping(family, bold, italic, names[face])
+    return tuple(names[face] for face in FACES)
+
+
+def font_map():
+    """Base-14 font name -> the embedded font that replaces it (empty when none is configured)."""
+    mapping = {}
+    if FONT_DIR:
+        for base, family in (("Times", FONT_FAMILY), ("Helvetica", HEADING_FONT_FAMILY)):
+            if family:
+                mapping.update(zip(BASE14[base], register_family(FONT_DIR, family)))
+    return mapping
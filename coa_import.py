@@ -0,0 +1,442 @@
+"""
+Import instrument results into COA records.
+
+ICP-MS exports (heavy metals) and LIMS CSVs (microbiology, residual
+solvents) hold results for many batches. ``read_results`` reads such a file
+with pandas, CHUNK_ROWS rows at a time. Each chunk is mapped to catalogue
+rows in one vectorized pass:
+
+- an analyte that matches a base parameter fills ``<key>_result``. Matches
+  are by label, key, element symbol (also "208Pb" or "Pb [He]") or a
+  common alias such as "TAMC";
+- other known analytes (elements, solvents, organisms) become rows in the
+  ``*_extra_rows`` of their section. With ``section=``, so does any other
+  analyte;
+- mass-fraction units are converted to the unit the section reports in
+  (ppm for metals and solvents).
+
+Long files (one row per batch and analyte) and wide files (one row per
+batch, one column per analyte) are both read. ``apply_results`` fills the
+data dicts or COARecords of all batches at once:
+
+    python coa_import.py icpms.csv lims.csv --records batches.jsonl --out filled.jsonl
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from coa_catalogue import load_catalogue
+from coa_compliance import PPM_FACTORS, COUNT_UNITS, RESULT_PATTERN, THOUSANDS_SEPARATOR, UNITS
+from coa_record import COARecord, EXTRA_COLUMNS
+
+CHUNK_ROWS = int(os.environ.get("COA_IMPORT_CHUNK_ROWS", 50_000))
+RESULT_COLUMNS = ("batch_no", "section", "key", "param", "result", "method")
+SIGNIFICANT_DIGITS = 3
+
+# Header names per column, as normalized by _normalize_header.
+COLUMN_ALIASES = {
+    "batch_no": ("batch_no", "batch no", "batch", "batch number", "lot", "lot no", "lot number",
+                 "sample id", "sample name", "sample"),
+    "analyte": ("analyte", "analyte name", "element", "test", "test name", "parameter", "component",
+                "compound", "organism"),
+    "result": ("result", "final result", "reported result", "concentration", "conc", "value", "amount"),
+    "unit": ("unit", "units", "uom"),
+    "method": ("method", "test method", "method name"),
+    "section": ("section",),
+}
+
+# The unit each section's results are printed in.
+SECTION_UNITS = {"others": "ppm", "residual_solvent": "ppm", "microbio": "cfu/g"}
+
+# Symbol -> name for elements an ICP-MS run commonly reports.
+ELEMENTS = {
+    "pb": "Lead", "cd": "Cadmium", "as": "Arsenic", "hg": "Mercury", "zn": "Zinc", "cu": "Copper",
+    "ni": "Nickel", "cr": "Chromium", "co": "Cobalt", "sn": "Tin", "sb": "Antimony", "se": "Selenium",
+    "fe": "Iron", "mn": "Manganese", "al": "Aluminium", "ba": "Barium", "mo": "Molybdenum",
+    "v": "Vanadium", "tl": "Thallium", "ag": "Silver", "li": "Lithium", "au": "Gold", "pd": "Palladium",
+    "pt": "Platinum", "ir": "Iridium", "os": "Osmium", "rh": "Rhodium", "ru": "Ruthenium",
+}
+SOLVENTS = (
+    "Methanol", "Ethanol", "Acetone", "Hexane", "n-Hexane", "Heptane", "Ethyl Acetate", "Isopropanol",
+    "2-Propanol", "1-Propanol", "1-Butanol", "2-Butanol", "Dichloromethane", "Methylene Chloride",
+    "Chloroform", "Toluene", "Benzene", "Xylene", "Acetonitrile", "Cyclohexane", "Tetrahydrofuran",
+    "Methyl Ethyl Ketone", "Pentane", "Diethyl Ether", "Tert-Butyl Methyl Ether",
+)
+ORGANISMS = (
+    "Staphylococcus aureus", "Pseudomonas aeruginosa", "Enterobacteria", "Enterobacteriaceae",
+    "Bile-tolerant Gram-negative Bacteria", "Clostridia", "Listeria monocytogenes", "Shigella",
+)
+# Alias -> catalogue parameter key.
+ALIASES = {
+    "TAMC": "total_plate_count", "TPC": "total_plate_count", "APC": "total_plate_count",
+    "Total Aerobic Microbial Count": "total_plate_count", "Total Aerobic Count": "total_plate_count",
+    "Aerobic Plate Count": "total_plate_count",
+    "TYMC": "yeasts_mould", "Total Yeast and Mould Count": "yeasts_mould",
+    "Total Combined Yeasts and Moulds Count": "yeasts_mould", "Yeast and Mould": "yeasts_mould",
+    "Yeast and Mold": "yeasts_mould", "Yeasts and Moulds": "yeasts_mould", "Yeast & Mold": "yeasts_mould",
+    "E. coli": "e_coli", "Total Coliforms": "coliforms", "Salmonella spp.": "salmonella",
+}
+
+
+class ImportedResults(NamedTuple):
+    rows: pd.DataFrame   # RESULT_COLUMNS, one row per batch and analyte (the last one wins)
+    unmapped: dict       # analyte -> number of rows that matched no section
+    skipped: int         # rows without a batch number or a result
+
+
+# ----------------------------------------------------------------------------
+# NORMALIZATION
+# ----------------------------------------------------------------------------
+def _normalize(names):
+    """Lower-cased analyte names without units, modes, isotope masses or punctuation."""
+    names = (names.astype(str).str.lower()
+             .str.replace(r"\[[^\]]*\]|\([^)]*\)", " ", regex=True)   # "[He]", "(ppb)"
+             .str.strip()
+             .str.replace(r"^\d{1,3}\s*([a-z]{1,2})$", r"\1", regex=True)       # "208pb"
+             .str.replace(r"^([a-z]{1,2})[\s-]*\d{1,3}$", r"\1", regex=True))   # "pb 208"
+    return names.str.replace(r"[^\w%]+", " ", regex=True).str.strip()
+
+
+def _normalize_header(name):
+    name = re.sub(r"\[[^\]]*\]|\([^)]*\)", " ", str(name).lower())
+    return re.sub(r"[^\w%]+", " ", name).strip()
+
+
+def _header_unit(name):
+    # "Conc. [ppb]" or "Result (cfu/g)"
+    match = re.search(r"\[([^\]]*)\]|\(([^)]*)\)", str(name))
+    return (match.group(1) or match.group(2)).strip() if match else ""
+
+
+def analyte_table(catalogue=None):
+    """DataFrame indexed by normalized analyte name -> section, key ("" for extra rows), param."""
+    catalogue = catalogue or load_catalogue()
+    section_ids = {section.id for section in catalogue.sections}
+    base = {p.key: (section.id, p.key, p.label) for section in catalogue.sections for p in section.parameters}
+    by_label = {entry[2].lower(): entry for entry in base.values()}
+    # (name, entry) in order of precedence: catalogue rows first, so their
+    # labels win over the lists below.
+    candidates = [(name, entry) for entry in base.values() for name in (entry[2], entry[1])]
+    candidates += [(alias, base[key]) for alias, key in ALIASES.items() if key in base]
+    for symbol, name in ELEMENTS.items():
+        entry = by_label.get(name.lower(), ("others", "", name))
+        candidates += [(name, entry), (symbol, entry)]
+    candidates += [(name, ("residual_solvent", "", name)) for name in SOLVENTS]
+    candidates += [(name, ("microbio", "", name)) for name in ORGANISMS]
+
+    entries = {}
+    names = _normalize(pd.Series([name for name, _ in candidates], dtype=object))
+    for name, (_, entry) in zip(names, candidates):
+        if entry[0] in section_ids:
+            entries.setdefault(name, entry)
+    return pd.DataFrame.from_dict(entries, orient="index", columns=["section", "key", "param"])
+
+
+# ----------------------------------------------------------------------------
+# READING
+# ----------------------------------------------------------------------------
+def _find_columns(headers):
+    normalized = {_normalize_header(h): h for h in headers}
+    found = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                found[column] = normalized[alias]
+                break
+    return found
+
+
+def _long_chunk(chunk, columns, wide_columns):
+    # One row per batch and analyte, whatever the layout of the file.
+    if "analyte" in columns:
+        frame = pd.DataFrame({
+            "batch_no": chunk[columns["batch_no"]],
+            "analyte": chunk[columns["analyte"]],
+            "result": chunk[columns["result"]],
+            "unit": chunk[columns["unit"]] if "unit" in columns else _header_unit(columns["result"]),
+        })
+    else:
+        # Brackets in these headers hold the ICP-MS mode ("[He]"), not a unit.
+        frame = chunk.melt(id_vars=[columns["batch_no"]], value_vars=wide_columns,
+                           var_name="analyte", value_name="result")
+        frame = frame.rename(columns={columns["batch_no"]: "batch_no"})
+        frame["unit"] = ""
+    for column in ("method", "section"):
+        if column in columns:
+            frame[column] = np.tile(chunk[columns[column]].to_numpy(), len(frame) // len(chunk))
+        else:
+            frame[column] = ""
+    return frame
+
+
+def _by_value(series, transform):
+    # String work once per distinct value: an export repeats the same few
+    # analytes, units and batch numbers over thousands of rows.
+    codes, uniques = pd.factorize(series.fillna(""))
+    return pd.Series(transform(pd.Series(uniques, dtype=object)).to_numpy()[codes], index=series.index)
+
+
+def _format_numbers(values):
+    # Three significant digits in positional notation; whole numbers (counts) as they are.
+    whole = np.isfinite(values) & (values == np.round(values))
+    formatted = pd.Series(values.where(whole, 0).astype(np.int64).astype(str), index=values.index)
+    formatted[~whole] = _by_value(values[~whole], lambda v: v.map(
+        lambda x: np.format_float_positional(x, precision=SIGNIFICANT_DIGITS, unique=True, fractional=False,
+                                             trim="-")))
+    return formatted
+
+
+def _unit_key(units):
+    return units.str.lower().str.replace("μ", "µ").str.replace(" ", "")
+
+
+def _results_text(frame, default_unit=""):
+    raw = frame["result"]  # stripped
+    # Plain numbers are parsed in one pass; only the rest ("< 0.5", "12 ppb",
+    # "Absent") go through the regular expression, once per distinct value.
+    number = pd.to_numeric(raw, errors="coerce")
+    number_text = raw.copy()
+    qualifier = pd.Series("", index=raw.index, dtype=object)
+    inline_unit = pd.Series("", index=raw.index, dtype=object)
+    other = number.isna()
+    if other.any():
+        codes, uniques = pd.factorize(raw[other])
+        uniques = pd.Series(uniques, dtype=object).str.replace(THOUSANDS_SEPARATOR, "", regex=True)  # "1,500"
+        parts = uniques.str.extract(RESULT_PATTERN).fillna("")
+        parts = parts.iloc[codes].set_axis(raw.index[other])
+        number[other] = pd.to_numeric(parts["num"], errors="coerce")
+        number_text[other] = parts["num"]
+        qualifier[other] = parts["qual"].where(parts["qual"] == "", parts["qual"] + " ")
+        inline_unit[other] = parts["unit"]
+    # "inf" and overflowing numbers are kept as reported.
+    number = number.where(np.isfinite(number))
+    inline_unit = _by_value(inline_unit, lambda u: u.str.strip())
+    unit = _by_value(frame["unit"], lambda u: u.str.strip())
+    unit = unit.where(unit != "", inline_unit).replace("", default_unit)
+    unit_key = _by_value(unit, _unit_key)
+    # Text after the number that is not a unit ("12 (est.)", "1.2.3"): the
+    # number read may not be the result, so the value is kept as reported.
+    unclear = (inline_unit != "") & ~_by_value(inline_unit, _unit_key).isin(UNITS)
+    number[unclear] = np.nan
+    target = frame["section"].map(SECTION_UNITS).fillna("")
+    factor = pd.Series(np.nan, index=frame.index)
+    for target_unit, factors in (("ppm", PPM_FACTORS), ("cfu/g", COUNT_UNITS)):
+        selected = target == target_unit
+        factor[selected] = unit_key[selected].map({**{k.replace(" ", ""): f for k, f in factors.items()}, "": 1.0})
+    converted = number.notna() & factor.notna()
+    as_reported = number.notna() & ~converted
+
+    text = raw.copy()
+    text[converted] = qualifier[converted] + _format_numbers((number * factor)[converted]) + " " + target[converted]
+    text[as_reported] = (qualifier[as_reported] + number_text[as_reported].str.strip() + " "
+                         + unit[as_reported]).str.rstrip()
+    return text
+
+
+def read_results(source, section=None, unit="", chunksize=CHUNK_ROWS, sep=",", catalogue=None):
+    """Read an instrument/LIMS CSV (a path or a file) into ImportedResults.
+
+    section is the catalogue section id for analytes that are not known
+    (e.g. "others" for an ICP-MS run); without it they are reported in
+    ``unmapped``. A "Section" column in the file overrides it per row.
+    unit is the unit of results that give none, in a column, the result
+    header ("Conc. [ppb]") or the value; by default the section's own unit.
+    """
+    catalogue = catalogue or load_catalogue()
+    table = analyte_table(catalogue)
+    section_names = {name: s.id for s in catalogue.sections
+                     for name in _normalize(pd.Series([s.name, s.id, s.label_prefix]))}
+    frames = []
+    unmapped = pd.Series(dtype=np.int64)
+    skipped = 0
+    columns = wide_columns = None
+    reader = pd.read_csv(source, sep=sep, dtype=str, keep_default_na=False, skipinitialspace=True,
+                         encoding="utf-8-sig", chunksize=chunksize)
+    for chunk in reader:
+        if columns is None:
+            columns = _find_columns(chunk.columns)
+            if "batch_no" not in columns:
+                raise ValueError(f"No batch column (one of: {', '.join(COLUMN_ALIASES['batch_no'])})")
+            if "analyte" not in columns:
+                # Wide file: every column named after a known analyte holds its results.
+                names = _normalize(pd.Series(chunk.columns, index=chunk.columns, dtype=object))
+                wide_columns = [h for h in chunk.columns if names[h] in table.index and h not in columns.values()]
+                if not wide_columns:
+                    raise ValueError("No analyte column and no columns named after known analytes")
+            elif "result" not in columns:
+                raise ValueError(f"No result column (one of: {', '.join(COLUMN_ALIASES['result'])})")
+
+        frame = _long_chunk(chunk, columns, wide_columns)
+        frame["batch_no"] = _by_value(frame["batch_no"], lambda b: b.str.strip())
+        frame["result"] = frame["result"].str.strip()
+        keep = (frame["batch_no"] != "") & (frame["result"] != "")
+        skipped += int((~keep).sum())
+        frame = frame[keep].copy()
+        frame["name"] = _by_value(frame["analyte"], _normalize)
+        frame = frame.join(table, on="name", rsuffix="_known")
+        # Unknown analytes: the row's own section, else the section for the file.
+        fallback = _by_value(frame["section"], _normalize).map(section_names)
+        if section is not None:
+            fallback = fallback.fillna(section)
+        frame["section"] = frame["section_known"].fillna(fallback)
+        frame["key"] = frame["key"].fillna("")
+        frame["param"] = frame["param"].fillna(_by_value(frame["analyte"], lambda a: a.str.strip()))
+        lost = frame["section"].isna()
+        if lost.any():
+            unmapped = unmapped.add(frame.loc[lost, "analyte"].value_counts(), fill_value=0)
+            frame = frame[~lost].copy()
+        frame["result"] = _results_text(frame, unit)
+        frame["batch"] = _by_value(frame["batch_no"], lambda b: b.str.upper())
+        frames.append(frame[list(RESULT_COLUMNS) + ["batch", "name"]])
+
+    rows = (pd.concat(frames, ignore_index=True) if frames
+            else pd.DataFrame(columns=list(RESULT_COLUMNS) + ["batch", "name"]))
+    # Re-runs later in the file replace earlier results.
+    rows = rows.drop_duplicates(["batch", "section", "name"], keep="last")[list(RESULT_COLUMNS)]
+    return ImportedResults(rows.reset_index(drop=True), {k: int(v) for k, v in unmapped.items()}, skipped)
+
+
+# ----------------------------------------------------------------------------
+# APPLYING
+# ----------------------------------------------------------------------------
+def _batch_key(batch_no):
+    # As read_results compares them: case and surrounding spaces do not matter.
+    return str(batch_no or "").strip().upper()
+
+
+def batch_updates(rows):
+    """{batch key: (fields, extra)} from ImportedResults.rows.
+
+    fields maps ``<key>_result`` (and ``<key>_method``) to values; extra maps
+    each section id to its imported (param, result, method) rows.
+    """
+    updates = {}
+    batches = _by_value(rows["batch_no"], lambda b: b.str.strip().str.upper())
+    for batch, section_id, key, param, result, method in zip(
+            batches.to_numpy(), *(rows[c].to_numpy() for c in RESULT_COLUMNS[1:])):
+        fields, extra = updates.setdefault(batch, ({}, {}))
+        if key:
+            fields[f"{key}_result"] = result
+            if method:
+                fields[f"{key}_method"] = method
+        else:
+            extra.setdefault(section_id, []).append((param, result, method))
+    return updates
+
+
+def _merge_extra(rows, imported):
+    # A row with the same parameter name gets the new result (keeping its
+    # spec); other analytes are appended with an empty spec.
+    rows = [[row.get(c, "") for c in EXTRA_COLUMNS] if isinstance(row, dict) else list(row)
+            for row in rows or () if row]
+    by_param = {str(row[0]).strip().lower(): row for row in rows}
+    for param, result, method in imported:
+        row = by_param.get(param.lower())
+        if row is None:
+            row = by_param[param.lower()] = [param, "", "", ""]
+            rows.append(row)
+        row[2] = result
+        if method:
+            row[3] = method
+    return [tuple(row) for row in rows]
+
+
+def apply_results(records, results):
+    """Fill many batches at once; returns (records, batch numbers with no record).
+
+    records are flat data dicts or COARecords, matched on batch_no (ignoring
+    case and surrounding spaces); each comes back as the same type.
+    results is an ImportedResults or a list of them.
+    """
+    if isinstance(results, ImportedResults):
+        results = [results]
+    rows = pd.concat([r.rows for r in results], ignore_index=True)
+    updates = batch_updates(rows)
+    filled = []
+    seen = set()
+    for record in records:
+        is_record = isinstance(record, COARecord)
+        if not is_record and not isinstance(record, dict):
+            # A row coa_batch could not read (UnreadableRecord): passed through.
+            filled.append(record)
+            continue
+        batch = _batch_key(record.batch_no if is_record else record.get("batch_no"))
+        seen.add(batch)
+        update = updates.get(batch)
+        if update is None:
+            filled.append(record)
+            continue
+        fields, extra = update
+        data = record.to_data() if is_record else record
+        merged = {**data, **fields}
+        for section_id, imported in extra.items():
+            key = f"{section_id}_extra_rows"
+            merged[key] = _merge_extra(data.get(key), imported)
+        filled.append(COARecord.from_data(merged) if is_record else merged)
+    missing = [b for b in rows["batch_no"].drop_duplicates() if _batch_key(b) not in seen]
+    return filled, missing
+
+
+def records_from_results(results):
+    """One data dict per batch in results, holding only the batch number and its results."""
+    if isinstance(results, ImportedResults):
+        results = [results]
+    batches = pd.concat([r.rows for r in results])["batch_no"]
+    batches = batches[~batches.str.upper().duplicated()]
+    return apply_results([{"batch_no": b} for b in batches], results)[0]
+
+
+# ----------------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------------
+def main(argv=None):
+    from coa_batch import read_records
+
+    parser = argparse.ArgumentParser(description="Fill COA results from ICP-MS/LIMS CSV exports.")
+    parser.add_argument("results", nargs="+", help="instrument or LIMS CSV files")
+    parser.add_argument("--records", help="CSV/JSONL batch records to fill (default: one new record per batch)")
+    parser.add_argument("--out", required=True, help="JSONL file for the filled records (input for coa_batch.py)")
+    parser.add_argument("--section", help="catalogue section for analytes that are not known, e.g. others")
+    parser.add_argument("--unit", default="", help="unit of results that give none, e.g. ppb")
+    parser.add_argument("--sep", default=",", help="field separator of the result files")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="rows read at a time")
+    args = parser.parse_args(argv)
+
+    results = []
+    for path in args.results:
+        try:
+            imported = read_results(path, section=args.section, unit=args.unit, chunksize=args.chunksize,
+                                    sep=args.sep)
+        except (OSError, ValueError) as exc:
+            parser.error(f"could not read {path}: {exc}")
+        results.append(imported)
+        print(f"{path}: {len(imported.rows)} results for {imported.rows['batch_no'].str.upper().nunique()} batches "
+              f"({imported.skipped} empty rows skipped)")
+        for analyte, count in sorted(imported.unmapped.items()):
+            print(f"  not mapped: {analyte} ({count} rows); use --section to import it", file=sys.stderr)
+
+    if args.records:
+        try:
+            records = list(read_records(args.records))
+        except (OSError, ValueError) as exc:
+            parser.error(f"could not read {args.records}: {exc}")
+        records, missing = apply_results(records, results)
+        for batch_no in missing:
+            print(f"  no record for batch {batch_no}", file=sys.stderr)
+    else:
+        records = records_from_results(results)
+    with open(args.out, "w", encoding="utf-8") as fh:
+        for record in records:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"{len(records)} records written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
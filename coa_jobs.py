@@ -0,0 +1,207 @@
+"""
+Background render queue.
+
+PDF generation and preview rasterization run on a shared worker pool
+instead of the Streamlit script thread. Sessions submit a job, then poll
+its queue position and progress until the bytes are ready.
+
+Set COA_RENDER_EXECUTOR=process to run generate_pdf in worker processes
+(rasterization and caching still happen on the queue's threads).
+
+ReportLab and PyMuPDF are imported by the workers, on the first job or on
+warm_up(), never by the script thread that creates the queue.
+"""
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from coa_cache import PDFCache, render_pdf
+from coa_config import THUMB_DPI
+from coa_record import as_record
+from coa_timing import StageTimer
+
+DEFAULT_WORKERS = int(os.environ.get("COA_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+DEFAULT_EXECUTOR = os.environ.get("COA_RENDER_EXECUTOR", "thread")
+MAX_FINISHED_JOBS = 200
+logger = logging.getLogger("coa.jobs")
+
+# (state, progress) for each stage of a job
+STAGES = {
+    "queued": 0.0,
+    "rendering": 0.2,
+    "thumbnails": 0.6,
+    "rasterizing": 0.8,
+    "done": 1.0,
+    "failed": 1.0,
+}
+
+
+def _render_bytes(record, layout):
+    # Runs in a worker process when the process executor is enabled; the
+    # record crosses the process boundary in its compact serialized form.
+    from coa_pdf import generate_pdf
+    return generate_pdf(record, layout=layout).getvalue()
+
+
+def _warm_up_worker(preview=True):
+    from coa_pdf import warm_up
+    pdf_bytes = warm_up()
+    if preview:
+        from coa_preview import PreviewRasterizer
+        # A throwaway cache: the warm-up PDF should not take up raster cache space.
+        with PreviewRasterizer(pdf_bytes, cache=PDFCache(max_bytes=0)) as rasterizer:
+            rasterizer.page(0, THUMB_DPI)
+
+
+def _log_warm_up_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("warm-up failed: %r", future.exception())
+
+
+class RenderJob:
+    __slots__ = ("id", "seq", "record", "layout", "preview", "archive", "archive_id", "stage", "pdf",
+                 "error", "submitted", "started", "finished", "timer", "timings")
+
+    def __init__(self, job_id, seq, record, layout, preview, timer, archive=False):
+        self.id = job_id
+        self.seq = seq
+        self.record = record
+        self.layout = layout
+        self.preview = preview
+        self.archive = archive
+        self.archive_id = None
+        self.stage = "queued"
+        self.pdf = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.timer = timer
+        self.timings = None
+
+
+class RenderQueue:
+    def __init__(self, workers=DEFAULT_WORKERS, executor=DEFAULT_EXECUTOR, archive=None):
+        # archive: an optional COAArchive that stores jobs submitted with archive=True.
+        self.archive = archive
+        self.workers = workers
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coa-render")
+        self._processes = None
+        if executor == "process":
+            # spawn: the Streamlit server is multi-threaded, so never fork it.
+            self._processes = ProcessPoolExecutor(max_workers=workers,
+                                                  mp_context=multiprocessing.get_context("spawn"))
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+
+    # ------------------------------------------------------------------
+    def submit(self, record, layout=None, preview=None, timer=None, archive=False):
+        """record is a COARecord (or data dict); preview is an optional
+        (format, dpi) tuple to rasterize as well.
+
+        Pass a StageTimer to continue timing a render the caller started,
+        e.g. after building the record. archive=True stores the finished
+        COA in the queue's archive.
+        """
+        seq = next(self._seq)
+        job = RenderJob(f"job-{seq}", seq, as_record(record), layout, preview, timer or StageTimer(), archive)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._threads.submit(self._run, job)
+        return job.id
+
+    def _prune(self):
+        finished = [j.id for j in self._jobs.values() if j.finished is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        job.started = time.time()
+        timer = job.timer
+        timer.add("queue_wait", job.started - job.submitted)
+        final_stage = "failed"
+        try:
+            job.stage = "rendering"
+            render = None
+            if self._processes is not None:
+                render = lambda record, layout: self._processes.submit(_render_bytes, record, layout).result()
+            job.pdf = render_pdf(job.record, layout=job.layout, render=render, timer=timer)
+            if job.archive and self.archive is not None:
+                # The PDF is already usable; a failed archive write is logged, not raised.
+                try:
+                    with timer.stage("archive"):
+                        job.archive_id = self.archive.add(job.record, job.pdf)
+                except Exception:
+                    logger.exception("could not archive %s", job.id)
+            if job.preview:
+                from coa_preview import PreviewRasterizer
+                fmt, dpi = job.preview
+                with PreviewRasterizer(job.pdf, fmt=fmt, timer=timer) as rasterizer:
+                    for stage, page_dpi in (("thumbnails", THUMB_DPI), ("rasterizing", dpi)):
+                        job.stage = stage
+                        for page_no in range(rasterizer.page_count):
+                            rasterizer.page(page_no, page_dpi)
+            final_stage = "done"
+        except Exception as exc:
+            job.error = f"{type(exc).__name__}: {exc}"
+            final_stage = "failed"
+        finally:
+            job.record = None
+            job.finished = time.time()
+            timer.meta.update(job=job.id, layout=job.layout, preview=bool(job.preview), stage=final_stage,
+                              bytes=len(job.pdf or b""))
+            job.timings = timer.record()
+            # Published last: sessions polling for "done" read timings right away.
+            job.stage = final_stage
+            timer.log()
+
+    # ------------------------------------------------------------------
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            position = None
+            if job.stage == "queued":
+                position = 1 + sum(1 for j in self._jobs.values()
+                                   if j.stage == "queued" and j.seq < job.seq)
+        return {
+            "id": job.id,
+            "stage": job.stage,
+            "progress": STAGES[job.stage],
+            "position": position,
+            "error": job.error,
+            "elapsed": (job.finished or time.time()) - job.submitted,
+        }
+
+    def warm_up(self):
+        """Load fonts, styles, letterhead images and the render stack on the
+        workers ahead of the first job. Returns the futures without waiting."""
+        futures = [self._threads.submit(_warm_up_worker)]
+        if self._processes is not None:
+            # Worker processes only build PDFs; one task per process as they spawn.
+            futures += [self._processes.submit(_warm_up_worker, False) for _ in range(self.workers)]
+        for future in futures:
+            future.add_done_callback(_log_warm_up_failure)
+        return futures
+
+    def stats(self):
+        with self._lock:
+            stages = [j.stage for j in self._jobs.values()]
+        return {stage: stages.count(stage) for stage in STAGES if stage in stages}
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
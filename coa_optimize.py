@@ -0,0 +1,101 @@
+"""
+Optional PDF post-processing with PyMuPDF.
+
+ReportLab writes the letterhead images as Flate-compressed RGB at their
+full resolution. ``optimize_pdf`` rewrites a finished PDF for mailing and
+archiving:
+
+- images above 1.5x PRINT_DPI are downsampled to PRINT_DPI, and all images
+  are recompressed as JPEG at IMAGE_QUALITY;
+- unused objects are dropped, identical objects and streams are merged,
+  and every stream is deflated into compressed object streams;
+- with LINEARIZE, the file is linearized for fast web view. MuPDF 1.24+
+  no longer writes linearized files, so this step uses the optional
+  ``pikepdf`` package and is skipped (with a warning) when it is missing.
+
+Turned on with COA_OPTIMIZE_PDF=1 (or ``optimize=True`` on generate_pdf).
+Before/after sizes and times are kept in ``optimize_stats`` and logged on
+the ``coa.optimize`` logger.
+"""
+import io
+import logging
+import threading
+import time
+
+import fitz  # PyMuPDF
+
+from coa_config import PRINT_DPI, IMAGE_QUALITY, LINEARIZE
+from coa_timing import NULL_TIMER
+
+try:
+    import pikepdf
+except ImportError:  # optional: only needed to linearize
+    pikepdf = None
+
+logger = logging.getLogger("coa.optimize")
+
+# As in Ghostscript: images only a little above the target are left alone.
+DOWNSAMPLE_THRESHOLD = 1.5
+
+
+class OptimizeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def add(self, bytes_in, bytes_out, seconds):
+        with self._lock:
+            self.documents += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": self.documents,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "saved": (1 - self.bytes_out / self.bytes_in) if self.bytes_in else 0.0,
+                "ms_per_document": round(self.seconds / self.documents * 1000, 1) if self.documents else 0.0,
+            }
+
+
+optimize_stats = OptimizeStats()
+_warned_linearize = False
+
+
+def optimize_pdf(pdf_bytes, dpi=PRINT_DPI, quality=IMAGE_QUALITY, linearize=LINEARIZE, timer=NULL_TIMER):
+    """Return pdf_bytes compressed, de-duplicated and (optionally) linearized."""
+    start = time.perf_counter()
+    with timer.stage("optimize_images"):
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            doc.rewrite_images(dpi_threshold=round(dpi * DOWNSAMPLE_THRESHOLD), dpi_target=dpi, quality=quality)
+            # garbage=4: drop unused objects and merge duplicate objects and streams.
+            out = doc.tobytes(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True, use_objstms=1)
+        finally:
+            doc.close()
+    if linearize:
+        with timer.stage("linearize"):
+            out = _linearize(out)
+    elapsed = time.perf_counter() - start
+    optimize_stats.add(len(pdf_bytes), len(out), elapsed)
+    logger.debug("optimized PDF: %d -> %d bytes in %.1f ms", len(pdf_bytes), len(out), elapsed * 1000)
+    return out
+
+
+def _linearize(pdf_bytes):
+    global _warned_linearize
+    if pikepdf is None:
+        if not _warned_linearize:
+            _warned_linearize = True
+            logger.warning("COA_LINEARIZE is set but pikepdf is not installed; PDFs are not linearized")
+        return pdf_bytes
+    out = io.BytesIO()
+    with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+        pdf.save(out, linearize=True, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+    return out.getvalue()
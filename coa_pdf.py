@@ -0,0 +1,632 @@
+import contextlib
+import copy
+import functools
+import os
+import io
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+# ReportLab imports
+from reportlab import rl_config
+from reportlab.pdfbase import pdfmetrics
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.platypus import (
+    SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer,
+    KeepInFrame, KeepTogether, PageBreak, Flowable
+)
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import ImageReader
+
+from coa_catalogue import load_catalogue
+from coa_compliance import check
+from coa_config import LAYOUTS, DEFAULT_LAYOUT, READABILITY_FLOOR, OPTIMIZE_PDF, CHECK_SPECS
+from coa_fonts import font_map
+from coa_record import COARecord, as_record
+from coa_timing import NULL_TIMER
+
+
+# Embed image streams as binary Flate data; the default ASCII85 wrapping is
+# done in pure Python for every image of every render and inflates it by 25%.
+rl_config.useA85 = 0
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+LETTERHEAD_FORM = "COALetterhead"
+
+
+@functools.lru_cache(maxsize=None)
+def letterhead_image(filename):
+    # Decoded once per process; ReportLab keeps the RGB data on the reader.
+    path = os.path.join(IMAGES_DIR, filename)
+    if not os.path.exists(path):
+        return None
+    reader = ImageReader(path)
+    reader.getRGBData()
+    return reader
+
+
+def letterhead_form(canvas):
+    # The logo and footer go into one form XObject per document, so every
+    # page only references it instead of re-hashing and re-drawing the images.
+    if not canvas.hasForm(LETTERHEAD_FORM):
+        canvas.beginForm(LETTERHEAD_FORM)
+        logo = letterhead_image("tru_herb_logo.png")
+        footer = letterhead_image("footer.png")
+        if logo is not None:
+            canvas.drawImage(logo, x=250, y=A4[1] - 55, width=100, height=50)
+        if footer is not None:
+            canvas.drawImage(footer, x=50, y=5, width=500, height=80)
+        canvas.endForm()
+    return LETTERHEAD_FORM
+
+
+def header_footer(canvas, doc):
+    canvas.saveState()
+    canvas.doForm(letterhead_form(canvas))
+    canvas.restoreState()
+
+
+# ----------------------------------------------------------------------------
+# COMPILED TEMPLATE
+# Everything that does not depend on the batch is built once per process:
+# frozen styles, the static paragraphs, table styles and column widths.
+# ----------------------------------------------------------------------------
+class FrozenParagraphStyle(ParagraphStyle):
+    def __setattr__(self, name, value):
+        if self.__dict__.get("_frozen"):
+            raise AttributeError(f"Style '{self.name}' is shared by all renders and cannot be modified")
+        super().__setattr__(name, value)
+
+
+def freeze_style(style):
+    frozen = FrozenParagraphStyle(style.name)
+    frozen.__dict__.update({k: v for k, v in style.__dict__.items() if k != "parent"})
+    frozen.__dict__["parent"] = None
+    frozen.__dict__["_frozen"] = True
+    return frozen
+
+
+# ----------------------------------------------------------------------------
+# PARAGRAPH MEMO
+# Between two previews usually only a result or two changes, yet every row
+# used to be parsed and line-broken again. Paragraphs are kept by their text
+# and style; unchanged rows are cloned from the memo and reuse the line
+# breaks already computed for their column width.
+# ----------------------------------------------------------------------------
+MAX_WRAP_WIDTHS = 8
+
+
+class MemoParagraph(Paragraph):
+    def __init__(self, text, style, *args, **kwargs):
+        Paragraph.__init__(self, text, style, *args, **kwargs)
+        # Shared by every clone: available width -> wrapped layout state.
+        self._wraps = {}
+
+    def wrap(self, availWidth, availHeight):
+        # The line breaks depend only on the width, never on availHeight, and
+        # drawing only reads them, so clones can share one wrap per width.
+        wrapped = self._wraps.get(availWidth)
+        if wrapped is not None:
+            size, state = wrapped
+            self.__dict__.update(state)
+            return size
+        size = Paragraph.wrap(self, availWidth, availHeight)
+        state = {k: self.__dict__[k] for k in ("width", "height", "blPara", "_wrapWidths") if k in self.__dict__}
+        if len(self._wraps) >= MAX_WRAP_WIDTHS:
+            self._wraps.clear()
+        self._wraps[availWidth] = (size, state)
+        return size
+
+
+DEFAULT_MEMO_ENTRIES = int(os.environ.get("COA_PARAGRAPH_MEMO", 4096))
+
+
+class ParagraphMemo:
+    def __init__(self, max_entries=DEFAULT_MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.parse_seconds = 0.0
+
+    def paragraph(self, text, style):
+        """A private copy of the paragraph for text in style, parsed at most once."""
+        key = (text, style)
+        with self._lock:
+            prototype = self._entries.get(key)
+            if prototype is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if prototype is None:
+            start = time.perf_counter()
+            prototype = MemoParagraph(text, style)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.misses += 1
+                self.parse_seconds += elapsed
+                if self.max_entries > 0:
+                    self._entries[key] = prototype
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+        return copy.copy(prototype)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                # Parsing only; line breaks saved by shared wraps come on top.
+                "parse_ms_saved": round(self.hits * self.parse_seconds / self.misses * 1000, 1)
+                if self.misses else 0.0,
+            }
+
+
+paragraph_memo = ParagraphMemo()
+
+
+REMARKS_TEXT = ("Since the product is derived from natural origin, there is likely to be minor color "
+                "variation because of the geographical and seasonal variations of the raw material")
+END_TEXT = "REMARKS: COMPLIES WITH IN HOUSE SPECIFICATIONS"
+FAIL_TEXT = "REMARKS: DOES NOT COMPLY WITH IN HOUSE SPECIFICATIONS"
+
+
+class COATemplate:
+    def __init__(self):
+        sample = getSampleStyleSheet()
+        # Base-14 names below are swapped for the embedded fonts, if configured.
+        fonts = font_map()
+        font = lambda name: fonts.get(name, name)
+
+        # A private copy of BodyText instead of mutating the sample sheet's.
+        normal_style = ParagraphStyle('normal_style', parent=sample['BodyText'],
+                                      fontName=font('Times-Roman'), alignment=0)
+        styles = {
+            "title": ParagraphStyle('title_style', fontSize=12, spaceAfter=1, alignment=1,
+                                    fontName=font('Times-Bold')),
+            "title1": ParagraphStyle('title_style1', fontSize=10, spaceAfter=0, alignment=1,
+                                     fontName=font('Times-Bold')),
+            "normal": normal_style,
+            # Method column is center aligned.
+            "method": ParagraphStyle('method_style', parent=normal_style, alignment=1),
+            "section": ParagraphStyle('section_style', parent=sample['Normal'], fontName=font('Helvetica')),
+            "header": ParagraphStyle('header_style', parent=sample['Normal'], alignment=1,
+                                     fontName=font('Helvetica-Bold'), fontSize=10),
+            "bold_center": ParagraphStyle('bold_center', parent=sample['Normal'],
+                                          fontName=font('Helvetica-Bold'), alignment=1),
+            "label": ParagraphStyle('paragraphImplicitDefaultStyle', fontName=font('Helvetica')),
+            # Results out of spec, and the remark that lists them.
+            "out_of_spec": ParagraphStyle('out_of_spec_style', parent=normal_style,
+                                          fontName=font('Times-Bold'), textColor=colors.red),
+            "fail_remark": ParagraphStyle('fail_remark', parent=sample['Normal'], fontName=font('Helvetica-Bold'),
+                                          alignment=1, textColor=colors.red),
+        }
+        self.styles = MappingProxyType({name: freeze_style(s) for name, s in styles.items()})
+        s = self.styles
+
+        self.title = MemoParagraph("CERTIFICATE OF ANALYSIS", s["title"])
+        self.spec_headers = tuple(
+            MemoParagraph(text, s["header"]) for text in ("Parameter", "Specification", "Result", "Method")
+        )
+        self.remarks = MemoParagraph(REMARKS_TEXT, s["normal"])
+        self.final_remark = MemoParagraph(END_TEXT, s["bold_center"])
+        self.declaration_title = MemoParagraph("Declaration", s["title1"])
+        self.declaration_cells = {
+            text: MemoParagraph(text, s["normal"])
+            for text in ("Free from GMO", "Non – Irradiated", "At room temperature",
+                         "Executive – QC", "Head-QC/QA")
+        }
+
+        self.product_col_widths = (140, 360)
+        total_width = 500
+        self.spec_col_widths = (total_width * 0.23,
+                                total_width * 0.39,
+                                total_width * 0.18,
+                                total_width * 0.20)
+        self.declaration_col_widths = (80, 150, 75, 100, 95)
+
+        self.product_table_style = TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('FONTNAME', (0, 0), (-1, -1), font('Times-Roman')),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('WORDWRAP', (0, 0), (-1, -1), 'LTR'),
+        ])
+        self.spec_table_commands = (
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('FONTNAME', (0, 0), (-1, -1), font('Times-Roman')),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('WORDWRAP', (0, 0), (-1, -1), 'LTR'),
+            ('ALIGN', (3, 0), (3, -1), 'CENTER'),
+        )
+        self.out_of_spec_background = colors.HexColor("#FDE2E2")
+        self.declaration_table_style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), font('Helvetica')),
+            ('ALIGN', (0, 0), (1, -1), 'LEFT'),
+            ('ALIGN', (3, 0), (4, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('WORDWRAP', (0, 0), (-1, -1), 'LTR'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+            ('TOPPADDING', (0, 0), (-1, -1), 0),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+            ('SPAN', (2, 0), (2, 2)),
+        ])
+
+    @staticmethod
+    def clone(flowable):
+        # Layout state (wrap sizes, line breaks) lives on the flowable, so each
+        # render gets its own shallow copy of the pre-parsed paragraph.
+        return copy.copy(flowable)
+
+    def declaration_table(self, allergen_statement):
+        c = self.clone
+        cells = self.declaration_cells
+        declaration_data = [
+            ["GMO Status:", c(cells["Free from GMO"]), "",
+             "Allergen statement:", paragraph_memo.paragraph(f"{allergen_statement}", self.styles["normal"])],
+            ["Irradiation status:", c(cells["Non – Irradiated"]), "",
+             "Storage condition:", c(cells["At room temperature"])],
+            ["Prepared by", c(cells["Executive – QC"]), "",
+             "Approved by", c(cells["Head-QC/QA"])],
+        ]
+        table = Table(declaration_data, colWidths=self.declaration_col_widths)
+        table.setStyle(self.declaration_table_style)
+        return table
+
+
+@functools.lru_cache(maxsize=None)
+def get_template():
+    return COATemplate()
+
+
+# ----------------------------------------------------------------------------
+# FIT-TO-PAGE LAYOUT
+# "shrink" is ReportLab's KeepInFrame, which re-wraps the whole document
+# while it searches for a scale. "fit" measures every flowable once and
+# derives the scale directly: the tables have fixed column widths, so their
+# height does not change with the frame width. "paged" never scales: the
+# specification table flows over as many pages as it needs. LAYOUTS,
+# DEFAULT_LAYOUT and READABILITY_FLOOR come from coa_config.
+# ----------------------------------------------------------------------------
+
+
+class ScaledBlock(Flowable):
+    def __init__(self, content, sizes, height, scale, frame_width):
+        Flowable.__init__(self)
+        self.content = content
+        self.sizes = sizes
+        self.block_height = height
+        self.scale = scale
+        self.frame_width = frame_width
+
+    def wrap(self, availWidth, availHeight):
+        return self.frame_width, self.block_height * self.scale
+
+    def draw(self):
+        canvas = self.canv
+        canvas.saveState()
+        canvas.scale(self.scale, self.scale)
+        inner_width = self.frame_width / self.scale
+        y = self.block_height
+        for i, (flowable, (w, h)) in enumerate(zip(self.content, self.sizes)):
+            if i:
+                y -= flowable.getSpaceBefore()
+            y -= h
+            flowable.drawOn(canvas, 0, y, _sW=inner_width - w)
+            y -= flowable.getSpaceAfter()
+        canvas.restoreState()
+
+
+def _stack_height(content, sizes):
+    height = sum(h for _, h in sizes)
+    for i, flowable in enumerate(content):
+        if i:
+            height += flowable.getSpaceBefore()
+        height += flowable.getSpaceAfter()
+    return height
+
+
+def fit_to_frame(content, width, height, floor=READABILITY_FLOOR):
+    sizes = [flowable.wrap(width, height) for flowable in content]
+    total = _stack_height(content, sizes)
+    scale = min(1.0, height / total) if total else 1.0
+    if scale < floor:
+        # Too long for one readable page: let the tables flow onto more pages.
+        return content, scale
+    if scale < 1.0:
+        # Only free-standing paragraphs depend on the frame width; re-wrap
+        # them at the scaled-up width so centred text stays centred.
+        inner_width = width / scale
+        sizes = [
+            flowable.wrap(inner_width, height / scale) if isinstance(flowable, Paragraph) else size
+            for flowable, size in zip(content, sizes)
+        ]
+        total = _stack_height(content, sizes)
+        scale = min(scale, height / total)
+    return [ScaledBlock(content, sizes, total, scale, width)], scale
+
+
+def new_document(output):
+    return SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        topMargin=50,
+        bottomMargin=80
+    )
+
+
+def coa_flowables(record, layout, doc, timer=NULL_TIMER):
+    # Flowables for one COARecord, already wrapped for the layout and the frame of doc.
+    with timer.stage("flowables"):
+        tpl = get_template()
+        styles = tpl.styles
+        normal_style = styles["normal"]
+        method_style = styles["method"]
+        memo = paragraph_memo
+
+        elements = []
+        elements.append(Spacer(1, 3))
+        elements.append(tpl.clone(tpl.title))
+        elements.append(memo.paragraph(record.product_name.upper(), styles["title"]))
+        elements.append(Spacer(1, 3))
+
+        # ----------------------------------------------------------------
+        # Build Product Info table, skipping truly empty fields
+        # ----------------------------------------------------------------
+        product_info = []
+
+        def maybe_add_product_row(label, value, italic=False, bold=False):
+            text_str = value.strip() if value else ""
+            if text_str:
+                if italic:
+                    text_str = f"<i>{text_str}</i>"
+                if bold:
+                    text_str = f"<b>{text_str}</b>"
+                product_info.append([memo.paragraph(f"<b>{label}</b>", styles["label"]),
+                                     memo.paragraph(text_str, normal_style)])
+
+        maybe_add_product_row("Product Name", record.product_name, bold=True)
+        maybe_add_product_row("Product Code", record.product_code)
+        maybe_add_product_row("Batch No.", record.batch_no)
+        maybe_add_product_row("Date of Manufacturing", record.manufacturing_date)
+        maybe_add_product_row("Date of Reanalysis", record.reanalysis_date)
+        maybe_add_product_row("Botanical Name", record.botanical_name, italic=True)
+        maybe_add_product_row("Extraction Ratio", record.extraction_ratio)
+        maybe_add_product_row("Extraction Solvents", record.solvent)
+        maybe_add_product_row("Plant Parts", record.plant_part)
+        maybe_add_product_row("CAS No.", record.cas_no)
+        maybe_add_product_row("Chemical Name", record.chemical_name)
+        maybe_add_product_row("Quantity", record.quantity)
+        # Add dynamic additional product info rows (if any)
+        for label, value in record.product_rows:
+            maybe_add_product_row(label, value)
+        maybe_add_product_row("Country of Origin", record.origin)
+
+        if product_info:
+            product_table = Table(product_info, colWidths=tpl.product_col_widths)
+            product_table.setStyle(tpl.product_table_style)
+            elements.append(product_table)
+            elements.append(Spacer(1, 0))
+
+        # ----------------------------------------------------------------
+        # SPECIFICATIONS TABLE
+        # ----------------------------------------------------------------
+        spec_data = [[tpl.clone(p) for p in tpl.spec_headers]]
+        heading_rows = []
+        failed_rows, failed_params = [], []
+
+        sections = {
+            section.name: record.printed_rows(section)
+            for section in load_catalogue().sections
+        }
+
+        for section_name, rows in sections.items():
+            if rows:
+                spec_data.append([memo.paragraph(f"<b>{section_name}</b>", styles["section"]), "", "", ""])
+                heading_rows.append(len(spec_data) - 1)
+                for param_tuple in rows:
+                    # Use method_style (center aligned) for column 3, normal_style for others
+                    row_cells = [
+                        memo.paragraph(str(cell), method_style if idx == 3 else normal_style)
+                        for idx, cell in enumerate(param_tuple)
+                    ]
+                    if CHECK_SPECS and check(param_tuple[1], param_tuple[2]) is False:
+                        row_cells[2] = memo.paragraph(str(param_tuple[2]), styles["out_of_spec"])
+                        failed_rows.append(len(spec_data))
+                        failed_params.append(str(param_tuple[0]))
+                    spec_data.append(row_cells)
+
+        # Remarks
+        spec_data.append([tpl.clone(tpl.remarks), "", "", ""])
+        last_remarks_row = len(spec_data) - 1
+        if failed_params:
+            final_remark = memo.paragraph(f"{FAIL_TEXT} ({', '.join(failed_params)})", styles["fail_remark"])
+        else:
+            final_remark = tpl.clone(tpl.final_remark)
+        spec_data.append([final_remark, "", "", ""])
+        final_remark_row = len(spec_data) - 1
+
+        # When the table splits across pages the column header row is repeated,
+        # a section heading never ends a page without its first row, and the two
+        # remark rows stay together.
+        spec_table = Table(spec_data, colWidths=tpl.spec_col_widths, repeatRows=1)
+
+        spec_table_style = list(tpl.spec_table_commands)
+        for heading_row in heading_rows:
+            spec_table_style.append(('SPAN', (0, heading_row), (-1, heading_row)))
+            spec_table_style.append(('NOSPLIT', (0, heading_row), (-1, heading_row + 1)))
+        spec_table_style.append(('SPAN', (0, last_remarks_row), (-1, last_remarks_row)))
+        spec_table_style.append(('SPAN', (0, final_remark_row), (-1, final_remark_row)))
+        spec_table_style.append(('NOSPLIT', (0, last_remarks_row), (-1, final_remark_row)))
+        for failed_row in failed_rows:
+            spec_table_style.append(('BACKGROUND', (0, failed_row), (-1, failed_row), tpl.out_of_spec_background))
+
+        spec_table.setStyle(TableStyle(spec_table_style))
+        elements.append(spec_table)
+        elements.append(Spacer(1, 2))
+
+        # Declaration
+        declaration_table = tpl.declaration_table(record.allergen_statement)
+        declaration = [tpl.clone(tpl.declaration_title), declaration_table, Spacer(1, 3)]
+        if layout == "paged":
+            declaration = [KeepTogether(declaration)]
+        elements.extend(declaration)
+
+    # Compute available dimensions from the page size and margins
+    available_width = A4[0] - doc.leftMargin - doc.rightMargin
+    available_height = A4[1] - doc.topMargin - doc.bottomMargin
+
+    if layout == "fit":
+        # SimpleDocTemplate's frame has 6pt padding on every side.
+        with timer.stage("fit_layout"):
+            elements, _ = fit_to_frame(elements, available_width - 12, available_height - 12)
+    elif layout == "shrink":
+        # Use KeepInFrame with improved fakeWidth:
+        kiframe = KeepInFrame(
+            maxWidth=available_width,
+            maxHeight=available_height,
+            content=elements,
+            mode='shrink',            # or any mode you prefer
+            fakeWidth=available_width   # now dynamically computed instead of a fixed 1900
+        )
+        # The shrink search happens when doc.build wraps the frame.
+        kiframe.wrap = timer.timed("keep_in_frame_wrap", kiframe.wrap)
+        elements = [kiframe]
+    elif layout != "paged":
+        raise ValueError(f"Unknown layout {layout!r} (expected one of {LAYOUTS})")
+    return elements
+
+
+def build_document(doc, elements, letterhead=True, timer=NULL_TIMER):
+    # letterhead=False leaves out the logo/footer images (plain-paper prints, benchmarks).
+    on_page = timer.timed("header_footer", header_footer if letterhead else (lambda canvas, doc: None))
+    with timer.stage("doc_build"):
+        doc.build(elements, onFirstPage=on_page, onLaterPages=on_page)
+
+
+@contextlib.contextmanager
+def atomic_file(path):
+    # A binary file that becomes path only when the block succeeds; a failed
+    # render leaves neither a partial nor an empty file behind.
+    part = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with open(part, "wb") as fh:
+            yield fh
+        os.replace(part, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(part)
+        raise
+
+
+def generate_pdf(record, layout=None, letterhead=True, timer=NULL_TIMER, output=None, optimize=None):
+    # record is a COARecord or a flat data dict. output may be a filename or
+    # a writable binary file; by default the PDF is returned in a new BytesIO.
+    # optimize (default: COA_OPTIMIZE_PDF) post-processes it, see coa_optimize.
+    if isinstance(output, str):
+        with atomic_file(output) as fh:
+            generate_pdf(record, layout, letterhead, timer, fh, optimize)
+        return output
+    optimize = OPTIMIZE_PDF if optimize is None else optimize
+    buffer = io.BytesIO() if output is None or optimize else output
+    doc = new_document(buffer)
+    build_document(doc, coa_flowables(as_record(record), layout or DEFAULT_LAYOUT, doc, timer), letterhead, timer)
+    return finish_pdf(buffer, output, optimize, timer)
+
+
+def finish_pdf(buffer, output, optimize, timer=NULL_TIMER):
+    if optimize:
+        # Post-processing needs the whole file, so the PDF was built in memory.
+        # Imported on first use: PyMuPDF is only loaded when optimizing.
+        from coa_optimize import optimize_pdf
+        pdf_bytes = optimize_pdf(buffer.getvalue(), timer=timer)
+        if output is None:
+            return io.BytesIO(pdf_bytes)
+        output.write(pdf_bytes)
+        return output
+    if output is None:
+        buffer.seek(0)
+    return buffer
+
+
+def generate_merged_pdf(records, layout=None, letterhead=True, timer=NULL_TIMER, output=None, optimize=None):
+    """Render many COAs into one PDF with a single build.
+
+    Each COA starts on a new page and is laid out exactly as on its own. The
+    letterhead form XObject, its images and the fonts are written once for
+    the whole document instead of once per batch.
+    """
+    if isinstance(output, str):
+        with atomic_file(output) as fh:
+            generate_merged_pdf(records, layout, letterhead, timer, fh, optimize)
+        return output
+    optimize = OPTIMIZE_PDF if optimize is None else optimize
+    buffer = io.BytesIO() if output is None or optimize else output
+    doc = new_document(buffer)
+    elements = []
+    for record in records:
+        if elements:
+            elements.append(PageBreak())
+        elements.extend(coa_flowables(as_record(record), layout or DEFAULT_LAYOUT, doc, timer))
+    if not elements:
+        raise ValueError("No records to merge")
+    build_document(doc, elements, letterhead, timer)
+    return finish_pdf(buffer, output, optimize, timer)
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_SPOOL_BYTES = 1024 * 1024
+
+
+def iter_pdf_chunks(record, chunk_size=STREAM_CHUNK_SIZE, **kwargs):
+    """Render a COA and yield it in chunks, e.g. for a chunked HTTP response.
+
+    The PDF is spooled to a temporary file once it exceeds STREAM_SPOOL_BYTES,
+    so long documents are not held as one buffer while they are sent.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_BYTES) as spool:
+        generate_pdf(record, output=spool, **kwargs)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+# Every face the template's styles and <b>/<i> markup can select.
+WARM_UP_FONTS = ("Times-Roman", "Times-Bold", "Times-Italic", "Times-BoldItalic",
+                 "Helvetica", "Helvetica-Bold")
+
+
+def warm_up():
+    """Load what the first render of a process would otherwise pay for.
+
+    Font metrics (and parsed TTF files), the compiled template and the
+    decoded letterhead images are cached per process; rendering an empty COA loads the rest of the
+    layout code. Returns that PDF.
+    """
+    fonts = font_map()
+    for name in WARM_UP_FONTS:
+        pdfmetrics.getFont(fonts.get(name, name))
+    get_template()
+    letterhead_image("tru_herb_logo.png")
+    letterhead_image("footer.png")
+    return generate_pdf(COARecord.from_data({})).getvalue()
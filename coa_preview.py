@@ -0,0 +1,88 @@
+"""
+Cached preview rasterization for rendered COA PDFs.
+
+Rasters are cached per (PDF hash, page, DPI, format, quality) so repeat
+previews of an unchanged PDF never reopen it with PyMuPDF. JPEG/WebP
+output keeps the images pushed through ``st.image`` much smaller than PNG.
+"""
+import hashlib
+import io
+import os
+
+import fitz  # PyMuPDF
+
+from coa_cache import PDFCache
+from coa_config import DEFAULT_DPI, DEFAULT_FORMAT, DEFAULT_QUALITY, FORMATS
+from coa_timing import NULL_TIMER
+
+# Same byte-capped LRU as the PDF cache, keyed on raster parameters instead.
+raster_cache = PDFCache(max_bytes=int(os.environ.get("COA_RASTER_CACHE_BYTES", 32 * 1024 * 1024)))
+_page_counts = {}
+
+
+def pdf_digest(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def _encode(pix, fmt, quality):
+    if fmt == "png":
+        return pix.tobytes("png")
+    if fmt == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=quality)
+    if fmt == "webp":
+        # PyMuPDF has no WebP writer; Pillow ships with Streamlit.
+        from PIL import Image
+        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        out = io.BytesIO()
+        img.save(out, format="WEBP", quality=quality, method=4)
+        return out.getvalue()
+    raise ValueError(f"Unsupported preview format: {fmt!r} (expected one of {FORMATS})")
+
+
+class PreviewRasterizer:
+    def __init__(self, pdf_bytes, fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY, cache=raster_cache,
+                 timer=NULL_TIMER):
+        self.pdf_bytes = pdf_bytes
+        self.digest = pdf_digest(pdf_bytes)
+        self.fmt = fmt
+        self.quality = quality
+        self.cache = cache
+        self.timer = timer
+        self._doc = None
+
+    def _open(self):
+        # Only opened when at least one raster is missing from the cache.
+        if self._doc is None:
+            self._doc = fitz.open(stream=self.pdf_bytes, filetype="pdf")
+        return self._doc
+
+    @property
+    def page_count(self):
+        count = _page_counts.get(self.digest)
+        if count is None:
+            if len(_page_counts) > 1024:
+                _page_counts.clear()
+            count = _page_counts[self.digest] = self._open().page_count
+        return count
+
+    def page(self, page_no, dpi=DEFAULT_DPI):
+        key = (self.digest, page_no, dpi, self.fmt, self.quality)
+        image = self.cache.get(key)
+        if image is None:
+            with self.timer.stage("pixmap"):
+                pix = self._open()[page_no].get_pixmap(dpi=dpi, alpha=False)
+            with self.timer.stage("encode"):
+                image = _encode(pix, self.fmt, self.quality)
+            self.cache.put(key, image)
+        return image
+
+    def close(self):
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,141 @@
+"""
+SQLite product master.
+
+Everything about a product that does not change from batch to batch (names,
+extraction details, and the spec/method of every parameter) is stored once
+per product code. The table is keyed and clustered on product_code, so
+loading a product is a single indexed read.
+
+    python coa_products.py import batches.jsonl   # last record per code wins
+    python coa_products.py list
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from coa_catalogue import load_catalogue
+from coa_record import as_record
+
+DB_PATH = os.environ.get(
+    "COA_PRODUCTS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "coa_products.db"),
+)
+
+# Product-level fields; batch no., dates and quantity belong to the batch.
+PRODUCT_KEYS = ("product_name", "botanical_name", "extraction_ratio", "solvent", "plant_part",
+                "cas_no", "chemical_name", "origin")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    product_code TEXT PRIMARY KEY,
+    product_name TEXT NOT NULL DEFAULT '',
+    record       TEXT NOT NULL,
+    updated_at   REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def product_record(record):
+    """The part of a COA record (or data dict) that is kept in the product master."""
+    data = as_record(record).to_data()
+    catalogue = load_catalogue()
+    record = {key: data.get(key, "") for key in PRODUCT_KEYS}
+    for section in catalogue.sections:
+        for p in section.parameters:
+            for field in ("spec", "method"):
+                record[p.field_key(field)] = data.get(p.field_key(field), "")
+            if section.editable_param:
+                record[f"{p.key}_param"] = data.get(f"{p.key}_param", "")
+        # Results are per batch; keep the row with an empty result.
+        record[section.extra_key] = [
+            (row[0], row[1], "", row[3]) for row in data.get(section.extra_key, []) if row
+        ]
+    record["product_additional_rows"] = [tuple(row) for row in data.get("product_additional_rows", [])]
+    return record
+
+
+class ProductMaster:
+    # One connection shared by all sessions; sqlite3 objects are not
+    # thread-safe, so every use goes through the lock.
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def get(self, product_code):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM products WHERE product_code = ?", (product_code,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def codes(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT product_code, product_name FROM products ORDER BY product_code"
+            ).fetchall()
+
+    def upsert(self, product_code, record):
+        if not product_code:
+            raise ValueError("A product code is required")
+        record = product_record(record)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO products (product_code, product_name, record, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(product_code) DO UPDATE SET product_name = excluded.product_name, "
+                "record = excluded.record, updated_at = excluded.updated_at",
+                (product_code, record["product_name"], json.dumps(record), time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ----------------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the COA product master.")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("import", help="add/update products from CSV or JSONL batch records")
+    load.add_argument("input")
+    commands.add_parser("list", help="list product codes")
+    args = parser.parse_args(argv)
+
+    master = ProductMaster(args.db)
+    if args.command == "import":
+        from coa_batch import read_records
+        try:
+            # Read the whole file first: a bad line imports nothing.
+            records = list(read_records(args.input))
+        except (OSError, ValueError) as exc:
+            master.close()
+            parser.error(f"could not read {args.input}: {exc}")
+        count = 0
+        for index, record in enumerate(records):
+            if record.get("product_code"):
+                try:
+                    master.upsert(record["product_code"], record)
+                except ValueError as exc:
+                    print(f"  record {index + 1} ({record['product_code']}): {exc}", file=sys.stderr)
+                    continue
+                count += 1
+        print(f"{count} records imported into {args.db}")
+    else:
+        for code, name in master.codes():
+            print(f"{code}\t{name}")
+    master.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
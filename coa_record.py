@@ -0,0 +1,191 @@
+"""
+Typed COA record.
+
+A COARecord is one certificate: the header fields, the extra product-info
+rows, and for every catalogue section its rows as ``Row`` tuples. It is
+built in one place, ``COARecord.from_data``, from the flat ``data`` dict
+that the form, CSV/JSONL batch files and the product master use, and is
+what generate_pdf, the PDF cache, the render queue and the archive work
+with. Records are immutable; ``digest()`` is a stable content hash.
+
+Records serialize to compact msgpack when the ``msgpack`` package is
+installed and to compact JSON otherwise; ``loads`` reads both.
+"""
+import hashlib
+import json
+from types import MappingProxyType
+from typing import NamedTuple
+
+from coa_catalogue import load_catalogue, FIELDS
+
+try:
+    import msgpack
+except ImportError:  # optional: JSON is used instead
+    msgpack = None
+
+HEADER_KEYS = ("product_name", "product_code", "batch_no", "manufacturing_date", "reanalysis_date",
+               "botanical_name", "extraction_ratio", "solvent", "plant_part", "cas_no", "chemical_name",
+               "quantity", "origin", "allergen_statement")
+HEADER_DEFAULTS = {"allergen_statement": "Free from allergen"}
+EXTRA_COLUMNS = ("param",) + FIELDS
+PRODUCT_ROW_COLUMNS = ("label", "value")
+FORMAT_VERSION = 1
+
+
+class Row(NamedTuple):
+    key: str     # catalogue parameter key; "" for rows added in the form
+    param: str   # parameter name; for base rows only the edited name, "" means the catalogue label
+    spec: str
+    result: str
+    method: str
+
+
+def _text(value):
+    return "" if value is None else str(value)
+
+
+def _cells(row, columns):
+    # Rows arrive as tuples/lists (data dicts, JSON) or as dicts (form state).
+    values = [row.get(c, "") for c in columns] if isinstance(row, dict) else row
+    if len(values) != len(columns):
+        raise ValueError(f"Expected {len(columns)} values ({', '.join(columns)}) in row {row!r}")
+    return tuple(v if type(v) is str else _text(v) for v in values)
+
+
+class COARecord:
+    __slots__ = HEADER_KEYS + ("product_rows", "sections", "_digest")
+
+    def __init__(self, header, product_rows=(), sections=None):
+        # header: {key: str} for HEADER_KEYS; sections: {section id: tuple of Row}.
+        for key in HEADER_KEYS:
+            object.__setattr__(self, key, _text(header.get(key, HEADER_DEFAULTS.get(key, ""))))
+        object.__setattr__(self, "product_rows", tuple(tuple(row) for row in product_rows))
+        # Read-only, as the cached digest would no longer match an edited record.
+        object.__setattr__(self, "sections", MappingProxyType({
+            section_id: tuple(row if type(row) is Row else Row(*row) for row in rows)
+            for section_id, rows in (sections or {}).items()
+        }))
+        object.__setattr__(self, "_digest", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("COARecord is immutable; use replace()")
+
+    def __reduce__(self):
+        # Worker processes get the compact serialized form.
+        return loads, (self.dumps(),)
+
+    def __eq__(self, other):
+        return isinstance(other, COARecord) and self.digest() == other.digest()
+
+    def __hash__(self):
+        return hash(self.digest())
+
+    def __repr__(self):
+        return f"COARecord(product_code={self.product_code!r}, batch_no={self.batch_no!r})"
+
+    @classmethod
+    def from_data(cls, data, catalogue=None):
+        """Build a record from a flat data dict (any mapping with .get).
+
+        Missing or None values are empty; extra rows may be tuples or dicts.
+        """
+        catalogue = catalogue or load_catalogue()
+        sections = {}
+        for section in catalogue.sections:
+            rows = [
+                Row(p.key, _text(data.get(f"{p.key}_param")) if section.editable_param else "",
+                    *(_text(data.get(p.field_key(field))) for field in FIELDS))
+                for p in section.parameters
+            ]
+            rows.extend(Row("", *_cells(row, EXTRA_COLUMNS)) for row in data.get(section.extra_key) or () if row)
+            sections[section.id] = rows
+        product_rows = [_cells(row, PRODUCT_ROW_COLUMNS) for row in data.get("product_additional_rows") or () if row]
+        header = {key: data.get(key, HEADER_DEFAULTS.get(key, "")) for key in HEADER_KEYS}
+        return cls(header, product_rows, sections)
+
+    def replace(self, **changes):
+        header = {key: changes.pop(key, getattr(self, key)) for key in HEADER_KEYS}
+        product_rows = changes.pop("product_rows", self.product_rows)
+        sections = changes.pop("sections", self.sections)
+        if changes:
+            raise TypeError(f"Unknown COARecord fields: {', '.join(changes)}")
+        return COARecord(header, product_rows, sections)
+
+    def printed_rows(self, section):
+        """(param, spec, result, method) rows of a catalogue section as printed on the COA."""
+        # Base parameters are only printed when spec, result and method are
+        # all filled in; rows added in the form are printed as they are.
+        labels = {p.key: p.label for p in section.parameters}
+        rows = []
+        for row in self.sections.get(section.id, ()):
+            if not row.key:
+                rows.append(row[1:])
+            elif row.spec and row.result and row.method:
+                rows.append((row.param or labels.get(row.key, row.key),) + row[2:])
+        return rows
+
+    def to_data(self):
+        """The flat data dict this record was built from (with empty values filled in)."""
+        data = {key: getattr(self, key) for key in HEADER_KEYS}
+        for section_id, rows in self.sections.items():
+            extra = []
+            for row in rows:
+                if row.key:
+                    data.update(zip((f"{row.key}_{field}" for field in FIELDS), row[2:]))
+                    if row.param:
+                        data[f"{row.key}_param"] = row.param
+                else:
+                    extra.append(row[1:])
+            data[f"{section_id}_extra_rows"] = extra
+        data["product_additional_rows"] = list(self.product_rows)
+        return data
+
+    # ------------------------------------------------------------------
+    # Serialization
+    # ------------------------------------------------------------------
+    def to_obj(self):
+        return {
+            "v": FORMAT_VERSION,
+            "header": {key: getattr(self, key) for key in HEADER_KEYS},
+            "product_rows": [list(row) for row in self.product_rows],
+            "sections": {section_id: [list(row) for row in rows] for section_id, rows in self.sections.items()},
+        }
+
+    @classmethod
+    def from_obj(cls, obj):
+        if "v" not in obj:
+            # Stored before records existed: a flat data dict.
+            return cls.from_data(obj)
+        return cls(obj["header"], obj["product_rows"], obj["sections"])
+
+    def to_json(self):
+        return json.dumps(self.to_obj(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps(self):
+        if msgpack is None:
+            return self.to_json()
+        return msgpack.packb(self.to_obj(), use_bin_type=True)
+
+    def digest(self):
+        # Always over the JSON form, so the hash does not depend on msgpack being installed.
+        if self._digest is None:
+            object.__setattr__(self, "_digest", hashlib.sha256(self.to_json()).hexdigest())
+        return self._digest
+
+
+def loads(payload):
+    """Read a record written by COARecord.dumps or COARecord.to_json."""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    if payload[:1] in (b"{", b"["):
+        obj = json.loads(payload)
+    elif msgpack is not None:
+        obj = msgpack.unpackb(payload, raw=False)
+    else:
+        raise ValueError("Record is msgpack-encoded but msgpack is not installed")
+    return COARecord.from_obj(obj)
+
+
+def as_record(data):
+    """data as a COARecord; flat data dicts are converted."""
+    return data if isinstance(data, COARecord) else COARecord.from_data(data)
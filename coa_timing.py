@@ -0,0 +1,84 @@
+"""
+Per-stage render timing.
+
+A StageTimer follows one render through building the data dict, creating
+the flowables, fitting, doc.build, header_footer and preview rasterization.
+Stages may nest; each stage is charged only its own (exclusive) time, so the
+stage times add up to the total. Code that is not being timed gets
+NULL_TIMER, which does nothing.
+"""
+import contextlib
+import json
+import logging
+import time
+
+logger = logging.getLogger("coa.timing")
+
+
+class StageTimer:
+    __slots__ = ("stages", "meta", "started", "_stack")
+
+    def __init__(self, **meta):
+        self.stages = {}
+        self.meta = meta
+        self.started = time.perf_counter()
+        self._stack = []
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def start(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def stop(self):
+        name, t0, nested = self._stack.pop()
+        elapsed = time.perf_counter() - t0
+        self.add(name, elapsed - nested)
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def timed(self, name, fn):
+        def wrapper(*args, **kwargs):
+            self.start(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.stop()
+        return wrapper
+
+    def record(self):
+        stages_ms = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        return {**self.meta, "total_ms": round(sum(stages_ms.values()), 2), "stages_ms": stages_ms}
+
+    def log(self, event="render"):
+        logger.info(json.dumps({"event": event, **self.record()}, default=str))
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def add(self, name, seconds):
+        pass
+
+    def start(self, name):
+        pass
+
+    def stop(self):
+        pass
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def timed(self, name, fn):
+        return fn
+
+
+NULL_TIMER = _NullTimer()
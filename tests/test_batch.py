@@ -0,0 +1,41 @@
+import io
+import json
+
+import fitz
+
+from coa_batch import export_merged, export_zip, iter_records
+
+GOOD = {"product_name": "Turmeric Extract", "batch_no": "B0"}
+BAD_ROW = {"product_name": "Turmeric Extract", "batch_no": "BAD", "others_extra_rows": [["Ash", "NMT 5%"]]}
+
+
+def batch_file():
+    lines = [json.dumps({**GOOD, "batch_no": f"B{i}"}) for i in range(3)]
+    lines.insert(1, json.dumps(BAD_ROW))
+    lines.insert(3, "{not json")
+    return list(iter_records(io.BytesIO("\n".join(lines).encode()), "b.jsonl", errors="report"))
+
+
+def test_merged_export_leaves_out_bad_records(tmp_path):
+    target = str(tmp_path / "m.pdf")
+    results = export_merged(batch_file(), target)
+    assert [r["ok"] for r in results] == [True, False, True, False, True]
+    assert results[1]["error"].startswith("ValueError")
+    assert results[3]["error"].startswith("line 4")
+    with fitz.open(target) as doc:
+        text = "".join(page.get_text() for page in doc)
+    assert "B0" in text and "B2" in text and "BAD" not in text
+
+
+def test_merged_export_matches_zip_export(tmp_path):
+    records = batch_file()
+    merged = export_merged(records, str(tmp_path / "m.pdf"))
+    zipped = export_zip(records, str(tmp_path / "m.zip"))
+    assert [r["ok"] for r in merged] == [r["ok"] for r in zipped]
+
+
+def test_merged_export_with_no_good_records_writes_nothing(tmp_path):
+    target = tmp_path / "m.pdf"
+    results = export_merged([BAD_ROW], str(target))
+    assert not results[0]["ok"]
+    assert not target.exists()
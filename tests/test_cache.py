@@ -0,0 +1,40 @@
+import functools
+import json
+import os
+
+import coa_cache
+import coa_pdf
+from coa_cache import PDFCache, render_pdf
+from coa_catalogue import CATALOGUE_PATH, load_catalogue
+
+RECORD = {"product_name": "Turmeric Extract", "batch_no": "B1",
+          "lead_spec": "NMT 1 ppm", "lead_result": "0.1 ppm", "lead_method": "ICP-MS"}
+
+
+def test_identical_records_hit_the_cache():
+    cache = PDFCache()
+    first = render_pdf(RECORD, cache=cache)
+    assert render_pdf(dict(RECORD), cache=cache) is first
+    assert cache.stats()["hits"] == 1
+
+
+def test_catalogue_edit_is_not_served_from_the_cache(tmp_path, monkeypatch):
+    path = tmp_path / "catalogue.json"
+    with open(CATALOGUE_PATH, encoding="utf-8") as fh:
+        raw = json.load(fh)
+    path.write_text(json.dumps(raw), encoding="utf-8")
+    catalogue = functools.partial(load_catalogue, str(path))
+    monkeypatch.setattr(coa_cache, "load_catalogue", catalogue)
+    monkeypatch.setattr(coa_pdf, "load_catalogue", catalogue)
+
+    cache = PDFCache()
+    before = render_pdf(RECORD, cache=cache)
+    for section in raw["sections"]:
+        for parameter in section["parameters"]:
+            if parameter["key"] == "lead":
+                parameter["label"] = "Lead (Pb)"
+    path.write_text(json.dumps(raw), encoding="utf-8")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))  # coarse file system clocks
+    after = render_pdf(RECORD, cache=cache)
+    assert after != before
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,140 @@
+import pytest
+
+from coa_compliance import check, compile_spec, parse_result, evaluate, review_archive
+from coa_record import COARecord
+
+# (spec, result, expected): True in spec, False out of spec, None not evaluated.
+CASES = [
+    # Upper limits, inclusive and strict.
+    ("Not more than 10 ppm", "9.9 ppm", True),
+    ("Not more than 10 ppm", "10 ppm", True),
+    ("Not more than 10 ppm", "10.01 ppm", False),
+    ("NMT 10 ppm", "10 ppm", True),
+    ("NMT 100 cfu/g", "100 cfu/g", True),
+    ("NMT 100 cfu/g", "150 cfu/g", False),
+    ("NMT 1000 cfu/g", "1,500 cfu/g", False),
+    ("NMT 10,000 cfu/g", "9,999 cfu/g", True),
+    ("Max 5%", "5.0%", True),
+    ("Max 5%", "5.1 %", False),
+    ("Less than 2", "1.99", True),
+    ("Less than 2", "2", False),
+    ("Less than 2", "< 2", True),
+    ("Not more than 1 ppm", "< 0.01 ppm", True),
+    ("Not more than 1 ppm", "< 2 ppm", None),
+    ("Not more than 1 ppm", "> 1 ppm", False),
+    # Lower limits.
+    ("Not less than 98%", "98%", True),
+    ("Not less than 98%", "97.9%", False),
+    ("NLT 2.5%", "2.6%", True),
+    ("Min 10", "10", True),
+    ("Min 10", "9", False),
+    ("More than 5", "5", False),
+    ("More than 5", "> 5", True),
+    ("NLT 5", "< 5", False),
+    # Ranges.
+    ("Between 0.3g/ml to 0.6g/ml", "0.3 g/ml", True),
+    ("Between 0.3g/ml to 0.6g/ml", "0.6 g/ml", True),
+    ("Between 0.3g/ml to 0.6g/ml", "0.45", True),
+    ("Between 0.3g/ml to 0.6g/ml", "0.61 g/ml", False),
+    ("Between 0.3 to 0.6 g/ml", "0.2g/ml", False),
+    ("5.0 - 7.0", "6.2", True),
+    ("5.0 - 7.0", "7.5", False),
+    # Units: mass fractions are compared across units, other kinds are not.
+    ("NMT 0.1 %", "1000 ppm", True),
+    ("Not more than 1000 ppm", "0.1 %", True),
+    ("Not more than 1000 ppm", "0.11 %", False),
+    ("NMT 0.3 ppm", "250 ppb", True),
+    ("Not more than 1 ppm", "1200 ppb", False),
+    ("Not more than 1 ppm", "1 mg/kg", True),
+    ("Not more than 10 ppm", "5 cfu/g", None),
+    # Absent.
+    ("Absent/25g", "Absent", True),
+    ("Absent/25g", "Present", False),
+    ("Absent/10g", "Detected", False),
+    ("Absent in 10 g", "ND", True),
+    ("Absent/25g", "0 cfu/g", True),
+    ("Absent/25g", "10 cfu/g", False),
+    ("Absent/25g", "< 10 cfu/g", None),
+    ("Absent/25g", "Complies", True),
+    # Qualitative.
+    ("To comply by TLC", "Complies", True),
+    ("To comply by TLC", "Compiles", True),
+    ("To comply by TLC", "Does not comply", False),
+    ("Complies", "Complies", True),
+    ("Meet USP<561>", "Complies", True),
+    ("Meet USP<561>", "0.5 ppm", None),
+    # Results without a number.
+    ("Not more than 1 ppm", "Complies", True),
+    ("Not more than 1 ppm", "Does not comply", False),
+    ("Not more than 1 ppm", "ND", True),
+    ("Not more than 1 ppm", "Present", None),
+    ("Not more than 1 ppm", "X ppm", None),
+    ("Not more than 1 ppm", "", None),
+    # Template placeholders and free text.
+    ("Not more than X ppm", "0.23 ppm", None),
+    ("Not more than X ppm", "5 ppm", None),
+    ("NMT X cfu/g", "Complies", None),
+    ("NMT X", "Complies", None),
+    ("X with Characteristic taste and odour", "Compiles", None),
+    ("", "1 ppm", None),
+]
+
+
+@pytest.mark.parametrize("spec, result, expected", CASES)
+def test_check(spec, result, expected):
+    assert check(spec, result) is expected
+
+
+def test_placeholders_do_not_compile():
+    assert compile_spec("Not more than X ppm") is None
+    assert compile_spec("Between 0.6 to 0.3") is None
+
+
+def test_results_are_parsed_in_their_unit():
+    lead = parse_result("250 ppb")
+    assert (lead.family, lead.low * lead.factor) == ("ppm", pytest.approx(0.25))
+    assert parse_result("Absent").kind == "absent"
+    assert parse_result("Present").kind == "present"
+    assert parse_result("Complies").kind == "pass"
+    assert parse_result("X cfu/g") is None
+
+
+def test_evaluate_lists_failed_printed_rows():
+    record = COARecord.from_data({
+        "lead_spec": "Not more than 1 ppm", "lead_result": "1.4 ppm", "lead_method": "ICP-MS",
+        "cadmium_spec": "NMT 0.3 ppm", "cadmium_result": "250 ppb", "cadmium_method": "ICP-MS",
+        "salmonella_spec": "Absent/25g", "salmonella_result": "Present", "salmonella_method": "USP<62>",
+        # Not printed: no method.
+        "arsenic_spec": "NMT 1 ppm", "arsenic_result": "5 ppm",
+    })
+    compliance = evaluate(record)
+    assert [row[1] for row in compliance.failed] == ["Lead", "Salmonella"]
+    assert compliance.failed[0][2:] == ("Not more than 1 ppm", "1.4 ppm")
+
+
+def test_review_archive(tmp_path):
+    from coa_archive import COAArchive
+
+    archive = COAArchive(str(tmp_path / "archive.db"))
+    for batch, lead in (("B1", "0.5 ppm"), ("B2", "1.5 ppm"), ("B3", "1200 ppb")):
+        archive.add({"product_code": "P1", "batch_no": batch, "lead_spec": "Not more than 1 ppm",
+                     "lead_result": lead, "lead_method": "ICP-MS"}, b"%PDF")
+    archive.add({"product_code": "P2", "batch_no": "B4", "lead_spec": "Not more than 1 ppm",
+                 "lead_result": "2 ppm", "lead_method": "ICP-MS"}, b"%PDF")
+    review = review_archive(archive, product_code="P1")
+    assert [(row[2], row[6]) for row in review.failures] == [("B2", "1.5 ppm"), ("B3", "1200 ppb")]
+    assert review.checked == 3
+    assert len(review_archive(archive).failures) == 3
+    archive.close()
+
+
+def test_pdf_remark_names_failed_parameters():
+    fitz = pytest.importorskip("fitz")
+    from coa_pdf import generate_pdf
+
+    data = {"lead_spec": "Not more than 1 ppm", "lead_result": "1.4 ppm", "lead_method": "ICP-MS"}
+    text = fitz.open(stream=generate_pdf(data).getvalue()).get_page_text(0)
+    assert "DOES NOT COMPLY WITH IN HOUSE SPECIFICATIONS (Lead)" in text
+    data["lead_result"] = "0.4 ppm"
+    text = fitz.open(stream=generate_pdf(data).getvalue()).get_page_text(0)
+    assert "REMARKS: COMPLIES WITH IN HOUSE SPECIFICATIONS" in text
@@ -0,0 +1,95 @@
+import io
+
+import pytest
+
+from coa_import import main, read_results, apply_results, records_from_results
+from coa_record import COARecord
+
+
+def results(text, **kwargs):
+    return read_results(io.StringIO(text), **kwargs)
+
+
+def by_key(imported):
+    return {(row.batch_no, row.key or row.param): row.result for row in imported.rows.itertuples()}
+
+
+LONG = """Sample ID,Analyte,Result,Units,Method
+B1,208Pb,250,ppb,ICP-MS
+B1,Cd [He],< 0.5,ppb,ICP-MS
+B1,TAMC,"1,500",cfu/g,USP<61>
+B1,Salmonella,Absent,,USP<62>
+B1,Zn,3.2,ppm,ICP-MS
+B1,Unobtainium,1,ppm,
+B2,Lead,0.1,mg/kg,ICP-MS
+"""
+
+
+def test_long_file_maps_and_converts():
+    imported = results(LONG)
+    found = by_key(imported)
+    assert found[("B1", "lead")] == "0.25 ppm"
+    assert found[("B1", "cadmium")] == "< 0.0005 ppm"
+    assert found[("B1", "salmonella")] == "Absent"
+    assert found[("B1", "Zinc")] == "3.2 ppm"
+    assert found[("B2", "lead")] == "0.1 ppm"
+    assert imported.unmapped == {"Unobtainium": 1}
+
+
+def test_thousands_separator_is_one_number():
+    assert by_key(results(LONG))[("B1", "total_plate_count")] == "1500 cfu/g"
+    inline = results('Batch,Analyte,Result\nB1,TYMC,"12,000 cfu/g"\n')
+    assert by_key(inline)[("B1", "yeasts_mould")] == "12000 cfu/g"
+
+
+@pytest.mark.parametrize("value", ["inf", "1e400", "12 (est.)", "Not tested"])
+def test_values_that_are_not_plain_results_are_kept_as_reported(value):
+    imported = results(f"Batch,Analyte,Result,Units\nB1,Lead,{value},ppb\n")
+    assert by_key(imported)[("B1", "lead")] == value
+
+
+def test_unknown_analyte_with_section():
+    imported = results(LONG, section="others")
+    assert by_key(imported)[("B1", "Unobtainium")] == "1 ppm"
+    assert imported.unmapped == {}
+
+
+def test_wide_file_with_unit():
+    wide = "Sample Name,Pb [He],Cd [He],Ethanol\nB1,120,,40\nB2,2500,8,\n"
+    imported = results(wide, unit="ppb")
+    found = by_key(imported)
+    assert found[("B1", "lead")] == "0.12 ppm"
+    assert found[("B2", "lead")] == "2.5 ppm"
+    assert found[("B2", "cadmium")] == "0.008 ppm"
+    assert found[("B1", "Ethanol")] == "0.04 ppm"
+    assert imported.skipped == 2
+
+
+def test_apply_results_fills_batches_and_keeps_specs():
+    records = [
+        {"batch_no": " b1", "lead_spec": "Not more than 1 ppm",
+         "others_extra_rows": [["Zinc", "NMT 10 ppm", "", "ICP-OES"]]},
+        COARecord.from_data({"batch_no": "B9"}),
+    ]
+    filled, missing = apply_results(records, results(LONG))
+    assert missing == ["B2"]
+    first, second = filled
+    assert first["lead_result"] == "0.25 ppm" and first["lead_method"] == "ICP-MS"
+    assert first["lead_spec"] == "Not more than 1 ppm"
+    assert [list(row) for row in first["others_extra_rows"]] == [["Zinc", "NMT 10 ppm", "3.2 ppm", "ICP-MS"]]
+    assert isinstance(second, COARecord) and second.batch_no == "B9"
+
+
+def test_records_from_results_one_per_batch():
+    records = records_from_results(results(LONG))
+    assert [record["batch_no"] for record in records] == ["B1", "B2"]
+    assert records[1]["lead_result"] == "0.1 ppm"
+
+
+def test_cli_reports_unreadable_records(tmp_path, capsys):
+    (tmp_path / "icp.csv").write_text(LONG, encoding="utf-8")
+    (tmp_path / "b.jsonl").write_text('{"batch_no": "B1"}\n{not json\n', encoding="utf-8")
+    with pytest.raises(SystemExit) as exit_info:
+        main([str(tmp_path / "icp.csv"), "--records", str(tmp_path / "b.jsonl"), "--out", str(tmp_path / "f.jsonl")])
+    assert exit_info.value.code == 2
+    assert "line 2:" in capsys.readouterr().err
@@ -0,0 +1,24 @@
+import pytest
+
+from coa_record import COARecord, loads
+
+DATA = {"product_name": "Turmeric Extract", "batch_no": "B1", "lead_spec": "NMT 1 ppm",
+        "others_extra_rows": [("Ash", "NMT 5%", "2.1%", "USP")]}
+
+
+def test_record_cannot_be_edited():
+    record = COARecord.from_data(DATA)
+    digest = record.digest()
+    with pytest.raises(AttributeError):
+        record.batch_no = "B2"
+    with pytest.raises(TypeError):
+        record.sections["others"] = ()
+    assert record.digest() == digest
+
+
+def test_replace_and_round_trip():
+    record = COARecord.from_data(DATA)
+    assert record.replace(sections=record.sections) == record
+    assert record.replace(batch_no="B2").digest() != record.digest()
+    assert loads(record.dumps()) == record
+    assert COARecord.from_data(record.to_data()) == record
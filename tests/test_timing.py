@@ -0,0 +1,20 @@
+import pytest
+
+from coa_pdf import generate_pdf
+from coa_timing import StageTimer
+
+
+def test_stages_are_closed_when_a_render_fails():
+    timer = StageTimer()
+    with pytest.raises(ValueError):
+        # Unbalanced markup fails while the flowables are built.
+        generate_pdf({"product_name": "<b>Turmeric", "batch_no": "B1"}, timer=timer)
+    with timer.stage("next"):
+        pass
+    assert set(timer.stages) == {"flowables", "next"}
+
+
+def test_stages_of_a_render():
+    timer = StageTimer()
+    generate_pdf({"product_name": "Turmeric", "batch_no": "B1"}, timer=timer)
+    assert {"flowables", "doc_build"} <= set(timer.stages)